@@ -8,13 +8,15 @@ task_name/
   judge/           # judge.py + reference labels and any assets
   data/            # optional assets for contestants to download
   test_submit/     # sample submission files or example code
-  problem.yml      # metadata (without detailedDescription)
+  problem.yml      # metadata (without detailedDescription), optional `resources` section
   desc.md          # detailedDescription (Markdown)
 
 This script will:
   1) Zip the contents of judge/, data/ (if exists and non-empty), and test_submit/
      into judge.zip, data.zip, test_submit.zip respectively. The ZIPs contain
-     only the files, not a nested top-level folder.
+     only the files, not a nested top-level folder. If problem.yml has a
+     `resources` section, it is validated and written into judge.zip as
+     resources.json, which the evaluation service applies as the problem's limits.
   2) Write those ZIP archives to the task directory (task_name/).
   3) Create a final package ZIP named <task_name>.zip in the task directory
      that includes: judge.zip, (optional) data.zip, test_submit.zip, problem.yml, desc.md.
@@ -34,17 +36,87 @@ Notes:
 from __future__ import annotations
 
 import argparse
+import json
 import os
 from pathlib import Path
 import sys
 import zipfile
 
 
-def zip_dir_contents(src_dir: Path, out_zip: Path) -> None:
+# Keys allowed in the `resources` section of problem.yml (see problem_template.yml)
+RESOURCE_KEYS = ("cpuTimeSeconds", "wallTimeSeconds", "memoryMB", "threads", "diskMB", "image")
+# Keys whose value is a string (the Docker image to evaluate in); all others are positive numbers
+RESOURCE_STRING_KEYS = ("image",)
+# File name of the resource profile inside judge.zip, read by evaluateapp
+RESOURCES_FILENAME = "resources.json"
+
+
+def _parse_resources_block(text: str) -> dict | None:
+    """Minimal parser for the flat `resources:` mapping, used when PyYAML is not installed."""
+    resources = None
+    for line in text.splitlines():
+        stripped = line.split("#", 1)[0].rstrip()
+        if not stripped:
+            continue
+        if not line[0].isspace():
+            if resources is not None:
+                break
+            if stripped == "resources:":
+                resources = {}
+            continue
+        if resources is not None:
+            key, sep, value = stripped.strip().partition(":")
+            if not sep:
+                raise ValueError(f"Invalid line in `resources`: {line.strip()!r}")
+            value = value.strip()
+            try:
+                resources[key.strip()] = int(value)
+            except ValueError:
+                try:
+                    resources[key.strip()] = float(value)
+                except ValueError:
+                    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                        value = value[1:-1]
+                    resources[key.strip()] = value
+    return resources
+
+
+def load_resources(problem_yml: Path) -> dict | None:
+    """Return the validated `resources` section of problem.yml, or None if absent."""
+    text = problem_yml.read_text(encoding="utf-8")
+    if "resources" not in text:
+        return None
+    try:
+        import yaml
+    except ImportError:
+        resources = _parse_resources_block(text)
+    else:
+        resources = (yaml.safe_load(text) or {}).get("resources")
+    if resources is None:
+        return None
+    if not isinstance(resources, dict):
+        raise ValueError(f"`resources` in {problem_yml} must be a mapping")
+    unknown = sorted(set(resources) - set(RESOURCE_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown resource keys in {problem_yml}: {', '.join(unknown)} (allowed: {', '.join(RESOURCE_KEYS)})")
+    for key, value in resources.items():
+        if key in RESOURCE_STRING_KEYS:
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"Resource `{key}` in {problem_yml} must be a non-empty string, got {value!r}")
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            raise ValueError(f"Resource `{key}` in {problem_yml} must be a positive number, got {value!r}")
+    return resources
+
+
+def zip_dir_contents(src_dir: Path, out_zip: Path, extra_files: dict[str, bytes] | None = None) -> None:
     """Zip the contents of src_dir into out_zip without nesting the folder itself.
 
     Skips files ending with .zip to avoid nesting prebuilt archives.
+    extra_files (arcname -> content) are added at the archive root and take
+    precedence over files with the same name in src_dir.
     """
+    extra_files = extra_files or {}
     if not src_dir.exists() or not src_dir.is_dir():
         raise FileNotFoundError(f"Directory not found: {src_dir}")
 
@@ -61,7 +133,11 @@ def zip_dir_contents(src_dir: Path, out_zip: Path) -> None:
                 abs_path = root_path / name
                 # arcname relative to src_dir root
                 arcname = abs_path.relative_to(src_dir)
+                if arcname.as_posix() in extra_files:
+                    continue
                 zf.write(abs_path, arcname)
+        for arcname, content in extra_files.items():
+            zf.writestr(arcname, content)
 
 
 def is_dir_non_empty(p: Path) -> bool:
@@ -97,7 +173,13 @@ def pack_task(task_dir: Path) -> Path:
     test_submit_zip = task_dir / "test_submit.zip"
     data_zip = task_dir / "data.zip"
 
-    zip_dir_contents(judge_dir, judge_zip)
+    judge_extra = {}
+    resources = load_resources(problem_yml)
+    if resources:
+        if (judge_dir / RESOURCES_FILENAME).exists():
+            print(f"Warning: {judge_dir / RESOURCES_FILENAME} is replaced by `resources` from problem.yml", file=sys.stderr)
+        judge_extra[RESOURCES_FILENAME] = json.dumps(resources, indent=2).encode("utf-8")
+    zip_dir_contents(judge_dir, judge_zip, judge_extra)
     zip_dir_contents(test_submit_dir, test_submit_zip)
     data_included = False
     if is_dir_non_empty(data_dir):
@@ -308,6 +308,14 @@ def package_task(task_root: Path, out_dir: Path) -> Tuple[Path, Path]:
     judge_zip = out_dir / "judge.zip"
     zip_dir_contents(sub_dir, sub_zip)
     zip_dir_contents(judge_dir, judge_zip)
+    # 与 pack.py 一致：problem.yml 中的 resources 写入评测包的 resources.json
+    problem_yml = task_root / "problem.yml"
+    if problem_yml.exists():
+        from pack import RESOURCES_FILENAME, load_resources
+        resources = load_resources(problem_yml)
+        if resources:
+            with zipfile.ZipFile(judge_zip, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr(RESOURCES_FILENAME, json.dumps(resources, indent=2))
     return sub_zip, judge_zip
 
 
@@ -1,37 +1,58 @@
 import asyncio
 import logging
-from fastapi import APIRouter, UploadFile, File, Request, HTTPException, Form, BackgroundTasks
+import time
+from typing import Awaitable, Callable
+from fastapi import APIRouter, UploadFile, File, Request, HTTPException, Form
 import hashlib
 import hmac
-from concurrent.futures import ProcessPoolExecutor
 
 # 调整相对导入路径
 from core.config import settings
 
-# 根据配置选择评测后端（CHROOT 或 DOCKER）
+# 根据配置选择评测后端（CHROOT、DOCKER 或 NAMESPACE）
 if (settings.SANDBOX_BACKEND or "").strip().upper() == "DOCKER":
     from services import docker_sandbox as sandbox
+elif (settings.SANDBOX_BACKEND or "").strip().upper() == "NAMESPACE":
+    from services import namespace_sandbox as sandbox
 else:
     from services import sandbox
 from schemas.evaluation import EvaluationResponse
+from services.ingest import SpooledUpload, spool_upload, cleanup_spooled, UploadTooLargeError
+from services.judge_cache import JudgeCache, JudgeLease, UnknownJudgeHashError
+from services.evaluation_queue import EvaluationJob, EvaluationQueue, QueueFullError
+from services.blocking import StageTimer, blocking_pool
+from services.metrics import observe_evaluation, observe_upload
+from services.resource_profile import PROFILE_FILENAME, ResourceProfileError, load_profile
+from services.result_cache import result_cache, result_cache_key
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 缓存命中时在后台发送的回调任务（保持引用，避免任务被提前回收）
+_background_tasks: set[asyncio.Task] = set()
 
-@router.post("/evaluate")
-async def run_evaluation(
-    background_tasks: BackgroundTasks,
-    request: Request,
-    submission_id: str = Form(..., description="提交ID，用于回调"),
-    submission_zip: UploadFile = File(..., description="用户的提交ZIP文件"),
-    judge_zip: UploadFile = File(..., description="题目的评测脚本ZIP包"),
-    callback_url: str | None = Form(None, description="回调URL，可覆盖默认配置")
-):
-    """
-    接收提交文件和评测脚本文件，执行评测，并通过回调返回结果。
-    """
-    # 签名校验：X-Timestamp + X-Sign
+
+def _unknown_judge_hash_detail(judge_hash: str) -> dict:
+    return {
+        "code": "JUDGE_HASH_UNKNOWN",
+        "message": "unknown judge hash, please upload judge_zip",
+        "judge_hash": judge_hash,
+    }
+
+
+def _invalid_profile(e: ResourceProfileError) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"评测包中的 {PROFILE_FILENAME} 无效: {e}")
+
+
+def _discard(submission_upload: SpooledUpload | None, judge_upload: SpooledUpload | None, judge_lease: JudgeLease | None) -> None:
+    """请求未能进入后台评测时，释放已落盘的文件与缓存引用。"""
+    cleanup_spooled(submission_upload, judge_upload)
+    if judge_lease is not None:
+        judge_lease.release()
+
+
+def _verify_signature_headers(request: Request) -> tuple[str, str]:
+    """校验签名头是否存在且未过期，返回 (timestamp, sign)。"""
     ts = request.headers.get("X-Timestamp")
     sign = request.headers.get("X-Sign")
     if not ts or not sign:
@@ -40,29 +61,241 @@ async def run_evaluation(
         ts_int = int(ts)
     except Exception:
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid timestamp")
-    import time
     if abs(time.time() - ts_int) > 600:
         raise HTTPException(status_code=401, detail="Unauthorized: Signature expired")
+    return ts, sign
+
+
+def _expected_sign(ts: str, content_hash: str) -> str:
+    return hmac.new(settings.SHARED_SECRET.encode("utf-8"), f"{ts}\n{content_hash}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+async def _spool_judge(judge_zip: UploadFile | None, judge_hash: str | None) -> tuple[SpooledUpload | None, str]:
+    """落盘评测包（如有上传）并确定最终的 judge_hash。"""
+    if judge_zip is not None:
+        judge_upload = await spool_upload(judge_zip, prefix="judge_")
+        if judge_hash and judge_hash.strip().lower() != judge_upload.sha256:
+            judge_upload.cleanup()
+            raise HTTPException(status_code=400, detail="judge_hash 与上传的 judge_zip 内容不一致")
+        return judge_upload, judge_upload.sha256
+    if judge_hash:
+        return None, judge_hash.strip().lower()
+    raise HTTPException(status_code=400, detail="必须提供 judge_zip 或 judge_hash")
+
+
+async def _lease_judge(judge_cache: JudgeCache, judge_upload: SpooledUpload | None, judge_hash: str) -> JudgeLease:
+    """评测包只解压一次：命中缓存直接引用，否则解压进缓存。"""
+    if judge_upload is not None:
+        try:
+            judge_lease = await blocking_pool.run("judge_extract", judge_cache.put_archive, judge_hash, judge_upload.path)
+        except ResourceProfileError as e:
+            raise _invalid_profile(e)
+        cleanup_spooled(judge_upload)
+        return judge_lease
+    try:
+        return judge_cache.lease(judge_hash)
+    except UnknownJudgeHashError:
+        raise HTTPException(status_code=404, detail=_unknown_judge_hash_detail(judge_hash))
+
+
+def _observe_uploads(submission_uploads: list[SpooledUpload], judge_upload: SpooledUpload | None, judge_hash: str) -> None:
+    for upload in submission_uploads:
+        observe_upload("submission", upload.size, judge_hash)
+    if judge_upload is not None:
+        observe_upload("judge", judge_upload.size, judge_hash)
 
-    semaphore: asyncio.Semaphore = request.app.state.semaphore
-    executor: ProcessPoolExecutor = request.app.state.executor # <-- 从app.state获取executor
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _cache_key(judge_lease: JudgeLease, sub_hash: str) -> str:
+    try:
+        profile = load_profile(str(judge_lease.path))
+    except ResourceProfileError as e:
+        # 启用校验之前已进入缓存的评测包
+        raise _invalid_profile(e)
+    return result_cache_key(sub_hash, judge_lease.judge_hash, profile)
+
+
+def _cached_result(cache_key: str) -> dict | None:
+    """取出缓存的评测结果并标记为缓存命中；未命中时返回 None。"""
+    result = result_cache.get(cache_key)
+    if result is not None:
+        result["cached"] = True
+        result["stages"] = {}
+    return result
+
+
+async def _deliver_cached(submission_id: str, result: dict, callback_url: str) -> None:
+    """缓存命中：不经过评测队列与沙箱，直接回调上次的结果。"""
+    print(f"[ResultCache] Reusing cached result for submission {submission_id}")
+    await sandbox.post_results_to_webapp(submission_id, result, callback_url)
+
+
+def _queued_timer(job: EvaluationJob) -> StageTimer:
+    """评测开始时创建阶段计时器，先记下在队列中的等待时间。"""
+    timer = StageTimer()
+    timer.add("queue_wait", job.queue_wait_seconds)
+    return timer
+
+
+ResultListener = Callable[[dict], Awaitable[None]]
+
+
+class _Flight:
+    """
+    一次进行中的评测（排队或执行中）及等待其结果的监听者。
+    相同 submission_id 且内容相同的重复请求不再另起评测，只追加监听者：
+    回调地址（相同地址只回调一次）或批量评测的聚合收集器。
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.callback_urls: set[str] = set()
+        self.listeners: list[ResultListener] = []
+
+    def add_callback(self, submission_id: str, callback_url: str) -> None:
+        if callback_url in self.callback_urls:
+            return
+        self.callback_urls.add(callback_url)
+        self.listeners.append(lambda result: sandbox.submit_results_to_webapp(submission_id, result, callback_url))
+
+    async def deliver(self, result: dict) -> None:
+        """
+        通知全部监听者；通知期间新加入的监听者同样会收到结果。
+        回调监听者只等待结果写入发件箱，投递（含重试）由回调发送器在后台完成。
+        """
+        notified = 0
+        while notified < len(self.listeners):
+            pending = self.listeners[notified:]
+            notified = len(self.listeners)
+            await asyncio.gather(*(listener(result) for listener in pending))
+
+
+# 进行中的评测：(submission_id, 内容键) -> _Flight
+_flights: dict[str, _Flight] = {}
+
+
+def _flight_key(submission_id: str, cache_key: str) -> str:
+    return f"{submission_id}\n{cache_key}"
+
+
+def _evaluation_job(
+    judge_lease: JudgeLease,
+    submission_id: str,
+    submission_upload: SpooledUpload,
+    cache_key: str,
+    flight: _Flight,
+) -> EvaluationJob:
+    """
+    构造单个提交的评测任务：持有评测包缓存引用期间执行评测，结束后释放引用；
+    结果先写入结果缓存，再通知该次评测的全部监听者（回调或聚合收集）；
+    回调结果落盘后即交给回调发送器在后台投递，队列工作者不必等待回调重试。
+    任务入队前 flight 即已登记，任务结束（含被丢弃）时注销。
+    """
+    async def run():
+        timer = _queued_timer(job)
+        try:
+            try:
+                result = await sandbox.run_in_sandbox(submission_id, submission_upload.path, judge_lease.path, timer)
+            except Exception as e:
+                result = {"status": "ERROR", "score": 0.0, "logs": f"评测执行异常: {type(e).__name__}: {e}"}
+            finally:
+                judge_lease.release()
+            result_cache.put(cache_key, result)
+            await timer.measure("callback", flight.deliver(result))
+            print(f"[Callback] Handed result to {len(flight.listeners)} listener(s) for submission {submission_id} in {timer.durations['callback']:.3f}s")
+            observe_evaluation(judge_lease.judge_hash, result, timer.durations["callback"])
+        finally:
+            _flights.pop(flight.key, None)
+
+    def discard():
+        _flights.pop(flight.key, None)
+        _discard(submission_upload, None, judge_lease)
+
+    job = EvaluationJob(submission_id=submission_id, run=run, discard=discard, ready=sandbox.runtime_ready(judge_lease.path))
+    return job
+
+
+class _BatchCollector:
+    """批量评测（聚合回调）：收集各提交结果，全部完成后一次性回调。"""
+
+    def __init__(self, submission_ids: list[str], callback_url: str):
+        self._order = list(submission_ids)
+        self._results: dict[str, dict] = {}
+        self._callback_url = callback_url
+
+    async def record(self, submission_id: str, result: dict) -> None:
+        self._results[submission_id] = result
+        if len(self._results) == len(self._order):
+            await sandbox.submit_batch_results_to_webapp(
+                [(sid, self._results[sid]) for sid in self._order],
+                self._callback_url,
+            )
+
+    def listener(self, submission_id: str) -> ResultListener:
+        return lambda result: self.record(submission_id, result)
+
+
+def _queue_full_exception(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+@router.post("/evaluate")
+async def run_evaluation(
+    request: Request,
+    submission_id: str = Form(..., description="提交ID，用于回调"),
+    submission_zip: UploadFile = File(..., description="用户的提交ZIP文件"),
+    judge_zip: UploadFile | None = File(None, description="题目的评测脚本ZIP包；已缓存时可省略并改传 judge_hash"),
+    judge_hash: str | None = Form(None, description="评测包ZIP的SHA-256，命中服务端缓存时无需上传 judge_zip"),
+    callback_url: str | None = Form(None, description="回调URL，可覆盖默认配置"),
+    force_rerun: bool = Form(False, description="为 true 时忽略结果缓存，重新评测"),
+):
+    """
+    接收提交文件和评测脚本文件，执行评测，并通过回调返回结果。
+
+    相同提交、相同评测包与资源配置的 COMPLETED 结果会被缓存（RESULT_CACHE_TTL_SECONDS）：
+    命中时不进入评测队列，立即回调上次的结果（带 cached=true）；force_rerun=true 时强制重新评测。
+    同一 submission_id、内容相同的评测仍在排队或执行时，重复请求不再另起评测，
+    返回 status="Evaluation in progress"，结果由进行中的那次评测一并回调到本次请求的地址。
+
+    评测包按 SHA-256 缓存在服务端：若只提供 judge_hash 且缓存未命中，返回 404
+    （code=JUDGE_HASH_UNKNOWN），客户端需要携带 judge_zip 重新提交。
+    评测队列已满时返回 429，并通过 Retry-After 头给出建议的重试等待秒数。
+    """
+    # 签名校验：X-Timestamp + X-Sign
+    ts, sign = _verify_signature_headers(request)
+
+    judge_cache: JudgeCache = request.app.state.judge_cache
+    evaluation_queue: EvaluationQueue = request.app.state.evaluation_queue
 
     logger.info(f"Received evaluation request for submission: {submission_id}")
 
+    # 队列已满时尽早拒绝，避免无谓地接收与落盘上传文件
+    if evaluation_queue.status()["available_slots"] <= 0:
+        raise _queue_full_exception(QueueFullError(evaluation_queue.retry_after()))
+
+    submission_upload = None
+    judge_upload = None
+    judge_lease = None
     try:
-        submission_data = await submission_zip.read()
-        judge_data = await judge_zip.read()
+        # 流式落盘并增量计算哈希，避免将整个压缩包读入内存
+        submission_upload = await spool_upload(submission_zip, prefix="submission_")
+        judge_upload, judge_hash = await _spool_judge(judge_zip, judge_hash)
         cb_url = callback_url or settings.WEBAPP_CALLBACK_URL
+        _observe_uploads([submission_upload], judge_upload, judge_hash)
 
         # 计算签名（主方案：不包含回调URL；兼容方案：包含回调URL，便于平滑过渡）
-        sub_hash = hashlib.sha256(submission_data).hexdigest()
-        judge_hash = hashlib.sha256(judge_data).hexdigest()
+        sub_hash = submission_upload.sha256
         content_hash_v1 = hashlib.sha256(f"{submission_id}\n{sub_hash}\n{judge_hash}".encode("utf-8")).hexdigest()
-        expected_v1 = hmac.new(settings.SHARED_SECRET.encode("utf-8"), f"{ts}\n{content_hash_v1}".encode("utf-8"), hashlib.sha256).hexdigest()
+        expected_v1 = _expected_sign(ts, content_hash_v1)
 
         # 兼容：如果客户端仍包含 callback_url 进签名，允许通过
         content_hash_v2 = hashlib.sha256(f"{submission_id}\n{sub_hash}\n{judge_hash}\n{cb_url}".encode("utf-8")).hexdigest()
-        expected_v2 = hmac.new(settings.SHARED_SECRET.encode("utf-8"), f"{ts}\n{content_hash_v2}".encode("utf-8"), hashlib.sha256).hexdigest()
+        expected_v2 = _expected_sign(ts, content_hash_v2)
 
         # 调试输出（stdout + logger）
         # 仅输出密钥摘要，避免泄露明文
@@ -81,23 +314,175 @@ async def run_evaluation(
         if not (hmac.compare_digest(expected_v1, sign) or hmac.compare_digest(expected_v2, sign)):
             raise HTTPException(status_code=401, detail="Unauthorized: Invalid signature")
 
-        # 将异步任务交由后台执行，并立即返回
-        background_tasks.add_task(
-            sandbox.run_in_sandbox_and_callback,
-            submission_id,
-            submission_data,
-            judge_data,
-            semaphore,
-            executor,  # <-- 将executor传递给后台任务
-            cb_url,
-        )
+        judge_lease = await _lease_judge(judge_cache, judge_upload, judge_hash)
 
-        logger.info(f"Background evaluation task started for submission: {submission_id}")
-        return {"status": "Evaluation started", "submission_id": submission_id}
+        cache_key = _cache_key(judge_lease, sub_hash)
+        flight_key = _flight_key(submission_id, cache_key)
+        flight = _flights.get(flight_key)
+        if flight is not None:
+            # 同一提交的评测仍在排队或执行（例如 webapp 重试）：不再另起评测，结果同时回调到本次请求的地址
+            _discard(submission_upload, None, judge_lease)
+            flight.add_callback(submission_id, cb_url)
+            print(f"[Queue] Submission {submission_id} is already being evaluated; attached callback to the running evaluation")
+            return {"status": "Evaluation in progress", "submission_id": submission_id, "queue": evaluation_queue.status()}
+
+        cached = None if force_rerun else _cached_result(cache_key)
+        if cached is not None:
+            _discard(submission_upload, None, judge_lease)
+            _spawn(_deliver_cached(submission_id, cached, cb_url))
+            return {"status": "Evaluation cached", "submission_id": submission_id, "queue": evaluation_queue.status()}
+
+        # 将评测任务放入有界队列并立即返回；spool 文件与缓存引用由任务负责释放
+        flight = _Flight(flight_key)
+        flight.add_callback(submission_id, cb_url)
+        job = evaluation_queue.submit(_evaluation_job(judge_lease, submission_id, submission_upload, cache_key, flight))
+        _flights[flight_key] = flight
+
+        logger.info(f"Evaluation job {job.job_id} queued for submission: {submission_id}")
+        return {"status": "Evaluation started", "submission_id": submission_id, "queue": evaluation_queue.status()}
 
     except HTTPException as e:
         # 直接透传 HTTP 异常（例如 401 签名失败），避免被包装成 500
+        _discard(submission_upload, judge_upload, judge_lease)
         raise e
+    except QueueFullError as e:
+        _discard(submission_upload, judge_upload, judge_lease)
+        raise _queue_full_exception(e)
+    except UploadTooLargeError as e:
+        _discard(submission_upload, judge_upload, judge_lease)
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
+        _discard(submission_upload, judge_upload, judge_lease)
         logger.error(f"Failed to start evaluation for submission {submission_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"评测启动失败: {str(e)}")
+
+
+@router.post("/evaluate/batch")
+async def run_batch_evaluation(
+    request: Request,
+    submission_ids: list[str] = Form(..., description="提交ID列表，与 submission_zips 按顺序一一对应"),
+    submission_zips: list[UploadFile] = File(..., description="提交ZIP文件列表"),
+    judge_zip: UploadFile | None = File(None, description="题目的评测脚本ZIP包；已缓存时可省略并改传 judge_hash"),
+    judge_hash: str | None = Form(None, description="评测包ZIP的SHA-256"),
+    callback_url: str | None = Form(None, description="回调URL，可覆盖默认配置"),
+    aggregate_callback: bool = Form(False, description="为 true 时所有提交评测完成后只发送一次聚合回调"),
+    force_rerun: bool = Form(False, description="为 true 时忽略结果缓存，全部重新评测"),
+):
+    """
+    批量评测：一个评测包 + N 个提交，只需一次签名校验与一次评测包解压。
+
+    签名：content_hash = sha256("batch\\n{judge_hash}\\n{id_1}\\n{sub_hash_1}\\n...\\n{id_n}\\n{sub_hash_n}")，
+    X-Sign = HMAC-SHA256(SHARED_SECRET, "{ts}\\n{content_hash}")。
+    """
+    ts, sign = _verify_signature_headers(request)
+    if len(submission_ids) != len(submission_zips):
+        raise HTTPException(status_code=400, detail="submission_ids 与 submission_zips 数量不一致")
+    if len(set(submission_ids)) != len(submission_ids):
+        raise HTTPException(status_code=400, detail="submission_ids 存在重复")
+    if len(submission_ids) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"单批提交数量超过上限 {settings.MAX_BATCH_SIZE}")
+
+    judge_cache: JudgeCache = request.app.state.judge_cache
+    evaluation_queue: EvaluationQueue = request.app.state.evaluation_queue
+
+    logger.info(f"Received batch evaluation request with {len(submission_ids)} submissions")
+
+    if evaluation_queue.status()["available_slots"] < len(submission_ids):
+        raise _queue_full_exception(QueueFullError(evaluation_queue.retry_after()))
+
+    submission_uploads: list[SpooledUpload] = []
+    judge_upload = None
+    judge_lease = None
+    try:
+        for upload in submission_zips:
+            submission_uploads.append(await spool_upload(upload, prefix="submission_"))
+        judge_upload, judge_hash = await _spool_judge(judge_zip, judge_hash)
+        cb_url = callback_url or settings.WEBAPP_CALLBACK_URL
+        _observe_uploads(submission_uploads, judge_upload, judge_hash)
+
+        lines = ["batch", judge_hash]
+        for submission_id, upload in zip(submission_ids, submission_uploads):
+            lines.extend([submission_id, upload.sha256])
+        content_hash = hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+        if not hmac.compare_digest(_expected_sign(ts, content_hash), sign):
+            raise HTTPException(status_code=401, detail="Unauthorized: Invalid signature")
+
+        judge_lease = await _lease_judge(judge_cache, judge_upload, judge_hash)
+        submissions = list(zip(submission_ids, submission_uploads))
+
+        # 每个提交各自持有一份评测包缓存引用；整批原子入队，容量不足时整体拒绝。
+        # 已在评测中的提交不再入队，只追加监听者；结果缓存命中的提交不入队，
+        # 两者都在整批入队成功后处理（直接回调或计入聚合回调）
+        collector = _BatchCollector(submission_ids, cb_url) if aggregate_callback else None
+        jobs = []
+        flights: list[_Flight] = []
+        attached: list[tuple[str, SpooledUpload, _Flight]] = []
+        cached: list[tuple[str, dict, SpooledUpload]] = []
+        for submission_id, upload in submissions:
+            cache_key = _cache_key(judge_lease, upload.sha256)
+            flight_key = _flight_key(submission_id, cache_key)
+            if flight_key in _flights:
+                attached.append((submission_id, upload, _flights[flight_key]))
+                continue
+            result = None if force_rerun else _cached_result(cache_key)
+            if result is not None:
+                cached.append((submission_id, result, upload))
+                continue
+            flight = _Flight(flight_key)
+            if collector is not None:
+                flight.listeners.append(collector.listener(submission_id))
+            else:
+                flight.add_callback(submission_id, cb_url)
+            flights.append(flight)
+            lease = judge_cache.lease(judge_hash)
+            jobs.append(_evaluation_job(lease, submission_id, upload, cache_key, flight))
+        try:
+            evaluation_queue.submit_many(jobs)
+        except QueueFullError:
+            for job in jobs:
+                job.discard()
+            raise
+        finally:
+            judge_lease.release()
+        for flight in flights:
+            _flights[flight.key] = flight
+        for submission_id, upload, flight in attached:
+            cleanup_spooled(upload)
+            if collector is not None:
+                flight.listeners.append(collector.listener(submission_id))
+            else:
+                flight.add_callback(submission_id, cb_url)
+        for submission_id, result, upload in cached:
+            cleanup_spooled(upload)
+            if collector is not None:
+                _spawn(collector.record(submission_id, result))
+            else:
+                _spawn(_deliver_cached(submission_id, result, cb_url))
+
+        logger.info(f"Batch evaluation scheduled for {len(submissions)} submissions (judge {judge_hash})")
+        return {
+            "status": "Evaluation started",
+            "submission_ids": submission_ids,
+            "judge_hash": judge_hash,
+            "cached_submission_ids": [submission_id for submission_id, _, _ in cached],
+            "attached_submission_ids": [submission_id for submission_id, _, _ in attached],
+            "queue": evaluation_queue.status(),
+        }
+
+    except HTTPException as e:
+        _discard(None, judge_upload, judge_lease)
+        cleanup_spooled(*submission_uploads)
+        raise e
+    except QueueFullError as e:
+        _discard(None, judge_upload, judge_lease)
+        cleanup_spooled(*submission_uploads)
+        raise _queue_full_exception(e)
+    except UploadTooLargeError as e:
+        _discard(None, judge_upload, judge_lease)
+        cleanup_spooled(*submission_uploads)
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        _discard(None, judge_upload, judge_lease)
+        cleanup_spooled(*submission_uploads)
+        logger.error(f"Failed to start batch evaluation: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"批量评测启动失败: {str(e)}")
@@ -0,0 +1,153 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from services.blocking import blocking_pool
+from services.callbacks import callback_dispatcher
+from services.cpu_slots import cpu_pinning_enabled, cpu_scheduler, resource_admission_enabled, resource_budget
+from services.metrics import backend_name, render, render_samples
+from services.outbox import result_outbox
+from services.result_cache import result_cache
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _component_samples(request: Request) -> list[str]:
+    """队列、线程池、监狱池等的即时状态，与 /api/status 同源。"""
+    backend = {"backend": backend_name()}
+    queue = request.app.state.evaluation_queue.status()
+    lines = []
+    lines += render_samples(
+        "evaluateapp_queue_jobs",
+        "Evaluation jobs by state.",
+        [({**backend, "state": "queued"}, queue["queued"]), ({**backend, "state": "active"}, queue["active"])],
+    )
+    lines += render_samples("evaluateapp_queue_concurrency", "Evaluation queue workers (EVAL_CONCURRENCY).", [(backend, queue["concurrency"])])
+    lines += render_samples(
+        "evaluateapp_queue_waiting_jobs",
+        "Queued jobs held back until their prerequisite (e.g. the problem's Docker image) is ready.",
+        [(backend, queue["waiting"])],
+    )
+    lines += render_samples("evaluateapp_queue_max_depth", "Maximum number of queued jobs.", [(backend, queue["max_depth"])])
+    lines += render_samples("evaluateapp_queue_oldest_wait_seconds", "Wait time of the oldest queued job.", [(backend, queue["oldest_wait_seconds"])])
+    lines += render_samples(
+        "evaluateapp_queue_finished_jobs_total",
+        "Evaluation jobs by outcome since start.",
+        [({**backend, "outcome": outcome}, queue[outcome]) for outcome in ("completed", "failed", "rejected")],
+        kind="counter",
+    )
+
+    pool = blocking_pool.status()
+    lines += render_samples("evaluateapp_blocking_pool_workers", "Blocking thread pool size (BLOCKING_IO_WORKERS).", [(backend, pool["max_workers"])])
+    lines += render_samples("evaluateapp_blocking_pool_in_flight", "Blocking steps currently running or waiting for a thread.", [(backend, pool["in_flight"])])
+
+    if cpu_pinning_enabled():
+        slots = cpu_scheduler.status()
+        lines += render_samples(
+            "evaluateapp_cpu_slots",
+            "Pinned CPU cores by state.",
+            [({**backend, "state": "free"}, len(slots["free"])), ({**backend, "state": "busy"}, len(slots["cpus"]) - len(slots["free"]))],
+        )
+        lines += render_samples("evaluateapp_cpu_slot_waiters", "Evaluations waiting for free CPU cores.", [(backend, slots["waiting"])])
+
+    if resource_admission_enabled():
+        budget = resource_budget.status()
+        lines += render_samples(
+            "evaluateapp_resource_budget_cpus",
+            "Admission budget cores by state.",
+            [({**backend, "state": "used"}, budget["used_cpus"]), ({**backend, "state": "total"}, budget["cpus"])],
+        )
+        lines += render_samples(
+            "evaluateapp_resource_budget_memory_bytes",
+            "Admission budget memory by state.",
+            [({**backend, "state": "used"}, budget["used_memory_bytes"]), ({**backend, "state": "total"}, budget["memory_bytes"])],
+        )
+        lines += render_samples("evaluateapp_resource_budget_waiters", "Evaluations waiting for admission.", [(backend, budget["waiting"])])
+
+    callbacks = callback_dispatcher.status()
+    lines += render_samples(
+        "evaluateapp_callbacks",
+        "Callbacks in flight or waiting in a coalescing window.",
+        [({**backend, "state": "in_flight"}, callbacks["in_flight"]), ({**backend, "state": "pending"}, callbacks["pending"])],
+    )
+    lines += render_samples("evaluateapp_callback_retries_total", "Callback retry attempts since start.", [(backend, callbacks["retries"])], kind="counter")
+
+    outbox = result_outbox.status()
+    if outbox["enabled"] and "undelivered" in outbox:
+        lines += render_samples("evaluateapp_outbox_undelivered", "Outbox entries (one per submission and callback URL) not yet delivered.", [(backend, outbox["undelivered"])])
+
+    cache = result_cache.status()
+    lines += render_samples("evaluateapp_result_cache_bytes", "Bytes held by the result cache.", [(backend, cache["total_bytes"])])
+    lines += render_samples(
+        "evaluateapp_result_cache_lookups_total",
+        "Result cache lookups by outcome.",
+        [({**backend, "outcome": "hit"}, cache["hits"]), ({**backend, "outcome": "miss"}, cache["misses"])],
+        kind="counter",
+    )
+
+    judge_cache = request.app.state.judge_cache
+    lines += render_samples("evaluateapp_judge_cache_bytes", "Bytes held by the extracted judge cache.", [(backend, judge_cache.total_bytes)])
+
+    # NAMESPACE 后端每次评测现场搭建命名空间，没有池化的组件
+    if backend["backend"] not in ("DOCKER", "NAMESPACE"):
+        from services.sandbox import jail_pool, fork_server, _fork_server_enabled
+        jails = jail_pool.status()
+        lines += render_samples(
+            "evaluateapp_jail_pool_jails",
+            "Pre-built jails by state.",
+            [({**backend, "state": "ready"}, jails["ready"]), ({**backend, "state": "preparing"}, jails["preparing"])],
+        )
+        lines += render_samples("evaluateapp_jail_pool_size", "Target jail pool size (JAIL_POOL_SIZE).", [(backend, jails["size"])])
+        lines += render_samples(
+            "evaluateapp_fork_server_up",
+            "Whether the fork-server zygote is running (only when enabled).",
+            [(backend, 1 if fork_server.alive else 0)] if _fork_server_enabled() else [],
+        )
+    elif backend["backend"] == "DOCKER":
+        from services.docker_sandbox import container_pool, docker_session, image_manager
+        session = docker_session.status()
+        images = image_manager.status()
+        lines += render_samples(
+            "evaluateapp_docker_images",
+            "Evaluation images known to be local or currently being pulled/built.",
+            [({**backend, "state": "local"}, images["local_images"]), ({**backend, "state": "warming"}, len(images["warming"]))],
+        )
+        lines += render_samples(
+            "evaluateapp_docker_image_warms_total",
+            "Image pulls / builds by outcome.",
+            [
+                ({**backend, "outcome": "pulled"}, images["pulled"]),
+                ({**backend, "outcome": "built"}, images["built"]),
+                ({**backend, "outcome": "failed"}, images["failed"]),
+            ],
+            kind="counter",
+        )
+        lines += render_samples(
+            "evaluateapp_docker_connected", "Whether the Docker daemon session is connected.", [(backend, 1 if session["connected"] else 0)]
+        )
+        lines += render_samples(
+            "evaluateapp_docker_disconnects_total",
+            "Docker sessions dropped because the daemon was unreachable.",
+            [(backend, session["disconnects"])],
+            kind="counter",
+        )
+        containers = container_pool.status()
+        lines += render_samples(
+            "evaluateapp_container_pool_containers",
+            "Pre-started containers by state.",
+            [({**backend, "state": "ready"}, containers["ready"]), ({**backend, "state": "preparing"}, containers["preparing"])],
+        )
+        lines += render_samples(
+            "evaluateapp_container_pool_size", "Target container pool size (DOCKER_POOL_SIZE).", [(backend, containers["size"])]
+        )
+    return lines
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """
+    Prometheus 文本格式的指标：各阶段耗时与上传大小的直方图（按后端与评测包哈希分组），
+    以及队列、线程池、监狱池等的即时状态。与 /api/status 相同，在事件循环中读取这些状态。
+    """
+    return PlainTextResponse(render(_component_samples(request)), media_type=CONTENT_TYPE)
@@ -0,0 +1,35 @@
+import hashlib
+import hmac
+
+from fastapi import APIRouter, HTTPException, Request
+
+from api.evaluate import _expected_sign, _verify_signature_headers
+from services.outbox import outbox_enabled, result_outbox
+
+router = APIRouter()
+
+
+@router.get("/results/{submission_id}")
+async def get_result(request: Request, submission_id: str):
+    """
+    按 submission_id 拉取已完成评测的结果（来自本地发件箱），供 webapp 补齐错过的回调而无需重新评测。
+
+    签名：content_hash = sha256("result\\n{submission_id}")，
+    X-Sign = HMAC-SHA256(SHARED_SECRET, "{ts}\\n{content_hash}")。
+    返回的 result 与回调负载相同（不含 submissionId）；delivered 表示是否已有回调投递成功，
+    callbacks 列出各回调地址的投递时间与尝试次数。
+    """
+    ts, sign = _verify_signature_headers(request)
+    content_hash = hashlib.sha256(f"result\n{submission_id}".encode("utf-8")).hexdigest()
+    if not hmac.compare_digest(_expected_sign(ts, content_hash), sign):
+        raise HTTPException(status_code=401, detail="Unauthorized: Invalid signature")
+
+    if not outbox_enabled() or not result_outbox.enabled:
+        raise HTTPException(status_code=503, detail="结果发件箱未启用（OUTBOX_ENABLED=false）")
+    entry = await result_outbox.get(submission_id)
+    if entry is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"code": "RESULT_UNKNOWN", "message": "no stored result for this submission", "submission_id": submission_id},
+        )
+    return entry
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Request
+
+from core.config import settings
+from services.blocking import blocking_pool
+from services.callbacks import callback_dispatcher
+from services.cpu_slots import cpu_pinning_enabled, cpu_scheduler, resource_admission_enabled, resource_budget
+from services.outbox import result_outbox
+from services.result_cache import result_cache
+
+router = APIRouter()
+
+
+@router.get("/status")
+async def get_status(request: Request):
+    """
+    评测服务的实时容量信息：排队数、执行中任务数、最久等待时间等。
+    调用方可据此节流，而不是盲目重试。
+    各组件的状态只在事件循环中修改，因此这里也在事件循环中读取（async def，不进线程池）。
+    """
+    judge_cache = request.app.state.judge_cache
+    result = {
+        "backend": (settings.SANDBOX_BACKEND or "").strip().upper() or "CHROOT",
+        "queue": request.app.state.evaluation_queue.status(),
+        "judge_cache": {
+            "entries": len(judge_cache),
+            "total_bytes": judge_cache.total_bytes,
+            "max_bytes": judge_cache.max_bytes,
+        },
+        "result_cache": result_cache.status(),
+        "blocking_pool": blocking_pool.status(),
+        "cpu_slots": {"enabled": cpu_pinning_enabled(), **cpu_scheduler.status()},
+        "resource_budget": {"enabled": resource_admission_enabled(), **resource_budget.status()},
+        "callbacks": callback_dispatcher.status(),
+        "outbox": result_outbox.status(),
+    }
+    if result["backend"] == "NAMESPACE":
+        from services.namespace_sandbox import _user_namespace_enabled
+        from services.sandbox import cgroup_manager, _cgroups_enabled
+        result["namespace"] = {"tmpfs_size": settings.NAMESPACE_TMPFS_SIZE, "user_namespace": _user_namespace_enabled()}
+        result["cgroups"] = {"enabled": _cgroups_enabled(), **cgroup_manager.status()}
+    elif result["backend"] != "DOCKER":
+        from services.sandbox import jail_pool, fork_server, _fork_server_enabled
+        result["jail_pool"] = jail_pool.status()
+        result["fork_server"] = {"enabled": _fork_server_enabled(), **fork_server.status()}
+        from services.sandbox import cgroup_manager, _cgroups_enabled
+        result["cgroups"] = {"enabled": _cgroups_enabled(), **cgroup_manager.status()}
+    else:
+        from services.docker_sandbox import container_pool, docker_session, image_manager
+        result["docker"] = docker_session.status()
+        result["images"] = image_manager.status()
+        result["container_pool"] = container_pool.status()
+    return result
@@ -13,9 +13,97 @@ class Settings(BaseSettings):
     GRADIO_PATH: str = "/gradio"
     # 是否启用 Seccomp 过滤（默认关闭，避免阻断 exec 等系统调用）
     ENABLE_SECCOMP: bool = False
-    # 评测后端：CHROOT 或 DOCKER
+    # 评测后端：CHROOT、DOCKER 或 NAMESPACE
     SANDBOX_BACKEND: str = "CHROOT"
 
+    # 上传文件落盘（spool）目录，None 表示使用系统临时目录
+    UPLOAD_SPOOL_DIR: str | None = None
+    # 单个上传文件的最大字节数
+    MAX_UPLOAD_SIZE: int = 2 * 1024**3
+
+    # 已解压评测包（judge）缓存目录，按 SHA-256 内容寻址
+    JUDGE_CACHE_DIR: str = "/var/tmp/evaluateapp/judge_cache"
+    # 评测包缓存总字节上限，超过后按 LRU 淘汰
+    JUDGE_CACHE_MAX_BYTES: int = 4 * 1024**3
+    # 同时执行的评测任务数（评测队列 worker 数）
+    EVAL_CONCURRENCY: int = 4
+    # 评测队列最大排队长度，超过后新请求返回 429
+    EVAL_QUEUE_MAX_DEPTH: int = 200
+    # 解压、搭建/清理监狱等阻塞步骤专用线程池的线程数
+    BLOCKING_IO_WORKERS: int = 4
+    # CHROOT 后端监狱构建方式：
+    # - COPY：硬链接复制基础环境（cp -al），可配合预热池
+    # - OVERLAY：私有挂载命名空间中以只读基础环境为下层、tmpfs 为上层挂载 overlay，创建与销毁为 O(1)
+    JAIL_MODE: str = "COPY"
+    # OVERLAY 模式下每次评测可写层（tmpfs）的大小
+    JAIL_TMPFS_SIZE: str = "512m"
+    # NAMESPACE 后端：评测进程根目录（tmpfs，可写部分只有 /tmp）的大小；题目配置了磁盘配额时以其为准
+    NAMESPACE_TMPFS_SIZE: str = "512m"
+    # NAMESPACE 后端：降权后是否再进入只映射自身身份的用户命名空间（启用 Seccomp 时不生效）
+    NAMESPACE_USERNS: bool = True
+    # CHROOT 后端预热监狱池大小（0 表示关闭，每次评测现场搭建）
+    JAIL_POOL_SIZE: int = 4
+    # 单个监狱最多复用次数，达到后销毁重建
+    JAIL_POOL_MAX_USES: int = 20
+    # 是否启用 fork-server：常驻进程预先导入科学计算库，每次评测 fork 子进程执行（仅 CHROOT + COPY 模式）
+    FORK_SERVER_ENABLED: bool = False
+    # fork-server 预导入的模块，逗号分隔；导入失败的模块会被跳过
+    FORK_SERVER_PRELOAD: str = "numpy,pandas,sklearn"
+    # 是否为 CHROOT 后端的每次评测创建独立的 cgroup v2（启用内存限制后不再使用 RLIMIT_AS）
+    CGROUP_ENABLED: bool = False
+    # 评测 cgroup 的父目录，其上一级需已委派 memory / cpu / pids 控制器
+    CGROUP_ROOT: str = "/sys/fs/cgroup/evaluateapp"
+    # 每次评测的 memory.max（支持 K/M/G 后缀）
+    CGROUP_MEMORY_MAX: str = "2G"
+    # 每次评测可用的 CPU 数（cpu.max），0 表示不限制
+    CGROUP_CPU_MAX: float = 1.0
+    # 每次评测的 pids.max，0 表示不限制
+    CGROUP_PIDS_MAX: int = 64
+    # 是否启用 CPU 绑核调度：每次评测独占若干 CPU 核（chroot 后端用 sched_setaffinity，DOCKER 后端用 cpuset_cpus）
+    CPU_PINNING_ENABLED: bool = False
+    # 参与调度的 CPU 列表，如 "0-7" 或 "2,3,6-9"；为空表示服务进程当前可用的全部 CPU
+    CPU_PINNING_CPUS: str = ""
+    # 每次评测分配的 CPU 核数，线程数环境变量（OMP_NUM_THREADS 等）随之设置
+    CPU_SLOT_SIZE: int = 1
+    # 是否按题目资源配置（threads、memoryMB）做准入：同时运行的评测占用的核数与内存之和不超过预算
+    RESOURCE_ADMISSION_ENABLED: bool = True
+    # 准入预算的核数，0 表示参与调度的全部 CPU（见 CPU_PINNING_CPUS）
+    RESOURCE_BUDGET_CPUS: float = 0
+    # 准入预算的内存（MB），0 表示本机物理内存
+    RESOURCE_BUDGET_MEMORY_MB: int = 0
+    # 未配置 memoryMB 的题目在准入时占用的内存（MB）；未配置 threads 的题目占用 CPU_SLOT_SIZE 个核
+    RESOURCE_DEFAULT_MEMORY_MB: int = 1024
+    # 回调发送器：同时进行的回调 POST 上限（共享连接池的连接数）
+    CALLBACK_MAX_CONCURRENCY: int = 8
+    # 回调失败（网络错误、超时、429、5xx）时的最大尝试次数
+    CALLBACK_MAX_ATTEMPTS: int = 5
+    # 重试退避：第 n 次重试前随机等待 [0, min(MAX, BASE * 2^n)] 秒
+    CALLBACK_RETRY_BASE_SECONDS: float = 0.5
+    CALLBACK_RETRY_MAX_SECONDS: float = 30.0
+    # 单次回调请求超时（秒）
+    CALLBACK_TIMEOUT: float = 30.0
+    # 大于 1 时把 CALLBACK_BATCH_WINDOW 秒内完成的结果合并为一次回调（{"results": [...]}；接收方以 400 拒绝时逐条发送）
+    CALLBACK_BATCH_SIZE: int = 1
+    CALLBACK_BATCH_WINDOW: float = 0.2
+    # 是否在回调前把评测结果持久化到本地发件箱（SQLite），回调失败或服务重启后重新投递
+    OUTBOX_ENABLED: bool = True
+    # 发件箱数据库文件路径
+    OUTBOX_PATH: str = "/var/tmp/evaluateapp/outbox.sqlite3"
+    # 重新投递未投递结果的间隔（秒）；服务启动时立即执行一次
+    OUTBOX_REPLAY_INTERVAL: float = 60.0
+    # 单条结果最多投递几轮（每轮内部仍按 CALLBACK_MAX_ATTEMPTS 重试），之后只能通过 GET /api/results 拉取
+    OUTBOX_MAX_ATTEMPTS: int = 20
+    # 发件箱记录保留时间（秒），过期后删除
+    OUTBOX_RETENTION_SECONDS: float = 7 * 24 * 3600
+    # 评测结果缓存：相同 (提交哈希, 评测包哈希, 资源配置) 的重复评测直接回调上次的 COMPLETED 结果；0 表示关闭
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024**2
+    # 结果缓存有效期（秒），0 表示关闭
+    RESULT_CACHE_TTL_SECONDS: float = 3600.0
+    # 评测子进程 stdout/stderr 及评测包日志各自保留的最大字节数（保留开头与结尾各一半，中间省略并计数）
+    RUNNER_OUTPUT_MAX_BYTES: int = 1024 * 1024
+    # 批量评测接口单次请求允许的最大提交数
+    MAX_BATCH_SIZE: int = 500
+
     # Docker 评测相关配置（当 SANDBOX_BACKEND=DOCKER 时生效）
     DOCKER_IMAGE: str = "swr.cn-north-4.myhuaweicloud.com/ddn-k8s/docker.io/library/python:3.12-slim-bookworm"
     DOCKER_PULL: bool = False
@@ -31,6 +119,18 @@ class Settings(BaseSettings):
     # 构建上下文与 Dockerfile（相对项目根）
     DOCKER_SELF_CONTEXT: str = str(BASE_DIR.parent)
     DOCKER_SELF_DOCKERFILE: str = "evaluateapp/docker/evaluateapp.Dockerfile"
+    # 预热容器池大小（0 表示关闭，每次评测新建容器）：容器常驻，评测通过 exec 在其中执行
+    DOCKER_POOL_SIZE: int = 0
+    # 单个预热容器最多复用次数，达到后销毁重建
+    DOCKER_POOL_MAX_USES: int = 50
+    # 预热容器中 /tmp（tmpfs）的大小；容器根文件系统只读
+    DOCKER_POOL_TMPFS_SIZE: str = "512m"
+    # 服务启动时预先拉取的镜像（逗号分隔），例如即将开始的比赛的题目镜像；评测包缓存中各题目声明的镜像也会一并预热
+    DOCKER_PREWARM_IMAGES: str = ""
+    # 题目镜像本地不存在且评测包根目录带有 Dockerfile 时，是否以评测包为上下文构建该镜像（否则拉取）
+    DOCKER_IMAGE_BUILD_ENABLED: bool = False
+    # 同时拉取/构建的镜像数
+    DOCKER_IMAGE_WARM_CONCURRENCY: int = 2
 
     class Config:
         # 使用绝对路径加载 .env，避免工作目录变化导致无法读取
@@ -1,11 +1,26 @@
-import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from concurrent.futures import ProcessPoolExecutor
 
 # 导入API模块
-from api import evaluate
+from api import evaluate, metrics, results, status
 from core.config import settings
+from services.judge_cache import create_judge_cache
+from services.evaluation_queue import EvaluationQueue
+from services.blocking import blocking_pool
+from services.callbacks import callback_dispatcher
+from services.outbox import outbox_enabled, result_outbox
+
+def _use_docker_backend() -> bool:
+    return (settings.SANDBOX_BACKEND or "").strip().upper() == "DOCKER"
+
+
+def _use_namespace_backend() -> bool:
+    return (settings.SANDBOX_BACKEND or "").strip().upper() == "NAMESPACE"
+
+
+def _use_chroot_backend() -> bool:
+    return not _use_docker_backend() and not _use_namespace_backend()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -14,19 +29,59 @@ async def lifespan(app: FastAPI):
     在应用启动时创建资源，在关闭时释放。
     """
     # 应用启动时:
-    # 1. 创建一个容量为4的信号量，控制并发评测数
-    app.state.semaphore = asyncio.Semaphore(4)
-    # 2. 创建一个进程池，用于在隔离的进程中运行评测代码，并将其存入app.state
-    app.state.executor = ProcessPoolExecutor(max_workers=4)
-    print("FastAPI app started. Concurrency limit: 4. ProcessPoolExecutor created.")
+    # 1. 已解压评测包缓存（按 SHA-256 内容寻址）
+    app.state.judge_cache = create_judge_cache()
+    # 2. 有界评测队列：worker 数即并发评测数，排队满时拒绝新请求。
+    #    评测子进程由事件循环直接管理，并发只受队列 worker 数限制。
+    app.state.evaluation_queue = EvaluationQueue(settings.EVAL_CONCURRENCY, settings.EVAL_QUEUE_MAX_DEPTH)
+    await app.state.evaluation_queue.start()
+    # 3. CHROOT 后端：后台预热监狱池（NAMESPACE 后端每次评测现场搭建，无需预热）
+    if _use_chroot_backend():
+        from services.sandbox import jail_pool
+        await jail_pool.start()
+        # 4. CHROOT 后端：预导入科学计算栈的 fork-server（启动失败时退回逐次启动解释器）
+        from services.sandbox import fork_server, _fork_server_enabled
+        if _fork_server_enabled():
+            try:
+                await fork_server.start()
+            except Exception as e:
+                print(f"[ForkServer] Failed to start, evaluations will spawn a fresh interpreter: {e}")
+    elif _use_docker_backend():
+        # 3. DOCKER 后端：连接 Docker daemon 并解析/校验评测镜像（self 模式下按需构建），之后评测直接复用；
+        #    再在后台预热容器池（DOCKER_POOL_SIZE > 0 时）与题目镜像（DOCKER_PREWARM_IMAGES 及评测包缓存中声明的镜像）
+        from services.docker_sandbox import docker_session, image_manager, start_container_pool
+        await docker_session.start()
+        await start_container_pool()
+        await image_manager.start()
+    # 5. 评测结果发件箱：重放上次运行中未投递的回调，之后定时重放
+    if outbox_enabled():
+        try:
+            await result_outbox.start()
+        except Exception as e:
+            print(f"[Outbox] Failed to open {settings.OUTBOX_PATH}, results will not be persisted: {e}")
+    print(f"FastAPI app started. Concurrency limit: {settings.EVAL_CONCURRENCY}, queue depth: {settings.EVAL_QUEUE_MAX_DEPTH}.")
+    print(f"Judge cache ready: {settings.JUDGE_CACHE_DIR} ({len(app.state.judge_cache)} entries, {app.state.judge_cache.total_bytes} bytes)")
 
     yield
 
     # 应用关闭时:
-    # 明确关闭进程池，等待所有子进程结束
-    print("FastAPI app shutting down. Shutting down ProcessPoolExecutor...")
-    app.state.executor.shutdown(wait=True)
-    print("ProcessPoolExecutor shut down gracefully.")
+    # 停止评测队列：取消执行中的评测（子进程会被终止），丢弃尚未开始的任务
+    print("FastAPI app shutting down. Stopping evaluation queue...")
+    await app.state.evaluation_queue.stop()
+    print("Evaluation queue stopped gracefully.")
+    if _use_chroot_backend():
+        from services.sandbox import jail_pool, fork_server
+        await fork_server.stop()
+        await jail_pool.stop()
+    elif _use_docker_backend():
+        from services.docker_sandbox import container_pool, docker_session, image_manager
+        await image_manager.stop()
+        await container_pool.stop()
+        docker_session.close()
+    # 发送尚在合并窗口中的回调并关闭回调连接池；未投递的结果留在发件箱中，下次启动时重放
+    await callback_dispatcher.close()
+    await result_outbox.stop()
+    blocking_pool.shutdown()
 
 
 # 初始化FastAPI应用，并指定生命周期管理器
@@ -39,6 +94,10 @@ app = FastAPI(
 
 # 加载API路由，前缀为 /api
 app.include_router(evaluate.router, prefix="/api", tags=["Evaluation"])
+app.include_router(status.router, prefix="/api", tags=["Status"])
+app.include_router(results.router, prefix="/api", tags=["Results"])
+# Prometheus 抓取约定的路径，不加 /api 前缀
+app.include_router(metrics.router, tags=["Metrics"])
 
 # 可选：挂载 Gradio 调试页面（仅在 ENABLE_GRADIO=true 且已安装 gradio 时启用）
 if settings.ENABLE_GRADIO:
@@ -50,8 +109,10 @@ if settings.ENABLE_GRADIO:
         from pathlib import Path
         import gradio as gr
         # 根据后端选择同步评测函数（用于调试界面）
-        if (settings.SANDBOX_BACKEND or "").strip().upper() == "DOCKER":
+        if _use_docker_backend():
             from services.docker_sandbox import _run_in_docker_sync as _run_eval_sync
+        elif _use_namespace_backend():
+            from services.namespace_sandbox import _execute_judge_code as _run_eval_sync
         else:
             # 复用沙箱执行核心逻辑，保持与正式评测一致
             from services.sandbox import _execute_judge_code as _run_eval_sync
@@ -102,6 +163,7 @@ if settings.ENABLE_GRADIO:
                         yield emit("开始执行评测...")
                         # 根据后端选择执行评测：
                         # - DOCKER: 在容器中运行
+                        # - NAMESPACE: 在独立的 Linux 命名空间中运行
                         # - CHROOT: 在本机沙箱中运行
                         result = _run_eval_sync(submission_dir, judge_dir)
                         # 最终态：输出最终结果
@@ -2,6 +2,25 @@ from pydantic import BaseModel, Field
 from typing import Literal
 
 
+class ResourceUsage(BaseModel):
+    """
+    评测子进程（含其后代）的资源用量；后端无法提供的字段为 None。
+    CHROOT 后端来自 wait4 的 rusage（启用 cgroup 时 CPU 时间取自 cpu.stat）；DOCKER 后端来自运行期间对 docker stats 的采样。
+    """
+    wall_seconds: float | None = Field(None, description="评测子进程/容器的墙钟时间（秒）")
+    cpu_user_seconds: float | None = Field(None, description="用户态 CPU 时间（秒）")
+    cpu_system_seconds: float | None = Field(None, description="内核态 CPU 时间（秒）")
+    max_rss_bytes: int | None = Field(None, description="峰值内存（字节）；DOCKER 后端为采样得到的容器内存峰值")
+    block_read_bytes: int | None = Field(None, description="块设备读入字节数")
+    block_write_bytes: int | None = Field(None, description="块设备写出字节数")
+    memory_peak_bytes: int | None = Field(None, description="评测 cgroup 的 memory.peak（启用 CGROUP_ENABLED 时提供）")
+    oom_killed: bool | None = Field(None, description="是否因超出 cgroup 内存限制被 OOM 终止")
+    cpus: list[int] | None = Field(None, description="本次评测绑定的 CPU 核（启用 CPU_PINNING_ENABLED 时提供）")
+    output_truncated_bytes: int | None = Field(
+        None, description="评测子进程与评测包的输出超出 RUNNER_OUTPUT_MAX_BYTES 而被省略的字节数"
+    )
+
+
 class EvaluationResponse(BaseModel):
     """
     评测结果的统一响应模型。
@@ -9,6 +28,12 @@ class EvaluationResponse(BaseModel):
     status: Literal["COMPLETED", "ERROR"] = Field(..., description="评测状态，COMPLETED表示成功完成，ERROR表示出现异常")
     score: float = Field(0.0, description="评测分数，发生错误时为0")
     logs: str = Field("", description="评测过程中的日志或错误信息")
+    usage: ResourceUsage | None = Field(None, description="评测子进程的资源用量；未能启动评测时为空")
+    stages: dict[str, float] = Field(
+        default_factory=dict,
+        description="各阶段耗时（秒），如 queue_wait、extract、jail_acquire、run、cleanup",
+    )
+    cached: bool = Field(False, description="是否为结果缓存命中（复用相同提交与评测包的上次结果，未重新评测）")
 
     class Config:
         # Pydantic v2 a.k.a. model_config
@@ -17,6 +42,15 @@ class EvaluationResponse(BaseModel):
             "example": {
                 "status": "COMPLETED",
                 "score": 95.27,
-                "logs": "评测成功。所有测试用例通过。"
+                "logs": "评测成功。所有测试用例通过。",
+                "usage": {
+                    "wall_seconds": 3.42,
+                    "cpu_user_seconds": 2.91,
+                    "cpu_system_seconds": 0.37,
+                    "max_rss_bytes": 412286976,
+                    "block_read_bytes": 0,
+                    "block_write_bytes": 4096,
+                },
+                "stages": {"queue_wait": 0.8, "extract": 0.05, "jail_acquire": 0.0, "run": 3.45, "cleanup": 0.12},
             }
         }
\ No newline at end of file
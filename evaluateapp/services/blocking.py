@@ -0,0 +1,103 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, TypeVar
+
+from core.config import settings
+from .metrics import BLOCKING_STAGE, backend_name
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """一次评测中各阶段的耗时（秒），同名阶段累加。"""
+
+    def __init__(self):
+        self.durations: dict[str, float] = {}
+        self._started = time.monotonic()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    async def measure(self, stage: str, awaitable):
+        """计时一个不经过阻塞线程池的协程阶段（例如评测子进程本身）。"""
+        start = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.add(stage, time.monotonic() - start)
+
+    @property
+    def total(self) -> float:
+        return time.monotonic() - self._started
+
+    def as_dict(self) -> dict[str, float]:
+        return {stage: round(seconds, 4) for stage, seconds in self.durations.items()}
+
+    def summary(self) -> str:
+        parts = [f"{stage}={seconds:.3f}s" for stage, seconds in self.durations.items()]
+        parts.append(f"total={self.total:.3f}s")
+        return " ".join(parts)
+
+
+@dataclass
+class _StageStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class BlockingPool:
+    """
+    评测流水线中阻塞步骤（解压、搭建监狱、清理目录等）专用的有界线程池。
+
+    与默认线程池隔离：大文件解压或删除只会占用这里的线程，
+    事件循环和其他 to_thread 调用（上传落盘等）不受影响；按阶段统计次数与耗时。
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="eval-blocking")
+        self._in_flight = 0
+        self._stats: dict[str, _StageStats] = {}
+
+    async def run(self, stage: str, fn: Callable[..., T], *args: Any, timer: StageTimer | None = None) -> T:
+        """在线程池中执行 fn(*args)；耗时计入 stage 的统计以及（可选的）本次评测 timer。"""
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        start = time.monotonic()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        finally:
+            elapsed = time.monotonic() - start
+            self._in_flight -= 1
+            stats = self._stats.setdefault(stage, _StageStats())
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            BLOCKING_STAGE.observe(elapsed, backend=backend_name(), stage=stage)
+            if timer is not None:
+                timer.add(stage, elapsed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def status(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self._in_flight,
+            "stages": {
+                stage: {
+                    "count": stats.count,
+                    "avg_seconds": round(stats.total / stats.count, 4) if stats.count else 0.0,
+                    "max_seconds": round(stats.max, 4),
+                }
+                for stage, stats in self._stats.items()
+            },
+        }
+
+
+# 进程内共享的阻塞线程池；main.py 的 lifespan 在关闭时调用 shutdown()
+blocking_pool = BlockingPool(settings.BLOCKING_IO_WORKERS)
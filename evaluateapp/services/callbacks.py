@@ -0,0 +1,295 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable
+
+import httpx
+
+from core.config import settings
+from .metrics import CALLBACK_DELIVERY, backend_name
+
+# 值得重试的 HTTP 状态码：限流与服务端错误；其余 4xx（验签失败、请求体无效等）重试也不会成功
+_RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def _canonical_json(obj) -> str:
+    """canonical json：键排序、无多余空白，与 webapp 侧的验签逻辑保持一致。"""
+    if obj is None or not isinstance(obj, (dict, list)):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    if isinstance(obj, list):
+        return "[" + ",".join(_canonical_json(x) for x in obj) + "]"
+    keys = sorted(obj.keys())
+    return "{" + ",".join(json.dumps(k, ensure_ascii=False) + ":" + _canonical_json(obj[k]) for k in keys) + "}"
+
+
+def _signed_headers(payload: dict) -> dict:
+    payload_str = _canonical_json(payload)
+    content_hash = hashlib.sha256(payload_str.encode("utf-8")).hexdigest()
+    ts = str(int(time.time()))
+    sign = hmac.new(settings.SHARED_SECRET.encode("utf-8"), f"{ts}\n{content_hash}".encode("utf-8"), hashlib.sha256).hexdigest()
+    return {
+        "Content-Type": "application/json",
+        "X-Timestamp": ts,
+        "X-Sign": sign,
+        "X-Content-Hash": content_hash,
+    }
+
+
+@dataclass
+class _PendingBatch:
+    """同一回调地址上等待合并发送的结果。"""
+    items: list[tuple[str, dict, asyncio.Future]] = field(default_factory=list)
+    flush_task: asyncio.Task | None = None
+
+
+class CallbackDispatcher:
+    """
+    长期存在的回调发送器：
+
+    - 共享一个 httpx.AsyncClient（连接池与 keep-alive），不再为每条结果新建连接；
+    - 同时进行的 POST 不超过 max_concurrency；
+    - 网络错误、超时、429 与 5xx 按指数退避重试（full jitter），最多 max_attempts 次；
+    - batch_size > 1 时，batch_window 秒内完成的结果合并为一次签名 POST（{"results": [...]}，
+      与批量评测的聚合回调格式相同）；接收方以 400 拒绝批量负载时（不支持该格式的旧版 webapp）改为逐条发送；
+    - 统计投递延迟（从结果交给发送器到投递成功）与失败次数，供 /api/status 展示。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_attempts: int,
+        retry_base: float,
+        retry_max: float,
+        timeout: float,
+        batch_size: int = 1,
+        batch_window: float = 0.2,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._batches: dict[str, _PendingBatch] = {}
+        self._batch_tasks: set[asyncio.Task] = set()
+        # spawn() 交给后台的投递任务（含重试）
+        self._deliveries: set[asyncio.Task] = set()
+        self._in_flight = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.posts = 0
+        self.batch_fallbacks = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # 连接池与信号量绑定到事件循环；调试页面等在其他事件循环中调用时重新创建
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max, self.retry_base * (2 ** attempt)))
+
+    async def _post(self, label: str, payload: dict, callback_url: str) -> bool:
+        """签名并 POST 一个负载，失败时按退避策略重试；返回是否投递成功。"""
+        delivered, _ = await self._post_with_status(label, payload, callback_url)
+        return delivered
+
+    async def _post_with_status(self, label: str, payload: dict, callback_url: str) -> tuple[bool, int | None]:
+        """同 _post，另外返回最后一次尝试的 HTTP 状态码（网络错误、超时时为 None）。"""
+        client = self._ensure_client()
+        assert self._semaphore is not None
+        status_code = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+            retryable = True
+            status_code = None
+            async with self._semaphore:
+                self._in_flight += 1
+                self.posts += 1
+                try:
+                    # 每次尝试重新签名：重试可能晚于 webapp 允许的时间戳偏差
+                    response = await client.post(callback_url, json=payload, headers=_signed_headers(payload))
+                    response.raise_for_status()
+                    print(f"[Callback] Successfully sent callback for {label}")
+                    return True, response.status_code
+                except httpx.HTTPStatusError as e:
+                    response_body = e.response.text if e.response.text else "(empty body)"
+                    status_code = e.response.status_code
+                    retryable = status_code in _RETRYABLE_STATUS
+                    print(f"[Callback] Error sending callback for {label} (attempt {attempt + 1}): Status {e.response.status_code}, Body: {response_body}")
+                except httpx.TimeoutException as e:
+                    print(f"[Callback] Timeout sending callback for {label} (attempt {attempt + 1}): {e}")
+                except httpx.TransportError as e:
+                    print(f"[Callback] Connection error sending callback for {label} (attempt {attempt + 1}): {e}")
+                except Exception as e:
+                    retryable = False
+                    print(f"[Callback] An unexpected error occurred during callback for {label}: {e}")
+                finally:
+                    self._in_flight -= 1
+            if not retryable:
+                break
+        print(f"[Callback] Giving up on callback for {label}")
+        return False, status_code
+
+    async def _post_results(self, label: str, results: list[tuple[str, dict]], callback_url: str) -> list[bool]:
+        """
+        以 {"results": [...]} 一次发送多条结果，返回每条结果是否投递成功。
+        接收方以 400 拒绝批量负载时逐条重新发送：旧版 webapp 只接受单条格式，或批量中个别结果无效。
+        """
+        payload = {"results": [{"submissionId": submission_id, **result} for submission_id, result in results]}
+        delivered, status_code = await self._post_with_status(label, payload, callback_url)
+        if delivered or status_code != 400:
+            return [delivered] * len(results)
+        self.batch_fallbacks += 1
+        print(f"[Callback] Receiver rejected the batch payload for {label}, falling back to single callbacks")
+        return list(
+            await asyncio.gather(
+                *(
+                    self._post(f"submission {submission_id}", {"submissionId": submission_id, **result}, callback_url)
+                    for submission_id, result in results
+                )
+            )
+        )
+
+    def _record(self, delivered: bool, count: int, started: float) -> None:
+        latency = time.monotonic() - started
+        CALLBACK_DELIVERY.observe(latency, backend=backend_name(), outcome="delivered" if delivered else "failed")
+        if delivered:
+            self.delivered += count
+            self._latency_total += latency * count
+            self._latency_max = max(self._latency_max, latency)
+        else:
+            self.failed += count
+
+    async def send(self, submission_id: str, result: dict, callback_url: str) -> bool:
+        """投递单条评测结果；启用合并时等待所在批次发送完毕。返回是否投递成功。"""
+        started = time.monotonic()
+        if self.batch_size > 1:
+            future = asyncio.get_running_loop().create_future()
+            self._enqueue(callback_url, submission_id, result, future)
+            delivered = await future
+        else:
+            payload = {"submissionId": submission_id, **result}
+            delivered = await self._post(f"submission {submission_id}", payload, callback_url)
+        self._record(delivered, 1, started)
+        return delivered
+
+    async def send_batch(self, results: list[tuple[str, dict]], callback_url: str) -> bool:
+        """一次签名 POST 携带多条结果（批量评测的聚合回调）。"""
+        started = time.monotonic()
+        outcomes = await self._post_results(f"batch of {len(results)} submissions", results, callback_url)
+        delivered = all(outcomes)
+        self._record(delivered, len(results), started)
+        return delivered
+
+    def spawn(self, delivery: Awaitable[bool]) -> asyncio.Task:
+        """
+        在后台执行一次投递（含重试）并持有任务引用，调用方不必等待投递完成：
+        评测工作者把已落盘的结果交给发送器后即可处理下一个任务。
+        """
+        task = asyncio.create_task(delivery)
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+        return task
+
+    def _enqueue(self, callback_url: str, submission_id: str, result: dict, future: asyncio.Future) -> None:
+        batch = self._batches.setdefault(callback_url, _PendingBatch())
+        batch.items.append((submission_id, result, future))
+        if len(batch.items) >= self.batch_size:
+            self._flush_now(callback_url)
+        elif batch.flush_task is None:
+            batch.flush_task = asyncio.create_task(self._flush_later(callback_url))
+
+    async def _flush_later(self, callback_url: str) -> None:
+        await asyncio.sleep(self.batch_window)
+        self._flush_now(callback_url)
+
+    def _flush_now(self, callback_url: str) -> None:
+        batch = self._batches.pop(callback_url, None)
+        if batch is None or not batch.items:
+            return
+        if batch.flush_task is not None and batch.flush_task is not asyncio.current_task():
+            batch.flush_task.cancel()
+        task = asyncio.create_task(self._deliver_batch(batch.items, callback_url))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _deliver_batch(self, items: list[tuple[str, dict, asyncio.Future]], callback_url: str) -> None:
+        outcomes = [False] * len(items)
+        try:
+            if len(items) == 1:
+                submission_id, result, _ = items[0]
+                payload = {"submissionId": submission_id, **result}
+                outcomes = [await self._post(f"submission {submission_id}", payload, callback_url)]
+            else:
+                label = f"batch of {len(items)} coalesced submissions"
+                outcomes = await self._post_results(label, [(submission_id, result) for submission_id, result, _ in items], callback_url)
+        finally:
+            for (_, _, future), delivered in zip(items, outcomes):
+                if not future.done():
+                    future.set_result(delivered)
+
+    async def close(self) -> None:
+        """发送尚在合并窗口中的结果并关闭连接池（服务关闭时调用）。"""
+        for callback_url in list(self._batches):
+            self._flush_now(callback_url)
+        if self._batch_tasks or self._deliveries:
+            await asyncio.wait(self._batch_tasks | self._deliveries, timeout=self.timeout)
+        # 仍在重试的后台投递直接取消：结果已在发件箱中，下次启动时重放
+        for task in list(self._deliveries):
+            task.cancel()
+        if self._deliveries:
+            await asyncio.wait(set(self._deliveries))
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def status(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "batch_size": self.batch_size,
+            "in_flight": self._in_flight,
+            "background": len(self._deliveries),
+            "pending": sum(len(batch.items) for batch in self._batches.values()),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "posts": self.posts,
+            "batch_fallbacks": self.batch_fallbacks,
+            "avg_latency_seconds": round(self._latency_total / self.delivered, 4) if self.delivered else 0.0,
+            "max_latency_seconds": round(self._latency_max, 4),
+        }
+
+
+# 进程内共享的回调发送器；main.py 的 lifespan 在关闭时调用 close()
+callback_dispatcher = CallbackDispatcher(
+    max_concurrency=settings.CALLBACK_MAX_CONCURRENCY,
+    max_attempts=settings.CALLBACK_MAX_ATTEMPTS,
+    retry_base=settings.CALLBACK_RETRY_BASE_SECONDS,
+    retry_max=settings.CALLBACK_RETRY_MAX_SECONDS,
+    timeout=settings.CALLBACK_TIMEOUT,
+    batch_size=settings.CALLBACK_BATCH_SIZE,
+    batch_window=settings.CALLBACK_BATCH_WINDOW,
+)
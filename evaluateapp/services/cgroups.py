@@ -0,0 +1,184 @@
+import contextlib
+import itertools
+import os
+import time
+from pathlib import Path
+
+# 评测 cgroup 需要的控制器
+_CONTROLLERS = ("memory", "cpu", "pids")
+# cpu.max 的周期（微秒）
+_CPU_PERIOD_US = 100_000
+
+
+class CgroupSetupError(RuntimeError):
+    """cgroup v2 不可用（未挂载、无权限或控制器未委派）。"""
+
+
+def _write(path: Path, value: str) -> None:
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def _read_keyed(path: Path) -> dict[str, int]:
+    """读取 cpu.stat / memory.events 这类 "key value" 格式的文件。"""
+    values = {}
+    with contextlib.suppress(OSError):
+        for line in path.read_text().splitlines():
+            key, _, value = line.partition(" ")
+            with contextlib.suppress(ValueError):
+                values[key] = int(value)
+    return values
+
+
+def _owner_alive(name: str) -> bool:
+    """评测 cgroup 命名为 eval_<服务进程 pid>_<序号>。"""
+    try:
+        pid = int(name.split("_")[1])
+    except (IndexError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class EvaluationCgroup:
+    """一次评测独占的叶子 cgroup。"""
+
+    def __init__(self, path: Path, memory_limited: bool, memory_max: str | int | None = None):
+        self.path = path
+        self.memory_limited = memory_limited
+        self.memory_max = memory_max
+
+    @property
+    def procs_path(self) -> str:
+        """子进程在 preexec 中向该文件写入 "0" 即可把自己移入本 cgroup。"""
+        return str(self.path / "cgroup.procs")
+
+    def usage(self) -> dict:
+        """读取 memory.peak、cpu.stat 与 OOM 次数，字段与 EvaluationResponse.usage 对齐。"""
+        usage: dict = {}
+        cpu = _read_keyed(self.path / "cpu.stat")
+        if "user_usec" in cpu:
+            usage["cpu_user_seconds"] = round(cpu["user_usec"] / 1e6, 4)
+            usage["cpu_system_seconds"] = round(cpu.get("system_usec", 0) / 1e6, 4)
+        with contextlib.suppress(OSError, ValueError):
+            usage["memory_peak_bytes"] = int((self.path / "memory.peak").read_text())
+        events = _read_keyed(self.path / "memory.events")
+        if "oom_kill" in events:
+            usage["oom_killed"] = events["oom_kill"] > 0
+        return usage
+
+    def destroy(self, timeout: float = 2.0) -> None:
+        """终止残留进程并删除 cgroup（阻塞操作，应在线程中调用）。"""
+        kill_file = self.path / "cgroup.kill"
+        with contextlib.suppress(OSError):
+            if kill_file.exists():
+                _write(kill_file, "1")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                # 进程尚未完全退出时 rmdir 返回 EBUSY
+                if time.monotonic() >= deadline:
+                    print(f"[Cgroup] Failed to remove {self.path}: still busy")
+                    return
+                time.sleep(0.02)
+
+
+class CgroupManager:
+    """
+    cgroup v2 资源控制：为每次评测在 root 下创建一个叶子 cgroup，
+    设置 memory.max / cpu.max / pids.max，结束时读回 memory.peak 与 cpu.stat 并删除。
+
+    root 的父 cgroup 需要已委派 memory、cpu、pids 控制器；缺失的控制器对应的限制会被跳过，
+    仍可提供 cpu.stat 记账与 cgroup.kill 清理。
+    """
+
+    def __init__(self, root: str, memory_max: str, cpu_max: float, pids_max: int):
+        self.root = Path(root)
+        self.memory_max = memory_max
+        self.cpu_max = cpu_max
+        self.pids_max = pids_max
+        self.controllers: set[str] = set()
+        self._ready = False
+        self._ids = itertools.count(1)
+        self.created = 0
+        self.oom_kills = 0
+
+    def setup(self) -> None:
+        """创建评测 cgroup 的父目录并在其上启用控制器（幂等）。"""
+        if self._ready:
+            return
+        parent = self.root.parent
+        if not (parent / "cgroup.controllers").exists():
+            raise CgroupSetupError(f"{parent} 不是 cgroup v2 挂载点或其子目录")
+        available = set((parent / "cgroup.controllers").read_text().split())
+        wanted = [c for c in _CONTROLLERS if c in available]
+        try:
+            for controller in wanted:
+                with contextlib.suppress(OSError):
+                    _write(parent / "cgroup.subtree_control", f"+{controller}")
+            self.root.mkdir(exist_ok=True)
+            # 清理已退出的服务进程遗留的评测 cgroup（同一 root 可能被多个服务进程共用）
+            for child in self.root.iterdir():
+                if child.is_dir() and not _owner_alive(child.name):
+                    EvaluationCgroup(child, memory_limited=False).destroy()
+            enabled = set((self.root / "cgroup.controllers").read_text().split())
+            for controller in wanted:
+                if controller in enabled:
+                    _write(self.root / "cgroup.subtree_control", f"+{controller}")
+            self.controllers = set((self.root / "cgroup.subtree_control").read_text().split())
+        except OSError as e:
+            raise CgroupSetupError(f"无法初始化 {self.root}: {e}") from e
+        missing = [c for c in _CONTROLLERS if c not in self.controllers]
+        if missing:
+            print(f"[Cgroup] Controllers not delegated to {self.root}: {', '.join(missing)}; their limits are skipped")
+        self._ready = True
+
+    def create(self, memory_max: str | int | None = None, cpu_max: float | None = None) -> EvaluationCgroup:
+        """为一次评测创建 cgroup 并写入资源限制；memory_max / cpu_max 覆盖全局配置（题目资源配置）。"""
+        memory_max = memory_max or self.memory_max
+        cpu_max = cpu_max or self.cpu_max
+        self.setup()
+        path = self.root / f"eval_{os.getpid()}_{next(self._ids)}"
+        path.mkdir()
+        try:
+            if "memory" in self.controllers:
+                _write(path / "memory.max", str(memory_max))
+                # 禁用 swap，超过 memory.max 直接触发 OOM
+                with contextlib.suppress(OSError):
+                    _write(path / "memory.swap.max", "0")
+            if "cpu" in self.controllers and cpu_max > 0:
+                _write(path / "cpu.max", f"{int(cpu_max * _CPU_PERIOD_US)} {_CPU_PERIOD_US}")
+            if "pids" in self.controllers and self.pids_max > 0:
+                _write(path / "pids.max", str(self.pids_max))
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.rmdir(path)
+            raise
+        self.created += 1
+        return EvaluationCgroup(path, memory_limited="memory" in self.controllers, memory_max=memory_max)
+
+    def record(self, usage: dict) -> None:
+        if usage.get("oom_killed"):
+            self.oom_kills += 1
+
+    def status(self) -> dict:
+        return {
+            "root": str(self.root),
+            "ready": self._ready,
+            "controllers": sorted(self.controllers),
+            "memory_max": self.memory_max,
+            "cpu_max": self.cpu_max,
+            "pids_max": self.pids_max,
+            "created": self.created,
+            "oom_kills": self.oom_kills,
+        }
@@ -0,0 +1,271 @@
+import asyncio
+import contextlib
+import os
+import signal
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable
+
+# 子进程被终止后等待其输出管道关闭的最长时间
+DRAIN_TIMEOUT = 5.0
+
+
+# 评测结果通道的文件描述符号通过该环境变量告知 eval_runner.py
+RESULT_FD_ENV = "EVAL_RESULT_FD"
+# 无法传递管道时（DOCKER 后端）改用结果文件，路径通过该环境变量告知
+RESULT_PATH_ENV = "EVAL_RESULT_PATH"
+# 每次从管道读取的块大小
+_READ_CHUNK = 64 * 1024
+
+
+class HeadTailBuffer:
+    """
+    有界的输出捕获：保留开头与结尾各约 limit/2 字节，中间部分只计数（truncated）。
+    无论子进程输出多少，内存占用都不超过 limit。keep_tail=False 时只保留开头 limit 字节。
+    """
+
+    def __init__(self, limit: int, keep_tail: bool = True):
+        limit = max(0, limit)
+        self.head_limit = limit // 2 if keep_tail else limit
+        self.tail_limit = limit - self.head_limit
+        self._head = bytearray()
+        self._tail = bytearray()
+        self.truncated = 0
+
+    def feed(self, data: bytes) -> None:
+        room = self.head_limit - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self._tail += data
+        overflow = len(self._tail) - self.tail_limit
+        if overflow > 0:
+            del self._tail[:overflow]
+            self.truncated += overflow
+
+    def getvalue(self) -> bytes:
+        if not self.truncated:
+            return bytes(self._head + self._tail)
+        marker = f"\n...[输出过长，已省略 {self.truncated} 字节]...\n".encode("utf-8")
+        return bytes(self._head) + marker + bytes(self._tail)
+
+
+class RunnerPipes:
+    """评测子进程的三个输出管道：stdout、stderr 与专用的结果通道。"""
+
+    def __init__(self):
+        self.stdout_r, self.stdout_w = os.pipe()
+        self.stderr_r, self.stderr_w = os.pipe()
+        self.result_r, self.result_w = os.pipe()
+
+    @property
+    def child_ends(self) -> tuple[int, int, int]:
+        return self.stdout_w, self.stderr_w, self.result_w
+
+    def close_child_ends(self) -> None:
+        """写端已交给子进程后，本进程的副本必须关闭，否则读端永远等不到 EOF。"""
+        for fd in self.child_ends:
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+    def close_parent_ends(self) -> None:
+        for fd in (self.stdout_r, self.stderr_r, self.result_r):
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+    def start_readers(self, output_limit: int, result_limit: int) -> "RunnerCapture":
+        stdout = HeadTailBuffer(output_limit)
+        stderr = HeadTailBuffer(output_limit)
+        # 结果通道只保留开头：超出上限即视为结果无效
+        result = HeadTailBuffer(result_limit, keep_tail=False)
+        readers = [
+            pipe_reader(self.stdout_r, stdout),
+            pipe_reader(self.stderr_r, stderr),
+            pipe_reader(self.result_r, result),
+        ]
+        return RunnerCapture(stdout, stderr, result, readers)
+
+
+@dataclass
+class RunnerCapture:
+    stdout: HeadTailBuffer
+    stderr: HeadTailBuffer
+    result: HeadTailBuffer
+    readers: list[asyncio.Task]
+
+    def cancel(self) -> None:
+        for reader in self.readers:
+            reader.cancel()
+
+    def outcome(self, returncode: int | None, timed_out: bool, usage: dict | None) -> "RunnerOutcome":
+        result = None if self.result.truncated else (self.result.getvalue() or None)
+        return RunnerOutcome(
+            stdout=self.stdout.getvalue(),
+            stderr=self.stderr.getvalue(),
+            returncode=returncode,
+            timed_out=timed_out,
+            usage=usage,
+            result=result,
+            result_overflow=self.result.truncated > 0,
+            truncated_bytes=self.stdout.truncated + self.stderr.truncated,
+        )
+
+
+@dataclass
+class RunnerOutcome:
+    """一次评测子进程的原始输出与资源用量（spawn 与 fork-server 两种启动方式共用）。"""
+    stdout: bytes
+    stderr: bytes
+    returncode: int | None
+    timed_out: bool
+    usage: dict | None = None
+    # 结果通道中的 JSON；子进程未写入时为 None
+    result: bytes | None = None
+    # 结果通道的内容超过上限
+    result_overflow: bool = False
+    # stdout / stderr 中因超出上限被省略的字节数
+    truncated_bytes: int = 0
+
+
+def usage_from_rusage(
+    utime: float,
+    stime: float,
+    maxrss_kb: int,
+    inblock: int,
+    oublock: int,
+    wall_seconds: float,
+) -> dict:
+    """wait4 返回的 rusage（覆盖子进程及其已回收的后代）转换为 EvaluationResponse.usage 的字段。"""
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "cpu_user_seconds": round(utime, 4),
+        "cpu_system_seconds": round(stime, 4),
+        # Linux 上 ru_maxrss 以 KB 计，ru_inblock/ru_oublock 以 512 字节块计
+        "max_rss_bytes": maxrss_kb * 1024,
+        "block_read_bytes": inblock * 512,
+        "block_write_bytes": oublock * 512,
+    }
+
+
+def kill_group(pid: int) -> None:
+    # 子进程独立成进程组时其 pid 即进程组号；尚未 setsid 时只能按 pid 终止
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(pid, signal.SIGKILL)
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.kill(pid, signal.SIGKILL)
+
+
+def pipe_reader(fd: int, buffer: HeadTailBuffer) -> asyncio.Task:
+    """把管道读端按块读入 buffer，直到 EOF（子进程及其后代全部关闭写端）。"""
+
+    async def _read() -> None:
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        pipe = os.fdopen(fd, "rb", buffering=0)
+        transport = None
+        try:
+            transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+            while chunk := await reader.read(_READ_CHUNK):
+                buffer.feed(chunk)
+        finally:
+            if transport is not None:
+                transport.close()
+            else:
+                pipe.close()
+
+    return asyncio.ensure_future(_read())
+
+
+async def collect_output(
+    pid: int,
+    capture: RunnerCapture,
+    exited: "asyncio.Future",
+    timeout: float,
+) -> bool:
+    """
+    等待子进程的输出管道全部关闭；超过 timeout 时终止整个进程组。
+    返回是否超时。exited 在子进程被回收后完成。
+    """
+    try:
+        done, _ = await asyncio.wait(set(capture.readers), timeout=timeout)
+        timed_out = len(done) < len(capture.readers)
+        if timed_out:
+            kill_group(pid)
+        await exited
+        # 有后代进程脱离了进程组并仍持有管道时不再等待，已捕获的内容照常返回
+        await asyncio.wait(set(capture.readers), timeout=DRAIN_TIMEOUT)
+        return timed_out
+    finally:
+        capture.cancel()
+
+
+async def spawn(
+    argv: list[str],
+    preexec_fn: Callable[[], None],
+    timeout: float,
+    output_limit: int,
+    result_limit: int,
+    env: dict[str, str] | None = None,
+) -> RunnerOutcome:
+    """
+    启动子进程并直接在事件循环中等待，等待期间不占用任何工作线程/进程。
+
+    不经过 asyncio 的子进程 watcher：通过 pidfd 得知退出后自行 wait4 回收，
+    从而拿到子进程及其后代的 rusage。子进程独立成进程组，超时时整组终止。
+    stdout / stderr 各自最多保留 output_limit 字节；结果通道的写端以 RESULT_FD_ENV 告知子进程。
+
+    服务进程中同时有其他线程（阻塞线程池、回调、Gradio），fork 出的子进程里只有调用线程，
+    其他线程持有的锁（stdout、导入锁、logging 等）永远不会释放。因此 preexec_fn 只能做系统调用
+    （setrlimit、unshare、mount、chroot、setuid 等，所需的数据与 libc 句柄都在父进程中准备好），
+    不能输出日志、导入模块或修改 os.environ：环境变量在父进程中算好由 env 传入，进程组由 start_new_session 设置。
+    chroot 与挂载需要 root，必须先于降权执行，而 Popen 的 user / group / cwd 在 preexec_fn 之前生效，无法替代。
+    """
+    loop = asyncio.get_running_loop()
+    pipes = RunnerPipes()
+    result_fd = pipes.result_w
+    env = dict(os.environ if env is None else env)
+    env[RESULT_FD_ENV] = str(result_fd)
+
+    start = time.monotonic()
+    try:
+        proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=pipes.stdout_w,
+            stderr=pipes.stderr_w,
+            pass_fds=(result_fd,),
+            env=env,
+            preexec_fn=preexec_fn,
+            start_new_session=True,
+        )
+    except BaseException:
+        pipes.close_parent_ends()
+        raise
+    finally:
+        pipes.close_child_ends()
+    capture = pipes.start_readers(output_limit, result_limit)
+    pidfd = os.pidfd_open(proc.pid)
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    reaped = False
+    try:
+        timed_out = await collect_output(proc.pid, capture, exited, timeout)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        reaped = True
+        wall = time.monotonic() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        usage = usage_from_rusage(
+            rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss, rusage.ru_inblock, rusage.ru_oublock, wall
+        )
+        return capture.outcome(proc.returncode, timed_out, usage)
+    finally:
+        capture.cancel()
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        if not reaped:
+            # 任务被取消等情况：确保子进程不会残留
+            kill_group(proc.pid)
+            proc.wait()
@@ -0,0 +1,332 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from core.config import settings
+
+from .blocking import StageTimer
+from .resource_profile import ResourceProfile
+
+# 需要与分配的核数保持一致的线程数环境变量
+THREAD_ENV_KEYS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+def thread_env(count: int) -> dict[str, str]:
+    """科学计算库线程数环境变量，与评测可用的核数一致。"""
+    return {key: str(count) for key in THREAD_ENV_KEYS}
+
+
+def parse_cpu_list(spec: str) -> list[int]:
+    """解析 "0-3,6,8-9" 形式的 CPU 列表。"""
+    cpus: set[int] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+@dataclass(frozen=True)
+class CpuAllocation:
+    """一次评测独占的一组 CPU 核。"""
+    cpus: tuple[int, ...]
+
+    @property
+    def cpuset(self) -> str:
+        """Docker cpuset_cpus 格式，如 "2,3"。"""
+        return ",".join(str(cpu) for cpu in self.cpus)
+
+    def thread_env(self) -> dict[str, str]:
+        """线程数环境变量按分配到的核数设置。"""
+        return thread_env(len(self.cpus))
+
+
+class CpuSlotScheduler:
+    """
+    把 CPU 核当作可分配的槽位：每次评测按先来先服务独占 slot_size 个核，
+    分配结果互不相交，评测进程通过 sched_setaffinity / cpuset_cpus 绑定到这些核上。
+
+    不依赖特定事件循环：调试页面在另一线程中用 asyncio.run 评测时与主事件循环共用同一调度器，
+    状态由 threading.Lock 保护，等待者按提交顺序经各自事件循环的 call_soon_threadsafe 唤醒。
+    """
+
+    def __init__(self, cpus: list[int], slot_size: int):
+        self.cpus = sorted(cpus)
+        self.slot_size = max(1, min(slot_size, len(self.cpus)))
+        self._free: set[int] = set(self.cpus)
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.waited = 0
+
+    def _pick(self, count: int) -> tuple[int, ...] | None:
+        if len(self._free) < count:
+            return None
+        free = sorted(self._free)
+        # 优先选择编号连续的一段（通常位于同一物理核/缓存域）
+        for i in range(len(free) - count + 1):
+            window = free[i:i + count]
+            if window[-1] - window[0] == count - 1:
+                return tuple(window)
+        return tuple(free[:count])
+
+    def _take(self, count: int) -> CpuAllocation | None:
+        cpus = self._pick(count)
+        if cpus is None:
+            return None
+        self._free.difference_update(cpus)
+        self.allocations += 1
+        return CpuAllocation(cpus)
+
+    async def acquire(self, count: int | None = None) -> CpuAllocation:
+        count = max(1, min(count or self.slot_size, len(self.cpus)))
+        with self._lock:
+            if not self._waiters:
+                allocation = self._take(count)
+                if allocation is not None:
+                    return allocation
+            self.waited += 1
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((count, future))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配但调用方被取消：归还
+                self.release(future.result())
+            else:
+                self._remove_waiter(future)
+            raise
+
+    def _remove_waiter(self, future: asyncio.Future) -> None:
+        with self._lock:
+            self._waiters = deque(w for w in self._waiters if w[1] is not future)
+            self._wake()
+
+    def release(self, allocation: CpuAllocation) -> None:
+        with self._lock:
+            self._free.update(allocation.cpus)
+            self._wake()
+
+    def _wake(self) -> None:
+        # 调用方持有 self._lock；严格按顺序分配，避免需要较多核的评测被持续插队
+        while self._waiters:
+            count, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            allocation = self._take(count)
+            if allocation is None:
+                return
+            self._waiters.popleft()
+            future.get_loop().call_soon_threadsafe(_resolve, future, allocation, self)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "cpus": self.cpus,
+                "slot_size": self.slot_size,
+                "free": sorted(self._free),
+                "waiting": len(self._waiters),
+                "allocations": self.allocations,
+                "waited": self.waited,
+            }
+
+
+@dataclass(frozen=True)
+class ResourceGrant:
+    """一次评测在准入预算中占用的核数与内存。"""
+    cpus: float
+    memory_bytes: int
+
+
+class ResourceBudget:
+    """
+    按题目资源配置（threads、memoryMB）准入评测：同时运行的评测占用的核数与内存之和不超过预算，
+    不足时按到达顺序等待，需求大的评测不会被持续插队。单个评测的需求超过预算时按整个预算计，即独占运行。
+    与 CpuSlotScheduler 一样可以跨线程、跨事件循环共用，状态由 threading.Lock 保护。
+    """
+
+    def __init__(self, cpus: float, memory_bytes: int, default_cpus: float, default_memory_bytes: int):
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self.default_cpus = default_cpus
+        self.default_memory_bytes = default_memory_bytes
+        self._used_cpus = 0.0
+        self._used_memory = 0
+        self._running = 0
+        self._waiters: deque[tuple[ResourceGrant, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.waited = 0
+
+    def grant_for(self, profile: ResourceProfile) -> ResourceGrant:
+        """题目未配置的项按默认值占用。"""
+        return ResourceGrant(
+            cpus=min(profile.threads or self.default_cpus, self.cpus),
+            memory_bytes=min(profile.memory_bytes or self.default_memory_bytes, self.memory_bytes),
+        )
+
+    def _take(self, grant: ResourceGrant) -> bool:
+        if self._used_cpus + grant.cpus > self.cpus or self._used_memory + grant.memory_bytes > self.memory_bytes:
+            return False
+        self._used_cpus += grant.cpus
+        self._used_memory += grant.memory_bytes
+        self._running += 1
+        self.admitted += 1
+        return True
+
+    async def acquire(self, grant: ResourceGrant) -> ResourceGrant:
+        with self._lock:
+            if not self._waiters and self._take(grant):
+                return grant
+            self.waited += 1
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((grant, future))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已准入但调用方被取消：归还
+                self.release(future.result())
+            else:
+                self._remove_waiter(future)
+            raise
+
+    def _remove_waiter(self, future: asyncio.Future) -> None:
+        with self._lock:
+            self._waiters = deque(w for w in self._waiters if w[1] is not future)
+            self._wake()
+
+    def release(self, grant: ResourceGrant) -> None:
+        with self._lock:
+            self._used_cpus -= grant.cpus
+            self._used_memory -= grant.memory_bytes
+            self._running -= 1
+            self._wake()
+
+    def _wake(self) -> None:
+        # 调用方持有 self._lock
+        while self._waiters:
+            grant, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._take(grant):
+                return
+            self._waiters.popleft()
+            future.get_loop().call_soon_threadsafe(_resolve, future, grant, self)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "cpus": self.cpus,
+                "memory_bytes": self.memory_bytes,
+                "used_cpus": round(self._used_cpus, 4),
+                "used_memory_bytes": self._used_memory,
+                "running": self._running,
+                "waiting": len(self._waiters),
+                "admitted": self.admitted,
+                "waited": self.waited,
+            }
+
+
+def _resolve(
+    future: asyncio.Future,
+    allocation: CpuAllocation | ResourceGrant,
+    scheduler: CpuSlotScheduler | ResourceBudget,
+) -> None:
+    if future.done():
+        # 等待者已取消：把核（或预算）还回去
+        scheduler.release(allocation)
+    else:
+        future.set_result(allocation)
+
+
+def _scheduler_cpus() -> list[int]:
+    if settings.CPU_PINNING_CPUS.strip():
+        return parse_cpu_list(settings.CPU_PINNING_CPUS)
+    return sorted(os.sched_getaffinity(0))
+
+
+def cpu_pinning_enabled() -> bool:
+    return settings.CPU_PINNING_ENABLED
+
+
+def resource_admission_enabled() -> bool:
+    return settings.RESOURCE_ADMISSION_ENABLED
+
+
+def _budget_memory_bytes() -> int:
+    if settings.RESOURCE_BUDGET_MEMORY_MB > 0:
+        return settings.RESOURCE_BUDGET_MEMORY_MB * 1024 * 1024
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+# 进程内共享的绑核调度器（两种评测后端共用）
+cpu_scheduler = CpuSlotScheduler(_scheduler_cpus(), settings.CPU_SLOT_SIZE)
+
+# 进程内共享的准入预算：默认为参与调度的全部核与本机物理内存
+resource_budget = ResourceBudget(
+    cpus=settings.RESOURCE_BUDGET_CPUS or len(cpu_scheduler.cpus),
+    memory_bytes=_budget_memory_bytes(),
+    default_cpus=max(1, settings.CPU_SLOT_SIZE),
+    default_memory_bytes=settings.RESOURCE_DEFAULT_MEMORY_MB * 1024 * 1024,
+)
+
+
+@contextlib.asynccontextmanager
+async def cpu_slot(timer: StageTimer | None = None, count: int | None = None) -> AsyncIterator[CpuAllocation | None]:
+    """
+    在评测子进程/容器运行期间占用一组 CPU 核；未启用绑核时产出 None。
+    等待空闲核的时间计入 timer 的 cpu_wait 阶段。
+    """
+    if not cpu_pinning_enabled():
+        yield None
+        return
+    start = time.monotonic()
+    allocation = await cpu_scheduler.acquire(count)
+    if timer is not None:
+        timer.add("cpu_wait", time.monotonic() - start)
+    try:
+        yield allocation
+    finally:
+        cpu_scheduler.release(allocation)
+
+
+@contextlib.asynccontextmanager
+async def resource_slot(timer: StageTimer | None, profile: ResourceProfile) -> AsyncIterator[CpuAllocation | None]:
+    """
+    评测子进程/容器运行期间占用的资源：先按题目配置的 threads 与 memoryMB 通过准入预算，
+    再（启用绑核时）分配 CPU 核，产出值与 cpu_slot 相同。等待准入的时间计入 timer 的 admission_wait 阶段。
+    """
+    if not resource_admission_enabled():
+        async with cpu_slot(timer, profile.threads) as cpus:
+            yield cpus
+        return
+    grant = resource_budget.grant_for(profile)
+    start = time.monotonic()
+    await resource_budget.acquire(grant)
+    if timer is not None:
+        timer.add("admission_wait", time.monotonic() - start)
+    try:
+        async with cpu_slot(timer, profile.threads) as cpus:
+            yield cpus
+    finally:
+        resource_budget.release(grant)
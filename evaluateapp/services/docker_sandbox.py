@@ -2,16 +2,31 @@ import asyncio
 import contextlib
 import io
 import json
+import shutil
+import socket
+import tarfile
 import tempfile
+import threading
+import time
 import zipfile
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable
 
 from core.config import settings, BASE_DIR
 
 # 复用安全解压与回调逻辑
-from .sandbox import _safe_extractall
-from .sandbox import post_results_to_webapp
+from .blocking import StageTimer, blocking_pool
+from .child_process import DRAIN_TIMEOUT, RESULT_PATH_ENV, HeadTailBuffer, RunnerOutcome
+from .cpu_slots import CpuAllocation, resource_slot, thread_env
+from .jail_pool import JailPool
+from .resource_profile import ResourceProfile, ResourceProfileError, load_profile
+from .sandbox import RUNNER_OUTPUT_LIMIT, RUNNER_RESULT_LIMIT, _runner_result, _safe_extractall
+from .sandbox import (
+    post_batch_results_to_webapp,
+    post_results_to_webapp,
+    submit_batch_results_to_webapp,
+    submit_results_to_webapp,
+)
 
 
 def _fill_eval_runner(judge_dir_in_container: str, submission_dir_in_container: str, python_executable: str) -> str:
@@ -23,6 +38,7 @@ def _fill_eval_runner(judge_dir_in_container: str, submission_dir_in_container:
         judge_dir_json=json.dumps(judge_dir_in_container),
         submission_dir_json=json.dumps(submission_dir_in_container),
         python_executable_json=json.dumps(python_executable),
+        output_limit=int(settings.RUNNER_OUTPUT_MAX_BYTES),
     )
 
 
@@ -134,21 +150,485 @@ def _resolve_self_image(client) -> str | None:
     return None
 
 
-def _run_in_docker_sync(submission_dir: Path, judge_dir: Path) -> dict:
+_FALLBACK_IMAGE = "swr.cn-north-4.myhuaweicloud.com/ddn-k8s/docker.io/library/python:3.12-slim-bookworm"
+
+
+def _evaluation_image(client) -> str:
+    """Image evaluations run in: DOCKER_IMAGE, resolving `self`, pulled when missing or DOCKER_PULL is set."""
+    image = settings.DOCKER_IMAGE
+    # If configured to reuse this running container's image, resolve it
+    if str(image or "").strip().lower() == "self":
+        image = _resolve_self_image(client) or _FALLBACK_IMAGE
+    if settings.DOCKER_PULL:
+        try:
+            client.images.pull(image)
+        except Exception as e:
+            print(f"[DockerSandbox] Failed to pull {image}: {e}")
+    # Validate once here so evaluations never wait on a pull (or fail late on a typo)
+    try:
+        client.images.get(image)
+    except Exception:
+        print(f"[DockerSandbox] Image {image} is not present locally, pulling")
+        client.images.pull(image)
+    return image
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """True when the daemon could not be reached (restarted, socket gone), as opposed to a rejected request."""
+    import requests
+
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+
+class DockerSession:
+    """Process-wide Docker client and the resolved evaluation image.
+
+    Connecting (including the `self` image lookup / build and pull) happens once, at
+    startup or on first use; evaluations only read the cached client and image tag.
+    When a call fails because the daemon is unreachable, the session is dropped and the
+    next caller reconnects and re-resolves the image.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._image: str | None = None
+        self.connects = 0
+        self.disconnects = 0
+        self.last_error: str | None = None
+        self.connected_at: float | None = None
+
+    def get(self) -> tuple:
+        """Return (client, image), connecting first if needed (blocking)."""
+        with self._lock:
+            if self._client is None:
+                self._connect_locked()
+            return self._client, self._image
+
+    def client(self):
+        return self.get()[0]
+
+    def _connect_locked(self) -> None:
+        import docker
+
+        started = time.monotonic()
+        try:
+            client = docker.from_env()
+            client.ping()
+            image = _evaluation_image(client)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self._client, self._image = client, image
+        self.connects += 1
+        self.connected_at = time.time()
+        self.last_error = None
+        print(f"[DockerSandbox] Connected to Docker daemon, evaluation image {image} ({time.monotonic() - started:.2f}s)")
+
+    def report_error(self, error: BaseException) -> None:
+        """Drop the session if `error` means the daemon went away."""
+        with contextlib.suppress(Exception):
+            if not _is_connection_error(error):
+                return
+            with self._lock:
+                if self._client is None:
+                    return
+                # Not closed: pool containers still hold a reference to the old client
+                self._client, self._image = None, None
+                self.disconnects += 1
+                self.last_error = f"{type(error).__name__}: {error}"
+            print(f"[DockerSandbox] Lost connection to Docker daemon, reconnecting on next use: {error}")
+
+    async def start(self) -> None:
+        try:
+            await blocking_pool.run("docker_connect", self.get)
+        except Exception as e:
+            print(f"[DockerSandbox] Failed to connect to Docker daemon at startup, retrying on first evaluation: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client, self._image = self._client, None, None
+        if client is not None:
+            with contextlib.suppress(Exception):
+                client.close()
+
+    def status(self) -> dict:
+        return {
+            "connected": self._client is not None,
+            "image": self._image,
+            "connects": self.connects,
+            "disconnects": self.disconnects,
+            "connected_at": self.connected_at,
+            "last_error": self.last_error,
+        }
+
+
+# Shared by all evaluations; main.py's lifespan calls start() and close() for the DOCKER backend
+docker_session = DockerSession()
+
+
+# ---------------------------------------------------------------------------
+# Per-problem images (resources.json `image`)
+# ---------------------------------------------------------------------------
+
+# With DOCKER_IMAGE_BUILD_ENABLED, a judge package shipping this file at its root has its image built instead of pulled
+IMAGE_DOCKERFILE = "Dockerfile"
+
+
+def _cached_judge_images() -> dict[str, Path]:
+    """Images named by judge packages already in the judge cache -> one judge dir naming it (blocking)."""
+    images: dict[str, Path] = {}
+    root = Path(settings.JUDGE_CACHE_DIR)
+    if not root.is_dir():
+        return images
+    for child in root.iterdir():
+        if child.is_dir() and not child.name.startswith("."):
+            try:
+                image = load_profile(str(child)).image
+            except ResourceProfileError:
+                continue
+            if image:
+                images.setdefault(image, child)
+    return images
+
+
+class ImageManager:
+    """Tracks which evaluation images are local and pulls / builds missing ones in the background.
+
+    Problems may name their own image. Jobs for such a problem are held in the queue
+    (without occupying a worker) until the image is local, so the first submission of a
+    contest does not sit through a multi-minute pull inside the container start. At startup
+    the images in DOCKER_PREWARM_IMAGES and those named by cached judge packages are warmed.
+    Images known to be local are not looked up again on the hot path.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        # image -> wall time it was confirmed local
+        self._local: dict[str, float] = {}
+        self._warming: dict[str, asyncio.Future] = {}
+        self._errors: dict[str, str] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._prewarm_task: asyncio.Task | None = None
+        self.pulled = 0
+        self.built = 0
+        self.failed = 0
+
+    def is_local(self, image: str) -> bool:
+        return image in self._local
+
+    async def ensure(self, image: str, build_context: Path | None = None) -> None:
+        """Wait until `image` is local, starting a pull (or build) unless one is already running."""
+        if image in self._local:
+            return
+        future = self._warming.get(image)
+        if future is None:
+            future = asyncio.ensure_future(self._warm(image, build_context))
+            self._warming[image] = future
+            future.add_done_callback(lambda done: self._forget(image, done))
+        # A waiter being cancelled (e.g. shutdown) must not abort the shared pull
+        await asyncio.shield(future)
+
+    def _forget(self, image: str, future: asyncio.Future) -> None:
+        if self._warming.get(image) is future:
+            del self._warming[image]
+        if not future.cancelled():
+            # Retrieved here so an unawaited failure is not reported as "never retrieved"
+            future.exception()
+
+    async def _warm(self, image: str, build_context: Path | None) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                # Pulls take minutes: keep them off the bounded blocking pool used by extraction
+                action = await asyncio.to_thread(self._warm_sync, image, build_context)
+            except Exception as e:
+                self.failed += 1
+                self._errors[image] = f"{type(e).__name__}: {e}"
+                print(f"[ImageManager] Failed to warm {image}: {type(e).__name__}: {e}")
+                raise
+        self._errors.pop(image, None)
+        self._local[image] = time.time()
+        if action:
+            print(f"[ImageManager] {action} {image} in {time.monotonic() - started:.1f}s")
+
+    def _warm_sync(self, image: str, build_context: Path | None) -> str:
+        import docker
+
+        client = docker_session.client()
+        try:
+            client.images.get(image)
+            return ""
+        except docker.errors.ImageNotFound:
+            pass
+        if settings.DOCKER_IMAGE_BUILD_ENABLED and build_context is not None and (build_context / IMAGE_DOCKERFILE).is_file():
+            client.images.build(path=str(build_context), dockerfile=IMAGE_DOCKERFILE, tag=image, rm=True, forcerm=True)
+            self.built += 1
+            return "Built"
+        client.images.pull(image)
+        self.pulled += 1
+        return "Pulled"
+
+    def _refresh_sync(self) -> None:
+        """Record every tagged image the daemon already has (one list call)."""
+        client, default_image = docker_session.get()
+        now = time.time()
+        self._local[default_image] = now
+        for image in client.images.list():
+            for tag in getattr(image, "tags", None) or []:
+                self._local.setdefault(tag, now)
+
+    async def start(self) -> None:
+        if self._prewarm_task is None:
+            self._prewarm_task = asyncio.create_task(self._prewarm(), name="docker-image-prewarm")
+
+    async def _prewarm(self) -> None:
+        try:
+            await asyncio.to_thread(self._refresh_sync)
+        except Exception as e:
+            print(f"[ImageManager] Failed to list local images: {type(e).__name__}: {e}")
+            return
+        targets: dict[str, Path | None] = {
+            image.strip(): None for image in (settings.DOCKER_PREWARM_IMAGES or "").split(",") if image.strip()
+        }
+        try:
+            targets.update(await blocking_pool.run("image_scan", _cached_judge_images))
+        except Exception as e:
+            print(f"[ImageManager] Failed to scan the judge cache for images: {type(e).__name__}: {e}")
+        missing = {image: context for image, context in targets.items() if image not in self._local}
+        if missing:
+            print(f"[ImageManager] Prewarming {len(missing)} images: {', '.join(sorted(missing))}")
+            await asyncio.gather(*(self.ensure(image, context) for image, context in missing.items()), return_exceptions=True)
+
+    async def stop(self) -> None:
+        if self._prewarm_task is not None:
+            self._prewarm_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._prewarm_task
+            self._prewarm_task = None
+
+    def status(self) -> dict:
+        return {
+            "local_images": len(self._local),
+            "warming": sorted(self._warming),
+            "errors": dict(self._errors),
+            "pulled": self.pulled,
+            "built": self.built,
+            "failed": self.failed,
+        }
+
+
+# main.py's lifespan calls start() / stop() for the DOCKER backend
+image_manager = ImageManager(concurrency=settings.DOCKER_IMAGE_WARM_CONCURRENCY)
+
+
+def runtime_ready(judge_dir: Path) -> Callable[[], Awaitable[None]] | None:
+    """Queue prerequisite for an evaluation of `judge_dir`: its own image must be local (None when nothing to wait for)."""
+    image = load_profile(str(judge_dir)).image
+    if not image or image_manager.is_local(image):
+        return None
+    return lambda: image_manager.ensure(image, Path(judge_dir))
+
+
+def _container_env(cpus: CpuAllocation | None, profile: ResourceProfile) -> dict:
+    env = {
+        # cap thread counts
+        "OMP_NUM_THREADS": "1",
+        "OPENBLAS_NUM_THREADS": "1",
+        "MKL_NUM_THREADS": "1",
+        "NUMEXPR_NUM_THREADS": "1",
+        "VECLIB_MAXIMUM_THREADS": "1",
+        "MALLOC_ARENA_MAX": "2",
+    }
+    if cpus is not None:
+        env.update(cpus.thread_env())
+    elif profile.threads:
+        env.update(thread_env(profile.threads))
+    return env
+
+
+def _cpu_limits(cpus: CpuAllocation | None, profile: ResourceProfile) -> tuple[int, str | None]:
+    """nano_cpus and cpuset_cpus for one evaluation."""
+    cpu_count = max(0.1, float(profile.threads or settings.DOCKER_CPUS or 1.0))
+    cpuset_cpus = None
+    if cpus is not None:
+        # The CPU quota matches the pinned cores so the container can actually use all of them
+        cpuset_cpus = cpus.cpuset
+        cpu_count = len(cpus.cpus)
+    return int(cpu_count * 1e9), cpuset_cpus  # docker uses 1e9 = 1 CPU
+
+
+# CFS period used when CPU limits are applied with `docker update` (same as docker's --cpus)
+_CPU_PERIOD_US = 100_000
+
+
+def _wait_timeout(profile: ResourceProfile) -> float:
+    # 310s by default, similar to chroot timeout
+    return profile.wall_time_seconds or (profile.cpu_time_seconds + 10 if profile.cpu_time_seconds else 310)
+
+
+# Result channel: the runner writes its JSON here instead of stdout (a bind mount or /workspace volume)
+_RESULT_DIR = "/workspace/result"
+_RESULT_FILE = "result.json"
+
+
+class _LogFollower(threading.Thread):
+    """Follow one of a container's output streams into a bounded head/tail buffer while it runs."""
+
+    def __init__(self, container, stream: str, buffer: HeadTailBuffer):
+        super().__init__(name=f"docker-{stream}-{container.id[:12]}", daemon=True)
+        self._container = container
+        self._stream = stream
+        self.buffer = buffer
+
+    def run(self) -> None:
+        try:
+            # Asking for a single stream keeps stdout and stderr apart without demultiplexing
+            for chunk in self._container.logs(
+                stream=True, follow=True, stdout=self._stream == "stdout", stderr=self._stream == "stderr"
+            ):
+                self.buffer.feed(chunk)
+        except Exception:
+            # output is informational; the result comes from the result channel
+            pass
+
+
+def _read_result_file(path: Path) -> tuple[bytes | None, bool]:
+    """(result JSON, overflow) from a result file on the host; (None, False) when the runner wrote none."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(RUNNER_RESULT_LIMIT + 1)
+    except FileNotFoundError:
+        return None, False
+    if len(data) > RUNNER_RESULT_LIMIT:
+        return None, True
+    return data or None, False
+
+
+def _fetch_result_file(container) -> tuple[bytes | None, bool]:
+    """Same as _read_result_file for a file inside the container, fetched with get_archive."""
+    import docker
+
+    try:
+        chunks, stat = container.get_archive(f"{_RESULT_DIR}/{_RESULT_FILE}")
+    except docker.errors.NotFound:
+        return None, False
+    if stat.get("size", 0) > RUNNER_RESULT_LIMIT:
+        return None, True
+    with tempfile.TemporaryFile() as archive:
+        for chunk in chunks:
+            archive.write(chunk)
+        archive.seek(0)
+        with tarfile.open(fileobj=archive) as tar:
+            member = tar.next()
+            source = tar.extractfile(member) if member is not None else None
+            data = source.read(RUNNER_RESULT_LIMIT + 1) if source is not None else b""
+    return data or None, False
+
+
+def _container_result(
+    stdout: HeadTailBuffer,
+    stderr: HeadTailBuffer,
+    result: tuple[bytes | None, bool],
+    exit_code,
+    timed_out: bool,
+    usage: dict,
+    timeout: float,
+) -> dict:
+    """Shape the captured output like the chroot backend does, so both backends report identically."""
+    outcome = RunnerOutcome(
+        stdout=stdout.getvalue(),
+        stderr=stderr.getvalue(),
+        returncode=exit_code,
+        timed_out=timed_out,
+        usage=usage,
+        result=result[0],
+        result_overflow=result[1],
+        truncated_bytes=stdout.truncated + stderr.truncated,
+    )
+    return _runner_result(outcome, timeout)[0]
+
+
+class _ContainerStatsSampler(threading.Thread):
+    """Follow `docker stats` for a running container and keep cumulative CPU, peak memory and block I/O.
+
+    Exited containers report zeroed stats, so usage has to be sampled while the
+    container runs; values are best effort (the stream ticks roughly once a second).
+    """
+
+    # memory_stats fields tried in order for the peak; the streaming API reports max_usage on cgroup v1 only
+    _peak_fields = ("max_usage", "usage")
+
+    def __init__(self, container):
+        super().__init__(name=f"docker-stats-{container.id[:12]}", daemon=True)
+        self._container = container
+        self.cpu_user_ns: int | None = None
+        self.cpu_system_ns: int | None = None
+        self.peak_memory: int | None = None
+        self.block_read: int | None = None
+        self.block_write: int | None = None
+
+    def run(self) -> None:
+        try:
+            for sample in self._container.stats(stream=True, decode=True):
+                self._record(sample)
+        except Exception:
+            # stats are informational; never fail an evaluation because of them
+            pass
+
+    def _record(self, sample: dict) -> None:
+        cpu = (sample.get("cpu_stats") or {}).get("cpu_usage") or {}
+        if cpu.get("total_usage"):
+            self.cpu_user_ns = cpu.get("usage_in_usermode", self.cpu_user_ns)
+            self.cpu_system_ns = cpu.get("usage_in_kernelmode", self.cpu_system_ns)
+        memory = sample.get("memory_stats") or {}
+        peak = next((memory[field] for field in self._peak_fields if memory.get(field)), None)
+        if peak:
+            self.peak_memory = max(self.peak_memory or 0, peak)
+        entries = (sample.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+        if entries:
+            self.block_read = sum(e.get("value", 0) for e in entries if str(e.get("op", "")).lower() == "read")
+            self.block_write = sum(e.get("value", 0) for e in entries if str(e.get("op", "")).lower() == "write")
+
+    def usage(self, wall_seconds: float) -> dict:
+        def _seconds(ns: int | None) -> float | None:
+            return round(ns / 1e9, 4) if ns is not None else None
+
+        return {
+            "wall_seconds": round(wall_seconds, 4),
+            "cpu_user_seconds": _seconds(self.cpu_user_ns),
+            "cpu_system_seconds": _seconds(self.cpu_system_ns),
+            "max_rss_bytes": self.peak_memory,
+            "block_read_bytes": self.block_read,
+            "block_write_bytes": self.block_write,
+        }
+
+
+def _run_in_docker_sync(
+    submission_dir: Path,
+    judge_dir: Path,
+    cpus: CpuAllocation | None = None,
+    profile: ResourceProfile | None = None,
+) -> dict:
     """
     Run evaluation inside a Docker container and return result dict.
 
     - Mounts submission and judge directories read-only under /workspace/* in container
     - Generates eval_runner.py and mounts it to /workspace/eval_runner.py
     - Executes `python /workspace/eval_runner.py`
+    - Streams stdout and stderr separately into buffers capped at RUNNER_OUTPUT_MAX_BYTES;
+      the result is read from a file in a dedicated bind mount, never parsed out of the logs
+    - When `cpus` is given, pins the container to those cores via cpuset_cpus
+    - Limits from the problem's resource `profile` override the global DOCKER_* settings
     """
     import docker
+    import requests
 
-    image_cfg = settings.DOCKER_IMAGE
-    image = image_cfg
-    mem_limit = settings.DOCKER_MEMORY
-    cpus = max(0.1, float(settings.DOCKER_CPUS or 1.0))
-    nano_cpus = int(cpus * 1e9)  # docker uses 1e9 = 1 CPU
+    profile = profile or load_profile(str(judge_dir))
+    mem_limit = profile.memory_bytes or settings.DOCKER_MEMORY
+    nano_cpus, cpuset_cpus = _cpu_limits(cpus, profile)
     network_mode = settings.DOCKER_NETWORK_MODE or "none"
     user = settings.DOCKER_USER
 
@@ -163,95 +643,88 @@ def _run_in_docker_sync(submission_dir: Path, judge_dir: Path) -> dict:
         )
         runner_host_path.write_text(runner_code, encoding="utf-8")
 
-        client = docker.from_env()
-
-        # If configured to reuse this running container's image, resolve it
-        if (str(image_cfg or "").strip().lower() == "self"):
-            resolved = _resolve_self_image(client)
-            if resolved:
-                image = resolved
-            else:
-                # fallback default
-                image = "swr.cn-north-4.myhuaweicloud.com/ddn-k8s/docker.io/library/python:3.12-slim-bookworm"
-
-        # Optionally pull image
-        if settings.DOCKER_PULL:
-            try:
-                client.images.pull(image)
-            except Exception:
-                pass
+        # Writable by whichever user the container runs as; only the runner's result lands here
+        result_host_dir = tmpdir_path / "result"
+        result_host_dir.mkdir()
+        result_host_dir.chmod(0o777)
 
         # Build volume bindings
         volumes = {
             str(submission_dir.resolve()): {"bind": "/workspace/submission", "mode": "ro"},
             str(judge_dir.resolve()): {"bind": "/workspace/judge", "mode": "ro"},
             str(runner_host_path.resolve()): {"bind": "/workspace/eval_runner.py", "mode": "ro"},
+            str(result_host_dir.resolve()): {"bind": _RESULT_DIR, "mode": "rw"},
         }
 
-        env = {
-            # cap thread counts
-            "OMP_NUM_THREADS": "1",
-            "OPENBLAS_NUM_THREADS": "1",
-            "MKL_NUM_THREADS": "1",
-            "NUMEXPR_NUM_THREADS": "1",
-            "VECLIB_MAXIMUM_THREADS": "1",
-            "MALLOC_ARENA_MAX": "2",
-        }
+        env = _container_env(cpus, profile)
+        env[RESULT_PATH_ENV] = f"{_RESULT_DIR}/{_RESULT_FILE}"
+
+        # Per-problem CPU time and file size caps, matching RLIMIT_CPU / RLIMIT_FSIZE of the chroot backend
+        ulimits = []
+        if profile.cpu_time_seconds:
+            ulimits.append(docker.types.Ulimit(name="cpu", soft=profile.cpu_time_seconds, hard=profile.cpu_time_seconds))
+        if profile.disk_bytes:
+            ulimits.append(docker.types.Ulimit(name="fsize", soft=profile.disk_bytes, hard=profile.disk_bytes))
+        wait_timeout = _wait_timeout(profile)
 
         container = None
         try:
+            client, image = docker_session.get()
+            # A problem's own image has been warmed by image_manager before the job was scheduled
+            image = profile.image or image
             container = client.containers.run(
                 image=image,
                 command=["python", "/workspace/eval_runner.py"],
                 detach=True,
                 stdout=True,
                 stderr=True,
-                remove=False,  # we need to capture logs after wait
+                remove=False,  # removed in finally, after the log streams are drained
                 volumes=volumes,
                 environment=env,
                 network_mode=network_mode,
                 nano_cpus=nano_cpus,
+                cpuset_cpus=cpuset_cpus,
+                ulimits=ulimits or None,
                 mem_limit=mem_limit,
                 user=user,
                 working_dir="/workspace",
             )
 
-            # 310s timeout similar to chroot timeout
-            result = container.wait(timeout=310)
-            exit_code = result.get("StatusCode", 1)
-            logs_bytes = container.logs(stdout=True, stderr=True)
-            logs_text = logs_bytes.decode("utf-8", errors="replace") if isinstance(logs_bytes, (bytes, bytearray)) else str(logs_bytes)
-
-            # Try parse last JSON on stdout. We assume our runner prints a single JSON to stdout.
-            # Best effort: scan lines for a valid JSON dict having required keys.
-            candidate = None
-            for line in logs_text.splitlines():
-                line = line.strip()
-                if not (line.startswith("{") and line.endswith("}")):
-                    continue
-                try:
-                    obj = json.loads(line)
-                    if isinstance(obj, dict) and "status" in obj and "score" in obj and "logs" in obj:
-                        candidate = obj
-                except Exception:
-                    continue
-
-            if candidate is not None and exit_code == 0:
-                # Merge logs if needed
-                return candidate
-
-            # If JSON not found or non-zero exit, return error with container logs
-            return {
-                "status": "ERROR",
-                "score": 0.0,
-                "logs": f"Container exit_code={exit_code}. Logs:\n" + logs_text,
-            }
+            sampler = _ContainerStatsSampler(container)
+            sampler.start()
+            followers = [
+                _LogFollower(container, "stdout", HeadTailBuffer(RUNNER_OUTPUT_LIMIT)),
+                _LogFollower(container, "stderr", HeadTailBuffer(RUNNER_OUTPUT_LIMIT)),
+            ]
+            for follower in followers:
+                follower.start()
+            started = time.monotonic()
+            timed_out = False
+            exit_code = None
+            try:
+                exit_code = container.wait(timeout=wait_timeout).get("StatusCode", 1)
+            except requests.exceptions.ReadTimeout:
+                timed_out = True
+                container.kill()
+            wall_seconds = time.monotonic() - started
+            sampler.join(timeout=2)
+            for follower in followers:
+                # the streams end when the container stops
+                follower.join(timeout=DRAIN_TIMEOUT)
+            usage = sampler.usage(wall_seconds)
+            if cpus is not None:
+                usage["cpus"] = list(cpus.cpus)
+            stdout, stderr = (follower.buffer for follower in followers)
+            result = _read_result_file(result_host_dir / _RESULT_FILE)
+            return _container_result(stdout, stderr, result, exit_code, timed_out, usage, wait_timeout)
         except docker.errors.APIError as e:
             return {"status": "ERROR", "score": 0.0, "logs": f"Docker API error: {e.explanation if hasattr(e, 'explanation') else str(e)}"}
         except docker.errors.DockerException as e:
+            docker_session.report_error(e)
             return {"status": "ERROR", "score": 0.0, "logs": f"Docker error: {e}"}
         except Exception as e:
             import traceback
+            docker_session.report_error(e)
             return {"status": "ERROR", "score": 0.0, "logs": f"Unexpected error: {e}\n{traceback.format_exc()}"}
         finally:
             # Ensure container is removed
@@ -260,41 +733,388 @@ def _run_in_docker_sync(submission_dir: Path, judge_dir: Path) -> dict:
                     container.remove(force=True)
 
 
+# ---------------------------------------------------------------------------
+# Warm container pool (DOCKER_POOL_SIZE > 0)
+# ---------------------------------------------------------------------------
+
+# Label carried by pool containers; the value is this host's name so a restart can reap its own leftovers
+POOL_LABEL = "evaluateapp.pool"
+# Container-side path of the evaluation's judge tree; only that problem's tree is copied in, per run
+_JUDGE_PATH_IN_POOL = "/workspace/judge"
+
+# Applies the problem's rlimits, then replaces itself with the runner (exec_run has no ulimit option)
+_LAUNCHER = (
+    "import json, os, resource, sys\n"
+    "for name, value in json.loads(sys.argv[1]).items():\n"
+    "    resource.setrlimit(getattr(resource, name), (value, value))\n"
+    "os.execv(sys.executable, [sys.executable, '/workspace/eval_runner.py'])\n"
+)
+
+# Writable mounts of a pool container. The root filesystem is read-only, but besides /workspace and the
+# /tmp tmpfs docker always mounts a writable /dev/shm tmpfs and the /dev/mqueue filesystem.
+_SCRUB_ROOTS = ("/workspace", "/tmp", "/dev/shm", "/dev/mqueue")
+
+# Runs as root after every evaluation: kills anything the evaluation left running and empties every
+# writable mount in _SCRUB_ROOTS, so nothing written by one submission is visible to the next.
+_SCRUB_SCRIPT = (
+    "import json, os, shutil, signal\n"
+    f"roots = [root for root in {_SCRUB_ROOTS!r} if os.path.isdir(root)]\n"
+    "me = os.getpid()\n"
+    "stray = [int(p) for p in os.listdir('/proc') if p.isdigit() and int(p) not in (1, me)]\n"
+    "for pid in stray:\n"
+    "    try:\n"
+    "        os.kill(pid, signal.SIGKILL)\n"
+    "    except ProcessLookupError:\n"
+    "        pass\n"
+    "for root in roots:\n"
+    "    for name in os.listdir(root):\n"
+    "        path = os.path.join(root, name)\n"
+    "        if os.path.isdir(path) and not os.path.islink(path):\n"
+    "            shutil.rmtree(path, ignore_errors=True)\n"
+    "        else:\n"
+    "            os.unlink(path)\n"
+    "left = sum(len(os.listdir(root)) for root in roots)\n"
+    "print(json.dumps({'stray_processes': len(stray), 'leftover_entries': left}))\n"
+)
+
+
+def _new_warm_container():
+    """Start an idle, network-less, resource-limited container that evaluations are exec'd into (blocking)."""
+    from docker.types import Mount
+
+    client, image = docker_session.get()
+    return client.containers.run(
+        image=image,
+        command=["sleep", "infinity"],
+        detach=True,
+        network_mode=settings.DOCKER_NETWORK_MODE or "none",
+        nano_cpus=int(max(0.1, float(settings.DOCKER_CPUS or 1.0)) * 1e9),
+        mem_limit=settings.DOCKER_MEMORY,
+        read_only=True,
+        tmpfs={"/tmp": f"rw,nosuid,nodev,size={settings.DOCKER_POOL_TMPFS_SIZE},mode=1777"},
+        mounts=[
+            # Anonymous volume: unlike tmpfs mounts it accepts put_archive, and is removed with the container
+            Mount(target="/workspace", source=None, type="volume"),
+        ],
+        labels={POOL_LABEL: socket.gethostname()},
+        working_dir="/workspace",
+    )
+
+
+def _scrub_warm_container(container) -> None:
+    """Reset a pool container for the next evaluation; raises if it cannot be trusted anymore (blocking)."""
+    container.reload()
+    if container.status != "running":
+        raise RuntimeError(f"container {container.short_id} is {container.status}")
+    exit_code, output = container.exec_run(["python3", "-c", _SCRUB_SCRIPT], user="0")
+    text = (output or b"").decode("utf-8", errors="replace").strip()
+    if exit_code != 0:
+        raise RuntimeError(f"scrub exited with {exit_code}: {text[-500:]}")
+    report = json.loads(text.splitlines()[-1])
+    if report["stray_processes"] or report["leftover_entries"]:
+        raise RuntimeError(f"container {container.short_id} contaminated: {report}")
+
+
+def _remove_warm_container(container) -> None:
+    with contextlib.suppress(Exception):
+        container.remove(force=True, v=True)
+
+
+def _remove_stale_pool_containers() -> int:
+    """Remove pool containers left behind by a previous run of this service (blocking)."""
+    client = docker_session.client()
+    stale = client.containers.list(all=True, filters={"label": f"{POOL_LABEL}={socket.gethostname()}"})
+    for container in stale:
+        _remove_warm_container(container)
+    return len(stale)
+
+
+def _judge_member(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    """Judge files go in root-owned and not group / world writable, like the read-only mount of a fresh container."""
+    info.uid = info.gid = 0
+    info.uname = info.gname = "root"
+    info.mode &= ~0o022
+    return info
+
+
+def _workspace_archive(submission_dir: Path, judge_dir: Path, runner_code: str):
+    """Tar stream with judge/, submission/, eval_runner.py and the result directory for put_archive into /workspace."""
+    archive = tempfile.TemporaryFile()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        tar.add(str(judge_dir), arcname="judge", filter=_judge_member)
+        tar.add(str(submission_dir), arcname="submission")
+        data = runner_code.encode("utf-8")
+        info = tarfile.TarInfo("eval_runner.py")
+        info.size = len(data)
+        info.mode = 0o644
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+        # Result channel directory, writable by the (possibly unprivileged) exec user
+        result_dir = tarfile.TarInfo(_RESULT_DIR.rsplit("/", 1)[-1])
+        result_dir.type = tarfile.DIRTYPE
+        result_dir.mode = 0o777
+        result_dir.mtime = info.mtime
+        tar.addfile(result_dir)
+    archive.seek(0)
+    return archive
+
+
+class _PooledStatsPoller(_ContainerStatsSampler):
+    """Poll one-shot stats of a long-lived pool container for the duration of one exec.
+
+    Counters are cumulative over the container's lifetime, so they are reported relative
+    to the first sample; peak memory only looks at the current usage of each sample.
+    """
+
+    _peak_fields = ("usage",)
+    interval = 0.5
+
+    def __init__(self, container):
+        super().__init__(container)
+        self._stopped = threading.Event()
+        self._baseline: tuple | None = None
+
+    def run(self) -> None:
+        while True:
+            try:
+                self._record(self._container.stats(stream=False, one_shot=True))
+                if self._baseline is None:
+                    self._baseline = (self.cpu_user_ns, self.cpu_system_ns, self.block_read, self.block_write)
+            except Exception:
+                pass
+            if self._stopped.is_set():
+                return
+            self._stopped.wait(self.interval)
+
+    def stop(self) -> None:
+        # One last sample is taken after the exec finished
+        self._stopped.set()
+        self.join(timeout=2)
+
+    def usage(self, wall_seconds: float) -> dict:
+        if self._baseline is not None:
+            current = (self.cpu_user_ns, self.cpu_system_ns, self.block_read, self.block_write)
+            delta = [now - base if now is not None and base is not None else None for now, base in zip(current, self._baseline)]
+            self.cpu_user_ns, self.cpu_system_ns, self.block_read, self.block_write = delta
+        return super().usage(wall_seconds)
+
+
+def _run_in_warm_container(
+    container,
+    submission_dir: Path,
+    judge_dir: Path,
+    cpus: CpuAllocation | None,
+    profile: ResourceProfile,
+) -> tuple[dict, bool]:
+    """
+    Run one evaluation inside a pool container via exec and return (result, reusable).
+
+    - Copies this problem's judge tree, submission/ and eval_runner.py into the container's /workspace with put_archive
+    - Streams demultiplexed stdout / stderr into capped buffers and fetches the result file afterwards
+    - Applies the profile's memory / CPU limits with `docker update` and its rlimits in the exec'd process
+    - On timeout the whole container is killed; it is only reusable after a clean exit
+    """
+    import docker
+
+    try:
+        mem_limit = docker.utils.parse_bytes(profile.memory_bytes or settings.DOCKER_MEMORY)
+        nano_cpus, cpuset_cpus = _cpu_limits(cpus, profile)
+        # memswap follows the docker default of twice the memory limit. `docker update` has no nano_cpus,
+        # so the same CPU count is expressed as a CFS quota over a fixed period
+        limits = {
+            "mem_limit": mem_limit,
+            "memswap_limit": 2 * mem_limit,
+            "cpu_period": _CPU_PERIOD_US,
+            "cpu_quota": int(nano_cpus / 1e9 * _CPU_PERIOD_US),
+        }
+        if cpuset_cpus is not None:
+            limits["cpuset_cpus"] = cpuset_cpus
+        container.update(**limits)
+
+        runner_code = _fill_eval_runner(
+            judge_dir_in_container=_JUDGE_PATH_IN_POOL,
+            submission_dir_in_container="/workspace/submission",
+            python_executable="/usr/bin/python3",
+        )
+        with _workspace_archive(submission_dir, judge_dir, runner_code) as archive:
+            container.put_archive("/workspace", archive)
+
+        rlimits = {}
+        if profile.cpu_time_seconds:
+            rlimits["RLIMIT_CPU"] = profile.cpu_time_seconds
+        if profile.disk_bytes:
+            rlimits["RLIMIT_FSIZE"] = profile.disk_bytes
+        env = _container_env(cpus, profile)
+        # The root filesystem is read-only; libraries that write to $HOME get the scratch tmpfs
+        env["HOME"] = "/tmp"
+        env[RESULT_PATH_ENV] = f"{_RESULT_DIR}/{_RESULT_FILE}"
+        api = container.client.api
+        exec_id = api.exec_create(
+            container.id,
+            ["python", "-c", _LAUNCHER, json.dumps(rlimits)],
+            environment=env,
+            workdir="/workspace",
+            user=settings.DOCKER_USER or "",
+        )["Id"]
+
+        wait_timeout = _wait_timeout(profile)
+        timed_out = threading.Event()
+
+        def _kill() -> None:
+            timed_out.set()
+            with contextlib.suppress(Exception):
+                container.kill()
+
+        watchdog = threading.Timer(wait_timeout, _kill)
+        watchdog.daemon = True
+        poller = _PooledStatsPoller(container)
+        poller.start()
+        started = time.monotonic()
+        watchdog.start()
+        stdout = HeadTailBuffer(RUNNER_OUTPUT_LIMIT)
+        stderr = HeadTailBuffer(RUNNER_OUTPUT_LIMIT)
+        try:
+            for out, err in api.exec_start(exec_id, stream=True, demux=True):
+                if out:
+                    stdout.feed(out)
+                if err:
+                    stderr.feed(err)
+        finally:
+            watchdog.cancel()
+            wall_seconds = time.monotonic() - started
+            poller.stop()
+        usage = poller.usage(wall_seconds)
+        if cpus is not None:
+            usage["cpus"] = list(cpus.cpus)
+        if timed_out.is_set():
+            # The container is gone with its workspace; there is no result to fetch
+            return _container_result(stdout, stderr, (None, False), None, True, usage, wait_timeout), False
+        exit_code = api.exec_inspect(exec_id).get("ExitCode")
+        result = _fetch_result_file(container)
+        return _container_result(stdout, stderr, result, exit_code, False, usage, wait_timeout), exit_code == 0
+    except docker.errors.APIError as e:
+        return {"status": "ERROR", "score": 0.0, "logs": f"Docker API error: {e.explanation if hasattr(e, 'explanation') else str(e)}"}, False
+    except docker.errors.DockerException as e:
+        docker_session.report_error(e)
+        return {"status": "ERROR", "score": 0.0, "logs": f"Docker error: {e}"}, False
+    except Exception as e:
+        import traceback
+        docker_session.report_error(e)
+        return {"status": "ERROR", "score": 0.0, "logs": f"Unexpected error: {e}\n{traceback.format_exc()}"}, False
+
+
+# Pre-started containers reused across evaluations; main.py's lifespan calls start_container_pool() / stop().
+# A container is destroyed after DOCKER_POOL_MAX_USES evaluations, after a timeout or non-zero exit,
+# or when the scrub finds leftover processes or files.
+container_pool = JailPool(
+    build=_new_warm_container,
+    scrub=_scrub_warm_container,
+    destroy=_remove_warm_container,
+    size=settings.DOCKER_POOL_SIZE,
+    max_uses=settings.DOCKER_POOL_MAX_USES,
+    stage="container",
+)
+
+
+async def start_container_pool() -> None:
+    if not container_pool.enabled:
+        return
+    try:
+        removed = await blocking_pool.run("container_destroy", _remove_stale_pool_containers)
+        if removed:
+            print(f"[DockerSandbox] Removed {removed} stale pool containers")
+    except Exception as e:
+        print(f"[DockerSandbox] Failed to list stale pool containers: {type(e).__name__}: {e}")
+    await container_pool.start()
+
+
+def _extract_submission(submission_path: Path) -> Path:
+    """Safely extract the submission ZIP into a fresh temp workspace (blocking)."""
+    workspace = Path(tempfile.mkdtemp(prefix="eval_docker_"))
+    try:
+        submission_dir = workspace / "submission"
+        submission_dir.mkdir()
+        with zipfile.ZipFile(submission_path) as zf:
+            _safe_extractall(zf, submission_dir)
+    except BaseException:
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
+    return workspace
+
+
+def _cleanup_workspace(workspace: Path | None, submission_path: Path) -> None:
+    """Remove the temp workspace and the spooled submission ZIP (blocking)."""
+    if workspace is not None:
+        shutil.rmtree(workspace, ignore_errors=True)
+    with contextlib.suppress(FileNotFoundError):
+        submission_path.unlink()
+
+
+async def run_in_sandbox(
+    submission_id: str,
+    submission_path: Path,
+    judge_dir: Path,
+    timer: StageTimer | None = None,
+) -> dict:
+    """
+    Docker backend: extract the submission and run it in a container, returning the result.
+    `judge_dir` is the cached, already extracted judge tree and is mounted read-only;
+    the spooled submission ZIP is removed once the evaluation finishes.
+    With DOCKER_POOL_SIZE > 0 the evaluation is exec'd into a warm pool container instead of
+    starting a new one; the judge tree is then copied into the container's workspace.
+    """
+    print(f"[DockerSandbox] Starting evaluation for submission {submission_id}")
+    timer = timer or StageTimer()
+    workspace: Path | None = None
+    try:
+        # Extraction and teardown run on the dedicated blocking pool, never on the event loop
+        try:
+            workspace = await blocking_pool.run("extract", _extract_submission, Path(submission_path), timer=timer)
+        except (zipfile.BadZipFile, ValueError) as e:
+            return {"status": "ERROR", "score": 0.0, "logs": f"Failed to extract submission: {e}", "stages": timer.as_dict()}
+
+        # Run in a thread to avoid blocking event loop while interacting with Docker SDK;
+        # cores and the admission budget are only held while the container runs
+        profile = load_profile(str(judge_dir))
+        # Pool containers run the default image; problems with their own image get a fresh container
+        if container_pool.enabled and not profile.image:
+            warm = await timer.measure("jail_acquire", container_pool.acquire())
+            reusable = False
+            try:
+                async with resource_slot(timer, profile) as cpus:
+                    # warm.path holds the container object (see JailPool)
+                    result_dict, reusable = await timer.measure(
+                        "run",
+                        asyncio.to_thread(_run_in_warm_container, warm.path, workspace / "submission", Path(judge_dir), cpus, profile),
+                    )
+            finally:
+                await container_pool.release(warm, reusable)
+        else:
+            async with resource_slot(timer, profile) as cpus:
+                result_dict = await timer.measure(
+                    "run",
+                    asyncio.to_thread(_run_in_docker_sync, workspace / "submission", Path(judge_dir), cpus, profile),
+                )
+        result_dict["stages"] = timer.as_dict()
+        print(f"[DockerSandbox] Evaluation completed for submission {submission_id}: {result_dict.get('status', 'UNKNOWN')}")
+        return result_dict
+    finally:
+        await blocking_pool.run("cleanup", _cleanup_workspace, workspace, Path(submission_path), timer=timer)
+        print(f"[DockerSandbox] Stage timings for submission {submission_id}: {timer.summary()}")
+
+
 async def run_in_sandbox_and_callback(
     submission_id: str,
-    submission_data: bytes,
-    judge_data: bytes,
-    semaphore: asyncio.Semaphore,
-    executor: ProcessPoolExecutor,
+    submission_path: Path,
+    judge_dir: Path,
     callback_url: str,
+    timer: StageTimer | None = None,
 ):
     """
-    Docker backend: prepare temp dirs, extract zips, run in container, callback.
+    Docker backend: run the evaluation, then callback.
     Signature kept same as chroot backend for API compatibility.
     """
-    print(f"[DockerSandbox] Starting evaluation for submission {submission_id}")
-    async with semaphore:
-        print(f"[DockerSandbox] Semaphore acquired for submission {submission_id}")
-        with tempfile.TemporaryDirectory() as tmpdir:
-            workspace = Path(tmpdir)
-            submission_dir = workspace / "submission"
-            judge_dir = workspace / "judge"
-            submission_dir.mkdir()
-            judge_dir.mkdir()
-            # Safe extract
-            with zipfile.ZipFile(io.BytesIO(submission_data)) as zf:
-                _safe_extractall(zf, submission_dir)
-            with zipfile.ZipFile(io.BytesIO(judge_data)) as zf:
-                _safe_extractall(zf, judge_dir)
-
-            # Run in threadpool to avoid blocking event loop while interacting with Docker SDK
-            loop = asyncio.get_running_loop()
-            result_dict = await loop.run_in_executor(
-                executor,
-                _run_in_docker_sync,
-                submission_dir,
-                judge_dir,
-            )
-            print(f"[DockerSandbox] Evaluation completed for submission {submission_id}: {result_dict.get('status', 'UNKNOWN')}")
-
-        await post_results_to_webapp(submission_id, result_dict, callback_url)
+    timer = timer or StageTimer()
+    result_dict = await run_in_sandbox(submission_id, submission_path, judge_dir, timer)
+    await timer.measure("callback", post_results_to_webapp(submission_id, result_dict, callback_url))
+    print(f"[DockerSandbox] Callback for submission {submission_id} took {timer.durations['callback']:.3f}s")
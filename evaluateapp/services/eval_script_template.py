@@ -10,6 +10,61 @@ JUDGE_DIR = ${judge_dir_json}
 SUBMISSION_DIR = ${submission_dir_json}
 # Provide the resolved python executable path from sandbox
 PYTHON_EXECUTABLE = ${python_executable_json}
+# 评测包的 stdout、stderr 与返回的 logs 各自保留的最大字节数（开头与结尾各一半）
+OUTPUT_LIMIT = ${output_limit}
+# 父进程提供的结果通道（管道写端）；取出后从环境中删除，评测包启动的子进程看不到它
+RESULT_FD = os.environ.pop("EVAL_RESULT_FD", None)
+# 没有管道可用时（DOCKER 后端）由父进程指定的结果文件路径，同样从环境中删除
+RESULT_PATH = os.environ.pop("EVAL_RESULT_PATH", None)
+
+
+class BoundedTextBuffer(io.TextIOBase):
+    """只保留开头与结尾的文本缓冲：超出 limit 的中间部分只计数，避免大量输出耗尽内存。"""
+
+    def __init__(self, limit):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.truncated = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        data = str(text).encode("utf-8", "replace")
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            overflow = len(self.tail) - self.tail_limit
+            if overflow > 0:
+                del self.tail[:overflow]
+                self.truncated += overflow
+        return len(text)
+
+    def getvalue(self):
+        if not self.truncated:
+            return (self.head + self.tail).decode("utf-8", "replace")
+        return "{}\n...[输出过长，已省略 {} 字节]...\n{}".format(
+            self.head.decode("utf-8", "replace"), self.truncated, self.tail.decode("utf-8", "replace")
+        )
+
+
+def emit_result(payload):
+    """评测结果写入专用通道（管道或结果文件，都没有时退回 stdout），不会被评测包的大量输出淹没。"""
+    if RESULT_FD is not None:
+        channel = os.fdopen(int(RESULT_FD), "w", encoding="utf-8")
+    elif RESULT_PATH is not None:
+        channel = open(RESULT_PATH, "w", encoding="utf-8")
+    else:
+        print(json.dumps(payload))
+        return
+    with channel:
+        channel.write(json.dumps(payload, ensure_ascii=False))
+
 
 # ==================== Seccomp 逻辑已移至父进程 ====================
 # 这里不再需要 Seccomp 相关的导入和逻辑，因为父进程已经通过环境变量控制
@@ -46,8 +101,8 @@ try:
         raise AttributeError("评测脚本 'judge.py' 必须包含一个 'evaluate' 函数")
 
     # Capture stdout/stderr from judge.evaluate to avoid polluting JSON
-    stdout_buf = io.StringIO()
-    stderr_buf = io.StringIO()
+    stdout_buf = BoundedTextBuffer(OUTPUT_LIMIT)
+    stderr_buf = BoundedTextBuffer(OUTPUT_LIMIT)
     with contextlib.redirect_stdout(stdout_buf), contextlib.redirect_stderr(stderr_buf):
         # 传递 python_executable_path 给 judge.py，以便它能正确调用用户脚本
         result_dict = judge_module.evaluate(
@@ -62,18 +117,21 @@ try:
     judge_stdout = stdout_buf.getvalue()
     judge_stderr = stderr_buf.getvalue()
     merged_logs = []
+    logs_buf = BoundedTextBuffer(OUTPUT_LIMIT)
     if result_dict.get("logs"):
-        merged_logs.append(str(result_dict.get("logs")))
+        logs_buf.write(str(result_dict.get("logs")))
+        merged_logs.append(logs_buf.getvalue())
     if judge_stdout:
         merged_logs.append("[judge stdout]:\n" + judge_stdout)
     if judge_stderr:
         merged_logs.append("[judge stderr]:\n" + judge_stderr)
 
-    print(json.dumps({
+    emit_result({
         "status": "COMPLETED",
         "score": float(result_dict.get("score", 0.0)),
-        "logs": "\n".join(merged_logs)
-    }))
+        "logs": "\n".join(merged_logs),
+        "truncated_bytes": stdout_buf.truncated + stderr_buf.truncated + logs_buf.truncated,
+    })
 except Exception as e:
     error_info = "评测子进程异常: {}: {}\n{}".format(type(e).__name__, e, traceback.format_exc())
-    print(json.dumps({"status": "ERROR", "score": 0.0, "logs": error_info}))
\ No newline at end of file
+    emit_result({"status": "ERROR", "score": 0.0, "logs": error_info})
\ No newline at end of file
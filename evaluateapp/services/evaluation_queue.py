@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import itertools
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+
+class QueueFullError(Exception):
+    """评测队列已满；retry_after 为建议客户端等待的秒数。"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"评测队列已满，请在 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+@dataclass
+class EvaluationJob:
+    """
+    队列中的一个评测任务。
+
+    - run: 真正执行评测（含回调）的协程工厂，只会被调用一次；
+    - discard: 任务未能执行（例如服务关闭）时用于释放 spool 文件与缓存引用；
+    - ready: 可选，任务开始前需要等待的条件（例如 DOCKER 后端拉取本题镜像）。等待期间任务计入排队数，
+      但不进入 worker 队列、不占用并发；条件失败时照常执行，由评测本身报告错误。
+    """
+    submission_id: str
+    run: Callable[[], Awaitable[None]]
+    discard: Callable[[], None] = lambda: None
+    ready: Callable[[], Awaitable[None]] | None = None
+    job_id: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    started_at: float | None = None
+
+    @property
+    def queue_wait_seconds(self) -> float:
+        """入队到被 worker 取出的等待时间；尚未开始时为到目前为止的等待时间。"""
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+
+class EvaluationQueue:
+    """
+    进程内的有界评测队列。
+
+    固定数量的 worker 协程从队列中取任务执行，worker 数即评测并发上限；
+    排队任务数达到 max_depth 时拒绝新任务（由 API 层返回 429 + Retry-After）。
+    """
+
+    def __init__(self, concurrency: int, max_depth: int):
+        self.concurrency = max(1, concurrency)
+        self.max_depth = max(1, max_depth)
+        self._queue: asyncio.Queue[EvaluationJob] = asyncio.Queue()
+        self._pending: dict[int, EvaluationJob] = {}
+        self._active: dict[int, EvaluationJob] = {}
+        # 等待 ready 条件、尚未进入 worker 队列的任务
+        self._waiting: dict[int, asyncio.Task] = {}
+        self._workers: list[asyncio.Task] = []
+        self._ids = itertools.count(1)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # 最近任务耗时的指数滑动平均，用于估算 Retry-After
+        self._avg_duration = 30.0
+
+    async def start(self) -> None:
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker(i), name=f"evaluation-worker-{i}"))
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._workers.clear()
+        for task in list(self._waiting.values()):
+            task.cancel()
+        self._waiting.clear()
+        # 丢弃尚未执行的任务，释放其占用的文件
+        for job in list(self._pending.values()):
+            with contextlib.suppress(Exception):
+                job.discard()
+        self._pending.clear()
+
+    def retry_after(self) -> int:
+        """按当前排队长度与平均耗时估算客户端应等待的秒数。"""
+        backlog = len(self._pending) + len(self._active)
+        return max(1, math.ceil(self._avg_duration * backlog / self.concurrency))
+
+    def submit(self, job: EvaluationJob) -> EvaluationJob:
+        self.submit_many([job])
+        return job
+
+    def submit_many(self, jobs: list[EvaluationJob]) -> list[EvaluationJob]:
+        """原子地提交一组任务：队列剩余容量不足时整体拒绝。"""
+        if len(self._pending) + len(jobs) > self.max_depth:
+            self.rejected += len(jobs)
+            raise QueueFullError(self.retry_after())
+        for job in jobs:
+            job.job_id = next(self._ids)
+            job.enqueued_at = time.monotonic()
+            self._pending[job.job_id] = job
+            if job.ready is None:
+                self._queue.put_nowait(job)
+            else:
+                self._waiting[job.job_id] = asyncio.create_task(self._wait_ready(job), name=f"evaluation-ready-{job.job_id}")
+        return jobs
+
+    async def _wait_ready(self, job: EvaluationJob) -> None:
+        try:
+            await job.ready()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Queue] Prerequisite for submission {job.submission_id} failed, running anyway: {type(e).__name__}: {e}")
+        finally:
+            self._waiting.pop(job.job_id, None)
+        if job.job_id in self._pending:
+            self._queue.put_nowait(job)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self._pending.pop(job.job_id, None)
+            job.started_at = time.monotonic()
+            self._active[job.job_id] = job
+            print(f"[Queue] Worker {index} picked submission {job.submission_id} (waited {job.started_at - job.enqueued_at:.2f}s)")
+            try:
+                await job.run()
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"[Queue] Evaluation job for submission {job.submission_id} failed: {type(e).__name__}: {e}")
+            finally:
+                duration = time.monotonic() - job.started_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                self._active.pop(job.job_id, None)
+                self._queue.task_done()
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        oldest_wait = max((now - job.enqueued_at for job in self._pending.values()), default=0.0)
+        return {
+            "queued": len(self._pending),
+            "waiting": len(self._waiting),
+            "active": len(self._active),
+            "concurrency": self.concurrency,
+            "max_depth": self.max_depth,
+            "available_slots": max(0, self.max_depth - len(self._pending)),
+            "oldest_wait_seconds": round(oldest_wait, 3),
+            "avg_duration_seconds": round(self._avg_duration, 3),
+            "retry_after_seconds": self.retry_after(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
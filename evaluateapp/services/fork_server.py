@@ -0,0 +1,261 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import socket
+import time
+from pathlib import Path
+
+from .child_process import RunnerOutcome, RunnerPipes, collect_output, kill_group, usage_from_rusage
+
+# zygote 源码：以 `python3 -c` 在监狱解释器中执行
+ZYGOTE_SCRIPT = Path(__file__).with_name("zygote.py")
+
+
+class ForkServerError(RuntimeError):
+    """fork-server 不可用（未启动、已退出或通信失败），调用方应退回逐次启动解释器。"""
+
+
+class ForkServer:
+    """
+    常驻的 fork-server（zygote）：在基础 chroot 环境中预先导入 preload 中的模块，
+    每次评测 fork 一个子进程，切换到该次评测的监狱、降权后运行 eval_runner.py，
+    导入 numpy / pandas / sklearn 等的开销每个服务进程只付一次。
+
+    子进程的 stdout / stderr 与结果通道通过 SCM_RIGHTS 传入的管道直接交给本进程读取；
+    zygote 只负责 fork 与回收，并在其 stdout 上逐行回报子进程的 pid 与退出码。
+    """
+
+    def __init__(
+        self,
+        python_executable: str,
+        base_jail: str,
+        preload: list[str],
+        env: dict[str, str],
+        startup_timeout: float = 120.0,
+    ):
+        self.python_executable = python_executable
+        self.base_jail = base_jail
+        self.preload = preload
+        self.env = env
+        self.startup_timeout = startup_timeout
+        self._proc: asyncio.subprocess.Process | None = None
+        self._control: socket.socket | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._ids = itertools.count(1)
+        self._started: dict[int, asyncio.Future] = {}
+        self._exited: dict[int, asyncio.Future] = {}
+        self._start_lock = asyncio.Lock()
+        self.preloaded: list[str] = []
+        self.preload_failed: dict[str, str] = {}
+        self.served = 0
+        self.restarts = 0
+        self.startup_seconds = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    def usable_here(self) -> bool:
+        """只能在启动它的事件循环中使用（调试页面等 asyncio.run 调用方应退回普通模式）。"""
+        try:
+            return self._loop is asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self.alive:
+                return
+            if self._proc is not None:
+                self.restarts += 1
+                await self._cleanup()
+            await self._spawn()
+
+    async def _spawn(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        control, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        host_root_fd = os.open("/", os.O_RDONLY | os.O_DIRECTORY)
+        config = {
+            "control_fd": child_end.fileno(),
+            "host_root_fd": host_root_fd,
+            "preload": self.preload,
+        }
+        base_jail = self.base_jail
+
+        def _enter_base_jail():
+            os.chroot(base_jail)
+            os.chdir("/")
+
+        start = time.monotonic()
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                self.python_executable,
+                "-B",
+                "-c",
+                ZYGOTE_SCRIPT.read_text(encoding="utf-8"),
+                json.dumps(config),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                env=self.env,
+                pass_fds=(child_end.fileno(), host_root_fd),
+                preexec_fn=_enter_base_jail,
+                # 单独的进程组：服务收到 Ctrl+C 时不会连带打断 zygote 的收尾
+                start_new_session=True,
+            )
+        finally:
+            child_end.close()
+            os.close(host_root_fd)
+        self._control = control
+
+        try:
+            line = await asyncio.wait_for(self._proc.stdout.readline(), timeout=self.startup_timeout)
+            ready = json.loads(line) if line else {}
+        except (asyncio.TimeoutError, json.JSONDecodeError):
+            ready = {}
+        if ready.get("event") != "ready":
+            await self._cleanup()
+            raise ForkServerError("fork-server 启动失败（未收到 ready）")
+
+        self.startup_seconds = time.monotonic() - start
+        self.preloaded = ready.get("preloaded", [])
+        self.preload_failed = ready.get("failed", {})
+        self._reader_task = asyncio.create_task(self._read_events(), name="fork-server-reader")
+        print(
+            f"[ForkServer] Ready (pid {ready.get('pid')}) in {self.startup_seconds:.2f}s; "
+            f"preloaded: {', '.join(self.preloaded) or '-'}"
+            + (f"; failed: {', '.join(self.preload_failed)}" if self.preload_failed else "")
+        )
+
+    async def _read_events(self) -> None:
+        assert self._proc is not None and self._proc.stdout is not None
+        try:
+            while True:
+                line = await self._proc.stdout.readline()
+                if not line:
+                    break
+                with contextlib.suppress(json.JSONDecodeError):
+                    event = json.loads(line)
+                    request_id = event.get("id")
+                    if event.get("event") == "started":
+                        fut = self._started.pop(request_id, None)
+                        if fut is not None and not fut.done():
+                            fut.set_result(event["pid"])
+                    elif event.get("event") == "exited":
+                        fut = self._exited.pop(request_id, None)
+                        if fut is not None and not fut.done():
+                            fut.set_result(event)
+        finally:
+            print("[ForkServer] Zygote exited; pending evaluations will fail over")
+            for futures in (self._started, self._exited):
+                for fut in futures.values():
+                    if not fut.done():
+                        fut.set_exception(ForkServerError("fork-server 已退出"))
+                futures.clear()
+
+    async def run(
+        self,
+        jail_path: Path,
+        rlimits: dict[str, tuple[int, int]],
+        uid: int,
+        gid: int,
+        timeout: float,
+        output_limit: int,
+        result_limit: int,
+        cgroup_procs: str | None = None,
+        cpus: list[int] | None = None,
+        env: dict[str, str] | None = None,
+    ) -> RunnerOutcome:
+        """
+        在 jail_path 对应的监狱中运行 eval_runner.py，返回其输出；超时则终止整个进程组。
+        cpus 为子进程绑定的 CPU 核，env 为子进程额外设置的环境变量。
+        """
+        if not self.alive or self._control is None:
+            await self.start()
+        request_id = next(self._ids)
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+        exited = loop.create_future()
+        self._started[request_id] = started
+        self._exited[request_id] = exited
+
+        pipes = RunnerPipes()
+        request = {
+            "id": request_id,
+            "jail": str(jail_path),
+            "rlimits": {name: list(limits) for name, limits in rlimits.items()},
+            "uid": uid,
+            "gid": gid,
+            "cgroup_procs": cgroup_procs,
+            "cpus": cpus,
+            "env": env or {},
+        }
+        try:
+            socket.send_fds(self._control, [json.dumps(request).encode("utf-8")], list(pipes.child_ends))
+        except (OSError, TypeError) as e:
+            self._started.pop(request_id, None)
+            self._exited.pop(request_id, None)
+            pipes.close_parent_ends()
+            raise ForkServerError(f"无法向 fork-server 发送请求: {e}") from e
+        finally:
+            # 写端已随消息复制给 zygote
+            pipes.close_child_ends()
+
+        capture = pipes.start_readers(output_limit, result_limit)
+        pid: int | None = None
+        try:
+            pid = await asyncio.wait_for(started, timeout=30)
+            self.served += 1
+            start = time.monotonic()
+            timed_out = await collect_output(pid, capture, exited, timeout)
+            wall = time.monotonic() - start
+            event = exited.result()
+            ru = event.get("rusage")
+            usage = usage_from_rusage(*ru, wall_seconds=wall) if ru else None
+            return capture.outcome(event.get("returncode"), timed_out, usage)
+        except BaseException:
+            # 任务被取消、zygote 退出等情况：确保评测子进程不会残留
+            if pid is not None:
+                kill_group(pid)
+            self._started.pop(request_id, None)
+            self._exited.pop(request_id, None)
+            capture.cancel()
+            raise
+
+    async def _cleanup(self) -> None:
+        if self._control is not None:
+            self._control.close()
+            self._control = None
+        if self._proc is not None and self._proc.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                self._proc.kill()
+            await self._proc.wait()
+        if self._reader_task is not None:
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reader_task
+            self._reader_task = None
+
+    async def stop(self) -> None:
+        if self._proc is None:
+            return
+        # 关闭控制套接字后 zygote 自行退出
+        if self._control is not None:
+            self._control.close()
+            self._control = None
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._proc.wait(), timeout=5)
+        await self._cleanup()
+        self._proc = None
+
+    def status(self) -> dict:
+        return {
+            "alive": self.alive,
+            "pid": self._proc.pid if self.alive else None,
+            "preloaded": self.preloaded,
+            "preload_failed": self.preload_failed,
+            "startup_seconds": round(self.startup_seconds, 3),
+            "served": self.served,
+            "restarts": self.restarts,
+        }
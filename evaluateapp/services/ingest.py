@@ -0,0 +1,82 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import UploadFile
+
+from core.config import settings
+
+# 每次从上传文件读取的块大小
+SPOOL_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过 MAX_UPLOAD_SIZE。"""
+
+
+@dataclass
+class SpooledUpload:
+    """落盘后的上传文件：磁盘路径 + 流式计算得到的 SHA-256 与大小。"""
+    path: Path
+    sha256: str
+    size: int
+
+    def cleanup(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+def _spool_dir() -> str | None:
+    spool_dir = settings.UPLOAD_SPOOL_DIR
+    if spool_dir:
+        os.makedirs(spool_dir, exist_ok=True)
+    return spool_dir
+
+
+def _copy_and_hash(source: BinaryIO, dest_path: Path) -> tuple[str, int]:
+    """分块复制 source 到 dest_path，同时增量计算 SHA-256。"""
+    digest = hashlib.sha256()
+    size = 0
+    source.seek(0)
+    with open(dest_path, "wb") as dest:
+        while True:
+            chunk = source.read(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if size > settings.MAX_UPLOAD_SIZE:
+                raise UploadTooLargeError(f"上传文件过大（超过 {settings.MAX_UPLOAD_SIZE} bytes）")
+            dest.write(chunk)
+    return digest.hexdigest(), size
+
+
+async def spool_upload(upload: UploadFile, prefix: str = "upload_") -> SpooledUpload:
+    """
+    将上传文件以流式方式写入磁盘 spool 文件，并同时计算哈希。
+
+    读取、哈希与写盘都在线程中完成，既不阻塞事件循环，也不会把整个压缩包读入内存。
+    """
+    fd, path_str = tempfile.mkstemp(prefix=prefix, suffix=".zip", dir=_spool_dir())
+    os.close(fd)
+    path = Path(path_str)
+    try:
+        sha256, size = await asyncio.to_thread(_copy_and_hash, upload.file, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        raise
+    return SpooledUpload(path=path, sha256=sha256, size=size)
+
+
+def cleanup_spooled(*uploads: SpooledUpload | None) -> None:
+    """删除 spool 文件（忽略 None 与已删除的文件）。"""
+    for upload in uploads:
+        if upload is not None:
+            upload.cleanup()
+
@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from .blocking import blocking_pool
+
+
+@dataclass
+class PooledJail:
+    """池中的一个已搭建好的监狱目录。"""
+    path: Path
+    uses: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class JailPool:
+    """
+    预热的 chroot 监狱池。
+
+    后台任务提前搭建好 size 个基础监狱（复制基础环境、重建 /dev、准备临时目录），
+    评测时直接取用；评测结束后清理（scrub）并放回池中复用，达到 max_uses 次
+    或评测异常时直接销毁，由后台任务补充新的监狱。
+
+    build / scrub / destroy 均为阻塞的文件系统操作，会在阻塞线程池（blocking_pool）中执行。
+    stage 为这些步骤在阻塞线程池与日志中的名称前缀；DOCKER 后端用同一个池管理预热容器（stage="container"），
+    此时 PooledJail.path 保存的是容器对象，scrub 发现残留时抛出异常即销毁该容器。
+    """
+
+    def __init__(
+        self,
+        build: Callable[[], Path],
+        scrub: Callable[[Path], None],
+        destroy: Callable[[Path], None],
+        size: int,
+        max_uses: int,
+        stage: str = "jail",
+    ):
+        self._build = build
+        self._scrub = scrub
+        self._destroy = destroy
+        self.size = max(0, size)
+        self.max_uses = max(1, max_uses)
+        self.stage = stage
+        self._tag = f"[{stage.title()}Pool]"
+        self._ready: deque[PooledJail] = deque()
+        self._preparing = 0
+        self._refill_event = asyncio.Event()
+        self._refill_task: asyncio.Task | None = None
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self.destroyed = 0
+        self.prepared = 0
+        self.prepare_seconds_total = 0.0
+        self.last_prepare_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def start(self) -> None:
+        if not self.enabled or self._refill_task is not None:
+            return
+        self._refill_event = asyncio.Event()
+        self._refill_task = asyncio.create_task(self._refill_loop(), name=f"{self.stage}-pool-refill")
+        self._refill_event.set()
+
+    async def stop(self) -> None:
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._refill_task
+            self._refill_task = None
+        while self._ready:
+            jail = self._ready.popleft()
+            await blocking_pool.run(f"{self.stage}_destroy", self._destroy, jail.path)
+
+    async def _prepare(self) -> PooledJail:
+        start = time.monotonic()
+        build = asyncio.ensure_future(blocking_pool.run(f"{self.stage}_build", self._build))
+        try:
+            path = await asyncio.shield(build)
+        except asyncio.CancelledError:
+            # 线程中的搭建无法中断：等它完成后销毁，避免遗留监狱目录
+            with contextlib.suppress(Exception):
+                await blocking_pool.run(f"{self.stage}_destroy", self._destroy, await build)
+            raise
+        elapsed = time.monotonic() - start
+        self.prepared += 1
+        self.prepare_seconds_total += elapsed
+        self.last_prepare_seconds = elapsed
+        return PooledJail(path=path)
+
+    async def _refill_loop(self) -> None:
+        while True:
+            await self._refill_event.wait()
+            self._refill_event.clear()
+            while len(self._ready) + self._preparing < self.size:
+                self._preparing += 1
+                try:
+                    self._ready.append(await self._prepare())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"{self._tag} Failed to prepare {self.stage}: {type(e).__name__}: {e}")
+                    # 避免基础环境缺失时空转
+                    await asyncio.sleep(5)
+                finally:
+                    self._preparing -= 1
+
+    async def acquire(self) -> PooledJail:
+        """取出一个已准备好的监狱；池为空时当场搭建（记为 miss）。"""
+        if self._ready:
+            self.hits += 1
+            jail = self._ready.popleft()
+        else:
+            self.misses += 1
+            jail = await self._prepare()
+        self._refill_event.set()
+        return jail
+
+    async def release(self, jail: PooledJail, reusable: bool = True) -> None:
+        """归还监狱：可复用时清理后放回池中，否则销毁。"""
+        jail.uses += 1
+        if reusable and self.enabled and jail.uses < self.max_uses and len(self._ready) + self._preparing < self.size:
+            try:
+                await blocking_pool.run(f"{self.stage}_scrub", self._scrub, jail.path)
+            except Exception as e:
+                print(f"{self._tag} Failed to scrub {self.stage} {jail.path}: {type(e).__name__}: {e}")
+            else:
+                self.recycled += 1
+                self._ready.append(jail)
+                return
+        self.destroyed += 1
+        await blocking_pool.run(f"{self.stage}_destroy", self._destroy, jail.path)
+        self._refill_event.set()
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "size": self.size,
+            "ready": len(self._ready),
+            "preparing": self._preparing,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "destroyed": self.destroyed,
+            "prepared": self.prepared,
+            "avg_prepare_seconds": round(self.prepare_seconds_total / self.prepared, 4) if self.prepared else 0.0,
+            "last_prepare_seconds": round(self.last_prepare_seconds, 4),
+        }
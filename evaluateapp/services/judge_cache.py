@@ -0,0 +1,209 @@
+import asyncio
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from core.config import settings
+from services.blocking import blocking_pool
+from services.resource_profile import read_profile
+from services.sandbox import _safe_extractall
+
+
+class UnknownJudgeHashError(KeyError):
+    """缓存中不存在指定哈希的评测包，需要客户端重新上传 judge_zip。"""
+
+
+@dataclass
+class _CacheEntry:
+    path: Path
+    size: int
+    refs: int = 0
+
+
+def _tree_size(root: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            with contextlib.suppress(OSError):
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+    return total
+
+
+def _is_sha256(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def _remove_trees(paths: list[Path]) -> None:
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class JudgeLease:
+    """对某个缓存评测目录的引用；持有期间该目录不会被淘汰。"""
+
+    def __init__(self, cache: "JudgeCache", judge_hash: str, path: Path):
+        self._cache = cache
+        self.judge_hash = judge_hash
+        self.path = path
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._cache._release(self.judge_hash)
+
+    def __enter__(self) -> "JudgeLease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class JudgeCache:
+    """
+    以 SHA-256 为键的已解压评测包缓存（内容寻址）。
+
+    - 每个评测包只解压一次，解压结果位于 <root>/<sha256>/；
+    - 按总字节数做 LRU 淘汰，被引用（lease）中的条目不会被淘汰；
+      持锁时只把被淘汰的目录移出索引并改名，删除在阻塞线程池中进行，不占用事件循环；
+    - 服务重启后会重新扫描磁盘上已有的缓存目录。
+    """
+
+    def __init__(self, root: str | Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._cleanup_tasks: set[asyncio.Task] = set()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self) -> None:
+        entries = []
+        for child in self.root.iterdir():
+            if child.is_dir() and _is_sha256(child.name):
+                entries.append((child.stat().st_mtime, child))
+            elif child.name.startswith((".extract_", ".evict_")):
+                # 上次异常退出遗留的半成品或尚未删除的淘汰目录
+                shutil.rmtree(child, ignore_errors=True)
+        for _, child in sorted(entries):
+            self._entries[child.name] = _CacheEntry(path=child, size=_tree_size(child))
+        with self._lock:
+            evicted = self._evict_locked()
+        _remove_trees(evicted)
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(e.size for e in self._entries.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def contains(self, judge_hash: str) -> bool:
+        with self._lock:
+            return judge_hash in self._entries
+
+    def lease(self, judge_hash: str) -> JudgeLease:
+        """获取已缓存评测包的引用；不存在时抛出 UnknownJudgeHashError。"""
+        with self._lock:
+            entry = self._entries.get(judge_hash)
+            if entry is None:
+                raise UnknownJudgeHashError(judge_hash)
+            entry.refs += 1
+            self._entries.move_to_end(judge_hash)
+            return JudgeLease(self, judge_hash, entry.path)
+
+    def _release(self, judge_hash: str) -> None:
+        with self._lock:
+            entry = self._entries.get(judge_hash)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+            evicted = self._evict_locked()
+        self._discard(evicted)
+
+    def _discard(self, paths: list[Path]) -> None:
+        """删除已移出索引的目录：在事件循环中调用时交给阻塞线程池，在线程中调用时直接删除。"""
+        if not paths:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _remove_trees(paths)
+            return
+        task = loop.create_task(blocking_pool.run("judge_evict", _remove_trees, paths))
+        self._cleanup_tasks.add(task)
+        task.add_done_callback(self._cleanup_tasks.discard)
+
+    def put_archive(self, judge_hash: str, zip_path: str | Path) -> JudgeLease:
+        """
+        解压 judge_zip 到缓存并返回引用（阻塞操作，应在线程中调用）。
+        judge_hash 必须是调用方对 zip_path 内容计算出的 SHA-256。
+        resources.json 格式错误时抛出 ResourceProfileError，评测包不会进入缓存。
+        """
+        if not _is_sha256(judge_hash):
+            raise ValueError(f"非法的评测包哈希: {judge_hash}")
+        with contextlib.suppress(UnknownJudgeHashError):
+            return self.lease(judge_hash)
+
+        staging = Path(tempfile.mkdtemp(prefix=".extract_", dir=self.root))
+        evicted: list[Path] = []
+        try:
+            with zipfile.ZipFile(zip_path) as zf:
+                _safe_extractall(zf, staging)
+            read_profile(staging)
+            staging.chmod(0o755)
+            size = _tree_size(staging)
+            target = self.root / judge_hash
+            with self._lock:
+                if judge_hash not in self._entries:
+                    if target.exists():
+                        evicted.append(self._move_aside(judge_hash, target))
+                    os.rename(staging, target)
+                    self._entries[judge_hash] = _CacheEntry(path=target, size=size)
+                entry = self._entries[judge_hash]
+                entry.refs += 1
+                self._entries.move_to_end(judge_hash)
+                lease = JudgeLease(self, judge_hash, entry.path)
+                evicted += self._evict_locked()
+            return lease
+        finally:
+            # 并发解压同一评测包时，落后者的 staging 目录直接丢弃
+            if staging.exists():
+                shutil.rmtree(staging, ignore_errors=True)
+            _remove_trees(evicted)
+
+    def _move_aside(self, judge_hash: str, path: Path) -> Path:
+        """把目录改名为待删除目录（同一文件系统内的 rename，常数时间），由调用方在锁外删除。"""
+        trash = self.root / f".evict_{judge_hash}_{uuid.uuid4().hex[:8]}"
+        os.rename(path, trash)
+        return trash
+
+    def _evict_locked(self) -> list[Path]:
+        """按 LRU 淘汰未被引用的条目，返回改名后待删除的目录。"""
+        evicted = []
+        total = sum(e.size for e in self._entries.values())
+        for judge_hash in list(self._entries.keys()):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[judge_hash]
+            if entry.refs > 0:
+                continue
+            del self._entries[judge_hash]
+            total -= entry.size
+            print(f"[JudgeCache] Evicting judge package {judge_hash} ({entry.size} bytes)")
+            with contextlib.suppress(FileNotFoundError):
+                evicted.append(self._move_aside(judge_hash, entry.path))
+        return evicted
+
+
+def create_judge_cache() -> JudgeCache:
+    return JudgeCache(settings.JUDGE_CACHE_DIR, settings.JUDGE_CACHE_MAX_BYTES)
@@ -0,0 +1,178 @@
+import bisect
+import math
+import threading
+
+from core.config import settings
+
+# 耗时类直方图的桶（秒）：覆盖毫秒级的解压/回调到数分钟的评测
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+# 大小类直方图的桶（字节）：1KiB 到 4GiB，每档 4 倍
+BYTES_BUCKETS = tuple(1024 * 4**i for i in range(12))
+
+
+def backend_name() -> str:
+    return (settings.SANDBOX_BACKEND or "").strip().upper() or "CHROOT"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}_total{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = SECONDS_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：各桶（不累计）的计数、总和、总数
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float | None, **labels: str) -> None:
+        if value is None:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            totals[0] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = {key: (list(counts), totals[0]) for key, (counts, totals) in self._series.items()}
+        lines = self.header()
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_samples(name: str, help_text: str, samples: list[tuple[dict[str, str], float]], kind: str = "gauge") -> list[str]:
+    """
+    抓取时从各组件的 status() 即时读取的指标（队列长度、池占用、累计次数等），samples 为 (标签, 值)。
+    kind 为 counter 时名称需已带 _total 后缀。
+    """
+    base = name[: -len("_total")] if kind == "counter" and name.endswith("_total") else name
+    lines = [f"# HELP {base} {help_text}", f"# TYPE {base} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return lines
+
+
+_EVAL_LABELS = ("backend", "judge_hash")
+
+UPLOAD_SIZE = Histogram(
+    "evaluateapp_upload_size_bytes", "Size of uploaded ZIP files.", ("backend", "judge_hash", "kind"), BYTES_BUCKETS
+)
+QUEUE_WAIT = Histogram("evaluateapp_queue_wait_seconds", "Time an evaluation waited in the queue.", _EVAL_LABELS)
+EXTRACT = Histogram("evaluateapp_extract_seconds", "Time spent extracting the submission into the sandbox.", _EVAL_LABELS)
+JAIL_ACQUIRE = Histogram("evaluateapp_jail_acquire_seconds", "Time spent waiting for or building a jail.", _EVAL_LABELS)
+RUNNER_WALL = Histogram("evaluateapp_runner_wall_seconds", "Wall time of the evaluation runner process/container.", _EVAL_LABELS)
+EVALUATION = Histogram("evaluateapp_evaluation_seconds", "End-to-end evaluation time excluding the callback.", _EVAL_LABELS)
+CALLBACK = Histogram("evaluateapp_callback_seconds", "Time spent notifying all callback listeners of a result.", _EVAL_LABELS)
+EVALUATIONS = Counter("evaluateapp_evaluations", "Finished evaluations by result status.", ("backend", "judge_hash", "status"))
+BLOCKING_STAGE = Histogram(
+    "evaluateapp_blocking_stage_seconds",
+    "Duration of blocking pipeline steps (jail_build, jail_scrub, extract, cleanup, ...) in the blocking thread pool.",
+    ("backend", "stage"),
+)
+CALLBACK_DELIVERY = Histogram(
+    "evaluateapp_callback_delivery_seconds",
+    "Callback delivery latency including retries, by outcome.",
+    ("backend", "outcome"),
+)
+
+REGISTRY = (
+    UPLOAD_SIZE,
+    QUEUE_WAIT,
+    EXTRACT,
+    JAIL_ACQUIRE,
+    RUNNER_WALL,
+    EVALUATION,
+    CALLBACK,
+    EVALUATIONS,
+    BLOCKING_STAGE,
+    CALLBACK_DELIVERY,
+)
+
+
+def observe_upload(kind: str, size: int, judge_hash: str) -> None:
+    UPLOAD_SIZE.observe(size, backend=backend_name(), judge_hash=judge_hash, kind=kind)
+
+
+def observe_evaluation(judge_hash: str, result: dict, callback_seconds: float | None = None) -> None:
+    """一次评测结束时，按结果中的 stages 与 usage 记录各阶段耗时。"""
+    labels = {"backend": backend_name(), "judge_hash": judge_hash}
+    stages = result.get("stages") or {}
+    QUEUE_WAIT.observe(stages.get("queue_wait"), **labels)
+    EXTRACT.observe(stages.get("extract"), **labels)
+    JAIL_ACQUIRE.observe(stages.get("jail_acquire"), **labels)
+    RUNNER_WALL.observe((result.get("usage") or {}).get("wall_seconds"), **labels)
+    EVALUATION.observe(sum(seconds for stage, seconds in stages.items() if stage != "queue_wait") or None, **labels)
+    CALLBACK.observe(callback_seconds, **labels)
+    EVALUATIONS.inc(**labels, status=str(result.get("status", "UNKNOWN")))
+
+
+def render(extra: list[str] = ()) -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
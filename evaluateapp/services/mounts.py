@@ -0,0 +1,86 @@
+"""
+Linux 挂载命名空间相关的底层封装（ctypes 调用 libc.mount / umount2 / pivot_root / prctl）。
+
+这些函数会在 fork 之后、exec 之前的子进程中调用（preexec_fn），
+因此只做系统调用，不做日志输出等可能持锁的操作。
+"""
+import ctypes
+import ctypes.util
+import os
+
+MS_RDONLY = 0x1
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_REMOUNT = 0x20
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+MNT_DETACH = 0x2
+PR_SET_DUMPABLE = 4
+
+# 在父进程导入时加载 libc，避免在子进程中动态加载
+_libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+_libc.mount.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p)
+_libc.umount2.argtypes = (ctypes.c_char_p, ctypes.c_int)
+_libc.pivot_root.argtypes = (ctypes.c_char_p, ctypes.c_char_p)
+_libc.prctl.argtypes = (ctypes.c_int, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong)
+
+
+def _encode(value: str | None) -> bytes | None:
+    return os.fsencode(value) if value is not None else None
+
+
+def mount(source: str | None, target: str, fstype: str | None, flags: int = 0, data: str | None = None) -> None:
+    if _libc.mount(_encode(source), _encode(target), _encode(fstype), flags, _encode(data)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"mount {source} -> {target} ({fstype}) 失败: {os.strerror(errno)}")
+
+
+def make_mounts_private() -> None:
+    """将当前挂载命名空间中的所有挂载设为 private，避免挂载事件传播回宿主。"""
+    mount(None, "/", None, MS_REC | MS_PRIVATE)
+
+
+def mount_tmpfs(target: str, size: str, mode: int = 0o755) -> None:
+    mount("tmpfs", target, "tmpfs", MS_NOSUID | MS_NODEV, f"size={size},mode={mode:o}")
+
+
+def mount_proc(target: str) -> None:
+    """挂载当前 PID 命名空间的 procfs。"""
+    mount("proc", target, "proc", MS_NOSUID | MS_NODEV | MS_NOEXEC)
+
+
+def bind_mount(source: str, target: str, readonly: bool = True, nodev: bool = True) -> None:
+    """绑定挂载；只读绑定需要再做一次 remount。绑定设备节点所在的目录时需传 nodev=False。"""
+    mount(source, target, None, MS_BIND | MS_REC)
+    if readonly:
+        mount(None, target, None, MS_BIND | MS_REMOUNT | MS_RDONLY | MS_NOSUID | (MS_NODEV if nodev else 0))
+
+
+def mount_overlay(lower: str, upper: str, work: str, target: str) -> None:
+    # 不能加 MS_NODEV：基础环境中的 /dev 设备节点来自下层
+    mount("overlay", target, "overlay", MS_NOSUID, f"lowerdir={lower},upperdir={upper},workdir={work}")
+
+
+def pivot_root(new_root: str) -> None:
+    """
+    把 new_root（必须是挂载点）切换为当前挂载命名空间的根目录，并卸载原来的根。
+    与 chroot 不同，切换后进程不被视为处于 chroot 中，之后仍可以创建用户命名空间。
+    """
+    os.chdir(new_root)
+    # new_root 与 put_old 相同：原来的根叠在新根之下，随后直接卸载
+    if _libc.pivot_root(b".", b".") != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"pivot_root {new_root} 失败: {os.strerror(errno)}")
+    if _libc.umount2(b".", MNT_DETACH) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"卸载原根目录失败: {os.strerror(errno)}")
+    os.chdir("/")
+
+
+def set_dumpable(dumpable: bool = True) -> None:
+    """setuid 降权会清除 dumpable 标记，此时 /proc/self 下的文件属于 root，进程无法写自己的 uid_map。"""
+    if _libc.prctl(PR_SET_DUMPABLE, int(dumpable), 0, 0, 0) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"prctl(PR_SET_DUMPABLE) 失败: {os.strerror(errno)}")
@@ -0,0 +1,212 @@
+"""
+NAMESPACE 评测后端：不复制监狱、不依赖 Docker daemon，每次评测的隔离环境由常数次系统调用搭建。
+
+评测子进程在新的 PID / 网络 / IPC / 挂载命名空间中运行：根目录是一个 tmpfs，
+基础环境（CHROOT_JAIL_PATH）的各顶层目录只读绑定进来，/tmp 是其中唯一可写的临时区；
+pivot_root 进入后按 CHROOT 后端相同的方式设置资源限制并降权，最后进入只映射自身身份的用户命名空间。
+命名空间随评测进程退出而销毁，挂载无需逐个卸载；宿主上只留下提交目录，由 cleanup 阶段删除。
+"""
+import asyncio
+import contextlib
+import os
+import zipfile
+from dataclasses import replace
+from pathlib import Path
+
+from core.config import settings
+
+from .blocking import StageTimer, blocking_pool
+from .cpu_slots import resource_slot
+from .resource_profile import load_profile
+from . import mounts
+from .sandbox import (
+    CHROOT_JAIL_PATH,
+    RunnerLimits,
+    _enter_pid_namespace,
+    _extraction_error,
+    _join_cgroup,
+    _new_overlay_workspace,
+    _remove_jail,
+    _run_in_cgroup,
+    _run_runner,
+    _setup_sandbox_and_demote_privileges,
+)
+from .sandbox import (
+    post_batch_results_to_webapp,
+    post_results_to_webapp,
+    submit_batch_results_to_webapp,
+    submit_results_to_webapp,
+)
+
+# 不从基础环境绑定、由沙箱自行提供的顶层目录：/proc 挂载新 PID 命名空间的 procfs，/tmp 为可写临时区
+_PRIVATE_DIRS = ("proc", "tmp")
+
+
+def _user_namespace_enabled() -> bool:
+    # seccomp 过滤器先于降权加载，其白名单中没有 unshare
+    return settings.NAMESPACE_USERNS and not settings.ENABLE_SECCOMP
+
+
+def _base_entries() -> list[tuple[str, bool, str | None]]:
+    """基础环境的顶层条目：(名称, 是否目录, 符号链接目标)。在父进程中读取，子进程只做挂载。"""
+    entries = []
+    with os.scandir(CHROOT_JAIL_PATH) as it:
+        for entry in it:
+            if entry.name in _PRIVATE_DIRS:
+                continue
+            link = os.readlink(entry.path) if entry.is_symlink() else None
+            entries.append((entry.name, entry.is_dir(follow_symlinks=False), link))
+    return entries
+
+
+def _new_namespace_workspace(submission: str | Path) -> tuple[Path, list[tuple[str, bool, str | None]]]:
+    """宿主上的工作目录与 OVERLAY 模式相同：root/ 为 tmpfs 根目录的挂载点，另有解压后的提交与评测入口脚本。"""
+    entries = _base_entries()
+    return _new_overlay_workspace(submission), entries
+
+
+def _setup_namespace_root(workspace: str, judge_dir: str, entries, tmpfs_size: str) -> None:
+    """
+    在评测进程中调用：进入私有挂载命名空间，以 tmpfs 为根，只读绑定基础环境、评测包、提交目录与入口脚本，
+    挂载新 PID 命名空间的 procfs，最后 pivot_root 进入。
+    """
+    os.unshare(os.CLONE_NEWNS)
+    mounts.make_mounts_private()
+
+    root = os.path.join(workspace, "root")
+    mounts.mount_tmpfs(root, tmpfs_size)
+    for name, is_dir, link in entries:
+        target = os.path.join(root, name)
+        if link is not None:
+            os.symlink(link, target)
+            continue
+        if is_dir:
+            os.mkdir(target, 0o755)
+        else:
+            os.close(os.open(target, os.O_CREAT | os.O_WRONLY, 0o644))
+        # /dev 中的设备节点需要保留
+        mounts.bind_mount(os.path.join(CHROOT_JAIL_PATH, name), target, readonly=True, nodev=name != "dev")
+
+    proc = os.path.join(root, "proc")
+    os.mkdir(proc, 0o555)
+    mounts.mount_proc(proc)
+    tmp = os.path.join(root, "tmp")
+    os.mkdir(tmp)
+    os.chmod(tmp, 0o1777)
+
+    for name, source in (("judge_env", judge_dir), ("submission_env", os.path.join(workspace, "submission_env"))):
+        target = os.path.join(root, name)
+        os.mkdir(target, 0o755)
+        mounts.bind_mount(source, target, readonly=True)
+    runner_target = os.path.join(root, "eval_runner.py")
+    os.close(os.open(runner_target, os.O_CREAT | os.O_WRONLY, 0o644))
+    mounts.bind_mount(os.path.join(workspace, "eval_runner.py"), runner_target, readonly=True)
+
+    mounts.pivot_root(root)
+
+
+def _enter_user_namespace() -> None:
+    """降权之后进入新的用户命名空间，只映射当前（无特权）身份；exec 之后评测进程不持有任何 capability。"""
+    uid, gid = os.getuid(), os.getgid()
+    mounts.set_dumpable()
+    os.unshare(os.CLONE_NEWUSER)
+    for path, content in (
+        ("/proc/self/setgroups", "deny"),
+        ("/proc/self/uid_map", f"{uid} {uid} 1"),
+        ("/proc/self/gid_map", f"{gid} {gid} 1"),
+    ):
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            os.write(fd, content.encode())
+        finally:
+            os.close(fd)
+
+
+def _setup_namespaces(workspace: str, judge_dir: str, entries, tmpfs_size: str, limits: RunnerLimits) -> None:
+    """评测子进程的 preexec_fn。"""
+    # cgroup 在 fork 之前加入，命名空间中的进程都随之计入；pivot_root 之后看不到 cgroupfs
+    if limits.cgroup_procs:
+        _join_cgroup(limits.cgroup_procs)
+    _enter_pid_namespace(os.CLONE_NEWNET | os.CLONE_NEWIPC)
+    _setup_namespace_root(workspace, judge_dir, entries, tmpfs_size)
+    _setup_sandbox_and_demote_privileges("/", replace(limits, cgroup_procs=None))
+    if _user_namespace_enabled():
+        _enter_user_namespace()
+
+
+async def _execute_in_namespaces(submission: str, judge_dir: str, timer: StageTimer | None = None) -> dict:
+    timer = timer or StageTimer()
+    profile = load_profile(judge_dir)
+    try:
+        workspace, entries = await blocking_pool.run("extract", _new_namespace_workspace, submission, timer=timer)
+    except (zipfile.BadZipFile, ValueError) as e:
+        return _extraction_error(e)
+    except Exception as e:
+        import traceback
+        error_info = f"准备评测沙箱时发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return {"status": "ERROR", "score": 0.0, "logs": error_info}
+    # 题目配置了磁盘配额时，tmpfs 大小与之一致
+    tmpfs_size = str(profile.disk_bytes) if profile.disk_bytes else settings.NAMESPACE_TMPFS_SIZE
+    try:
+        async with resource_slot(timer, profile) as cpus:
+            def start(limits: RunnerLimits):
+                return _run_runner(
+                    lambda: _setup_namespaces(str(workspace), judge_dir, entries, tmpfs_size, limits),
+                    limits,
+                )
+
+            result, _ = await timer.measure("run", _run_in_cgroup(start, profile, cpus))
+        return result
+    except Exception as e:
+        import traceback
+        error_info = f"执行评测子进程时发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return {"status": "ERROR", "score": 0.0, "logs": error_info}
+    finally:
+        await blocking_pool.run("cleanup", _remove_jail, workspace, timer=timer)
+
+
+def _execute_judge_code(submission_dir: str, judge_dir: str) -> dict:
+    """同步入口：供调试页面等不在事件循环中的调用方使用。"""
+    return asyncio.run(_execute_in_namespaces(str(submission_dir), str(judge_dir)))
+
+
+def runtime_ready(judge_dir: Path) -> None:
+    """评测入队前需要等待的条件：NAMESPACE 后端只依赖基础环境，无需等待。"""
+    return None
+
+
+async def run_in_sandbox(
+    submission_id: str,
+    submission_path: Path,
+    judge_dir: Path,
+    timer: StageTimer | None = None,
+) -> dict:
+    """
+    在独立命名空间中执行评测，返回结果字典（不回调）；与 CHROOT 后端的 run_in_sandbox 约定相同：
+    评测结束后删除 submission_path，judge_dir 只读使用，结果中附带 usage 与 stages。
+    """
+    print(f"[Namespace] Starting evaluation for submission {submission_id}")
+    timer = timer or StageTimer()
+    try:
+        result_dict = await _execute_in_namespaces(str(submission_path), str(judge_dir), timer)
+        result_dict["stages"] = timer.as_dict()
+        print(f"[Namespace] Evaluation completed for submission {submission_id}: {result_dict.get('status', 'UNKNOWN')}")
+        return result_dict
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(submission_path)
+        print(f"[Namespace] Stage timings for submission {submission_id}: {timer.summary()}")
+
+
+async def run_in_sandbox_and_callback(
+    submission_id: str,
+    submission_path: Path,
+    judge_dir: Path,
+    callback_url: str,
+    timer: StageTimer | None = None,
+):
+    """在独立命名空间中执行评测，然后调用回调函数发送结果。"""
+    timer = timer or StageTimer()
+    result_dict = await run_in_sandbox(submission_id, submission_path, judge_dir, timer)
+    await timer.measure("callback", post_results_to_webapp(submission_id, result_dict, callback_url))
+    print(f"[Namespace] Callback for submission {submission_id} took {timer.durations['callback']:.3f}s")
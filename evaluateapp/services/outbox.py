@@ -0,0 +1,299 @@
+import asyncio
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from core.config import settings
+from .blocking import blocking_pool
+from .callbacks import callback_dispatcher
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    submission_id TEXT NOT NULL,
+    callback_url TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    delivered_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_attempt_at REAL,
+    PRIMARY KEY (submission_id, callback_url)
+);
+CREATE INDEX IF NOT EXISTS results_undelivered ON results (delivered_at, created_at);
+"""
+
+
+class ResultOutbox:
+    """
+    评测结果的本地持久化发件箱（SQLite，WAL 模式）：
+
+    - 每条结果在回调之前先落盘（每个回调地址一条记录），回调成功后记录投递时间；
+    - webapp 不可用、重试耗尽或服务重启时，未投递的结果在启动时与每隔 replay_interval 秒重新投递，
+      不需要重新评测；
+    - webapp 可以通过 GET /api/results/{submission_id} 主动拉取错过的结果；
+    - 投递尝试达到 max_attempts 次（例如回调地址始终拒绝）后不再重放，但仍可拉取；
+    - 超过 retention 秒的记录（无论是否投递成功）被清理。
+
+    SQLite 调用在阻塞线程池中执行；服务未启动发件箱（调试页面等）时所有操作都是空操作。
+    """
+
+    def __init__(self, path: str, replay_interval: float, retention: float, max_attempts: int, replay_batch: int = 100):
+        self.path = Path(path)
+        self.replay_interval = replay_interval
+        self.retention = retention
+        self.max_attempts = max(1, max_attempts)
+        self.replay_batch = max(1, replay_batch)
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._replay_task: asyncio.Task | None = None
+        # 本进程正在投递的 (submission_id, callback_url)：定时重放跳过它们，避免与首次回调重复发送
+        self._delivering: set[tuple[str, str]] = set()
+        self.recorded = 0
+        self.replayed = 0
+        self.replay_delivered = 0
+        self.pruned = 0
+        # 表中的记录数与未投递数：随每次写入在同一事务中增减，status() 不必查询数据库
+        self.entries = 0
+        self.undelivered = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # 每次提交都刷盘：结果写入后进程崩溃或断电都不会丢失
+        db.execute("PRAGMA synchronous=FULL")
+        db.executescript(_SCHEMA)
+        self._db = db
+
+    def _execute(self, sql: str, params=()) -> list[tuple]:
+        assert self._db is not None
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _transaction(self, apply) -> int:
+        """
+        在一个事务中执行 apply(db)（阻塞线程池中调用）：一批结果只刷盘一次。
+        apply 返回 (记录数变化, 未投递数变化, 删除的记录数)，提交成功后在同一把锁内计入计数。
+        """
+        assert self._db is not None
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                entries, undelivered, removed = apply(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            self.entries += entries
+            self.undelivered += undelivered
+            self.pruned += removed
+            return removed
+
+    def _insert_rows(self, rows: list[tuple]) -> None:
+        def apply(db: sqlite3.Connection) -> tuple[int, int, int]:
+            added = reopened = 0
+            for row in rows:
+                existing = db.execute(
+                    "SELECT delivered_at FROM results WHERE submission_id = ? AND callback_url = ?", row[:2]
+                ).fetchone()
+                if existing is None:
+                    added += 1
+                elif existing[0] is not None:
+                    # 已投递的旧结果被新的评测结果覆盖，重新变为未投递
+                    reopened += 1
+                db.execute(
+                    "INSERT OR REPLACE INTO results (submission_id, callback_url, result, created_at) VALUES (?, ?, ?, ?)",
+                    row,
+                )
+            return added, added + reopened, 0
+
+        self._transaction(apply)
+
+    def _settle_rows(self, rows: list[tuple], delivered: bool) -> None:
+        def apply(db: sqlite3.Connection) -> tuple[int, int, int]:
+            newly_delivered = 0
+            for now, submission_id, callback_url in rows:
+                db.execute(
+                    "UPDATE results SET attempts = attempts + 1, last_attempt_at = ? WHERE submission_id = ? AND callback_url = ?",
+                    (now, submission_id, callback_url),
+                )
+                if delivered:
+                    newly_delivered += db.execute(
+                        "UPDATE results SET delivered_at = ? WHERE submission_id = ? AND callback_url = ? AND delivered_at IS NULL",
+                        (now, submission_id, callback_url),
+                    ).rowcount
+            return 0, -newly_delivered, 0
+
+        self._transaction(apply)
+
+    def _count(self) -> None:
+        assert self._db is not None
+        with self._lock:
+            total, delivered = self._db.execute("SELECT COUNT(*), COUNT(delivered_at) FROM results").fetchone()
+            self.entries, self.undelivered = total, total - delivered
+
+    async def start(self) -> None:
+        if self._db is not None:
+            return
+        await blocking_pool.run("outbox", self._open)
+        await blocking_pool.run("outbox", self._count)
+        print(f"[Outbox] Opened {self.path} ({self.entries} entries, {self.undelivered} undelivered)")
+        self._replay_task = asyncio.create_task(self._replay_loop(), name="outbox-replay")
+
+    async def stop(self) -> None:
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._replay_task
+            self._replay_task = None
+        if self._db is not None:
+            db, self._db = self._db, None
+            with self._lock:
+                db.close()
+
+    async def record(self, results: list[tuple[str, dict]], callback_url: str) -> None:
+        """回调之前落盘一批结果；同一提交重新评测后回调到同一地址时覆盖旧记录。"""
+        self._delivering.update((submission_id, callback_url) for submission_id, _ in results)
+        if self._db is None:
+            return
+        now = time.time()
+        rows = [
+            (submission_id, callback_url, json.dumps(result, ensure_ascii=False), now)
+            for submission_id, result in results
+        ]
+        try:
+            await blocking_pool.run("outbox", self._insert_rows, rows)
+            self.recorded += len(rows)
+        except sqlite3.Error as e:
+            # 发件箱不可用时仍然直接回调，只是失去了失败后重放的保障
+            print(f"[Outbox] Failed to persist results for {len(rows)} submissions: {e}")
+
+    async def settle(self, submission_ids: list[str], callback_url: str, delivered: bool) -> None:
+        """记录一次投递尝试的结果；写入完成后才允许定时重放再次选中这些提交。"""
+        try:
+            if self._db is None:
+                return
+            now = time.time()
+            rows = [(now, submission_id, callback_url) for submission_id in submission_ids]
+            await blocking_pool.run("outbox", self._settle_rows, rows, delivered)
+        except sqlite3.Error as e:
+            print(f"[Outbox] Failed to update delivery state for {len(submission_ids)} submissions: {e}")
+        finally:
+            self._delivering.difference_update((submission_id, callback_url) for submission_id in submission_ids)
+
+    async def get(self, submission_id: str) -> dict | None:
+        """按 submission_id 读取最近一次落盘的结果及各回调地址的投递状态；不存在时返回 None。"""
+        if self._db is None:
+            return None
+        rows = await blocking_pool.run(
+            "outbox",
+            self._execute,
+            "SELECT result, created_at, callback_url, delivered_at, attempts FROM results "
+            "WHERE submission_id = ? ORDER BY created_at DESC",
+            (submission_id,),
+        )
+        if not rows:
+            return None
+        result, created_at = rows[0][0], rows[0][1]
+        callbacks = [
+            {"callback_url": callback_url, "delivered_at": delivered_at, "attempts": attempts}
+            for _, _, callback_url, delivered_at, attempts in rows
+        ]
+        return {
+            "submission_id": submission_id,
+            "delivered": any(callback["delivered_at"] is not None for callback in callbacks),
+            "created_at": created_at,
+            "callbacks": callbacks,
+            "result": json.loads(result),
+        }
+
+    async def _replay_loop(self) -> None:
+        while True:
+            try:
+                await self.replay_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Outbox] Replay failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.replay_interval)
+
+    async def replay_once(self) -> int:
+        """清理过期记录并重新投递未投递的结果，返回本轮投递成功的条数。"""
+        if self._db is None:
+            return 0
+        cutoff = time.time() - self.retention
+        await blocking_pool.run("outbox", self._prune, cutoff)
+        rows = await blocking_pool.run(
+            "outbox",
+            self._execute,
+            "SELECT submission_id, callback_url, result FROM results "
+            "WHERE delivered_at IS NULL AND attempts < ? ORDER BY created_at LIMIT ?",
+            (self.max_attempts, self.replay_batch + len(self._delivering)),
+        )
+        pending = [row for row in rows if (row[0], row[1]) not in self._delivering][: self.replay_batch]
+        if not pending:
+            return 0
+        print(f"[Outbox] Replaying {len(pending)} undelivered results")
+        outcomes = await asyncio.gather(
+            *(self._replay(submission_id, callback_url, json.loads(result)) for submission_id, callback_url, result in pending)
+        )
+        delivered = sum(outcomes)
+        print(f"[Outbox] Replay delivered {delivered}/{len(pending)} results")
+        return delivered
+
+    async def _replay(self, submission_id: str, callback_url: str, result: dict) -> bool:
+        self._delivering.add((submission_id, callback_url))
+        self.replayed += 1
+        delivered = False
+        try:
+            delivered = await callback_dispatcher.send(submission_id, result, callback_url)
+        finally:
+            await self.settle([submission_id], callback_url, delivered)
+        if delivered:
+            self.replay_delivered += 1
+        return delivered
+
+    def _prune(self, cutoff: float) -> int:
+        def apply(db: sqlite3.Connection) -> tuple[int, int, int]:
+            undelivered = db.execute(
+                "DELETE FROM results WHERE created_at < ? AND delivered_at IS NULL", (cutoff,)
+            ).rowcount
+            removed = undelivered + db.execute("DELETE FROM results WHERE created_at < ?", (cutoff,)).rowcount
+            return -removed, -undelivered, removed
+
+        return self._transaction(apply)
+
+    def status(self) -> dict:
+        """只读取内存中的计数，可以在事件循环中直接调用。"""
+        result = {
+            "enabled": self.enabled,
+            "path": str(self.path),
+            "delivering": len(self._delivering),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "replay_delivered": self.replay_delivered,
+            "pruned": self.pruned,
+        }
+        if self._db is not None:
+            result["entries"] = self.entries
+            result["undelivered"] = self.undelivered
+        return result
+
+
+def outbox_enabled() -> bool:
+    return bool(settings.OUTBOX_ENABLED)
+
+
+# 进程内共享的结果发件箱；main.py 的 lifespan 在启用时 start()，关闭时 stop()
+result_outbox = ResultOutbox(
+    path=settings.OUTBOX_PATH,
+    replay_interval=settings.OUTBOX_REPLAY_INTERVAL,
+    retention=settings.OUTBOX_RETENTION_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+)
@@ -0,0 +1,105 @@
+import functools
+import json
+import math
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+# pack.py 根据 problem.yml 的 resources 段写入评测包根目录的文件
+PROFILE_FILENAME = "resources.json"
+
+_MIB = 1024 * 1024
+
+
+def _finite(value) -> float:
+    """JSON 中的 Infinity / NaN 能被解析，但不是有效的资源量。"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"不是有限数: {value!r}")
+    return number
+
+
+def _image_name(value) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("镜像名必须是非空字符串")
+    return value.strip()
+
+
+# resources.json 字段（与 problem.yml 一致的驼峰命名） -> (ResourceProfile 字段, 换算)
+_FIELDS = {
+    "cpuTimeSeconds": ("cpu_time_seconds", lambda v: int(v)),
+    "wallTimeSeconds": ("wall_time_seconds", _finite),
+    "memoryMB": ("memory_bytes", lambda v: int(_finite(v) * _MIB)),
+    "threads": ("threads", lambda v: int(v)),
+    "diskMB": ("disk_bytes", lambda v: int(_finite(v) * _MIB)),
+    "image": ("image", _image_name),
+}
+
+
+class ResourceProfileError(ValueError):
+    """resources.json 格式错误。"""
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    """
+    一道题目的评测资源配置；为 None 的字段使用评测后端的默认值。
+
+    - cpu_time_seconds：评测进程 CPU 时间上限（RLIMIT_CPU / 容器 ulimit cpu）
+    - wall_time_seconds：墙钟超时
+    - memory_bytes：内存上限（RLIMIT_AS 或 cgroup memory.max / 容器 mem_limit）
+    - threads：线程数，同时也是评测占用的 CPU 核数
+    - disk_bytes：写入文件大小上限（RLIMIT_FSIZE；OVERLAY 模式下同时是可写层大小）
+    - image：DOCKER 后端运行本题的镜像（为空时使用 DOCKER_IMAGE）；CHROOT 后端忽略
+    """
+    cpu_time_seconds: int | None = None
+    wall_time_seconds: float | None = None
+    memory_bytes: int | None = None
+    threads: int | None = None
+    disk_bytes: int | None = None
+    image: str | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ResourceProfile":
+        if not isinstance(data, dict):
+            raise ResourceProfileError(f"{PROFILE_FILENAME} 必须是 JSON 对象")
+        values = {}
+        for key, value in data.items():
+            if key not in _FIELDS:
+                raise ResourceProfileError(f"未知的资源字段: {key}")
+            if value is None:
+                continue
+            field, convert = _FIELDS[key]
+            try:
+                values[field] = convert(value)
+            except (TypeError, ValueError, OverflowError) as e:
+                raise ResourceProfileError(f"资源字段 {key} 的值无效: {value!r}") from e
+            if not isinstance(values[field], str) and values[field] <= 0:
+                raise ResourceProfileError(f"资源字段 {key} 必须为正数: {value!r}")
+        return cls(**values)
+
+    def as_dict(self) -> dict:
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+def read_profile(judge_dir: str | Path) -> ResourceProfile:
+    """
+    读取并校验评测包中的 resources.json；不存在时返回全部使用默认值的配置。
+    无法读取或格式错误时抛出 ResourceProfileError。
+    """
+    path = Path(judge_dir) / PROFILE_FILENAME
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return ResourceProfile()
+    except (OSError, ValueError) as e:
+        raise ResourceProfileError(f"无法读取 {PROFILE_FILENAME}: {e}") from e
+    return ResourceProfile.from_dict(data)
+
+
+@functools.lru_cache(maxsize=256)
+def load_profile(judge_dir: str) -> ResourceProfile:
+    """
+    评测包目录按内容哈希缓存、内容不可变，因此按路径缓存解析结果。
+    评测包在放入缓存时已校验（见 JudgeCache.put_archive）；格式错误时抛出 ResourceProfileError，异常不会被缓存。
+    """
+    return read_profile(judge_dir)
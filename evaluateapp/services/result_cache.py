@@ -0,0 +1,99 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from core.config import settings
+from .resource_profile import ResourceProfile
+
+
+@dataclass
+class _CachedResult:
+    payload: str
+    size: int
+    expires_at: float
+
+
+def result_cache_key(sub_hash: str, judge_hash: str, profile: ResourceProfile) -> str:
+    """结果缓存键：提交与评测包的内容哈希、评测后端以及题目资源配置。"""
+    backend = (settings.SANDBOX_BACKEND or "").strip().upper() or "CHROOT"
+    material = "\n".join([sub_hash, judge_hash, backend, json.dumps(profile.as_dict(), sort_keys=True)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    评测结果缓存（进程内，LRU + TTL）：相同提交、相同评测包与资源配置的重复评测直接复用上次结果，
+    不再进入沙箱。只缓存 COMPLETED 结果——超时、OOM 等错误可能与当时的负载有关，重新评测时不应复用。
+
+    结果以 JSON 字符串保存：按字节数计入 max_bytes，读取时得到独立的副本。
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _CachedResult]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return json.loads(entry.payload)
+
+    def put(self, key: str, result: dict) -> None:
+        if not self.enabled or result.get("status") != "COMPLETED":
+            return
+        # stages 描述的是那一次评测的排队与执行过程，不随结果复用
+        payload = json.dumps({k: v for k, v in result.items() if k not in ("stages", "cached")}, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CachedResult(payload, size, time.monotonic() + self.ttl)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# 进程内共享的评测结果缓存
+result_cache = ResultCache(max_bytes=settings.RESULT_CACHE_MAX_BYTES, ttl=settings.RESULT_CACHE_TTL_SECONDS)
@@ -1,5 +1,4 @@
 import asyncio
-import io
 import json
 import contextlib
 import tempfile
@@ -7,18 +6,29 @@ import zipfile
 import sys
 import os
 import shutil
-from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
 from pathlib import Path, PurePosixPath
+import signal
 import stat
 import subprocess
+import time
 from string import Template
 import resource # 引入 resource 模块
 
-# 引入 httpx 用于回调
-import httpx
 from core.config import settings
 
 from schemas.evaluation import EvaluationResponse
+from .blocking import StageTimer, blocking_pool
+from .callbacks import callback_dispatcher
+from .outbox import result_outbox
+from . import child_process
+from .cgroups import CgroupManager, CgroupSetupError, EvaluationCgroup
+from .cpu_slots import CpuAllocation, resource_slot, thread_env
+from .child_process import RunnerOutcome
+from .fork_server import ForkServer, ForkServerError
+from .jail_pool import JailPool
+from .resource_profile import ResourceProfile, load_profile
+from . import mounts
 
 # --- 新增：安全配置 ---
 # 警告：在生产环境中，这个路径应该是只读的，并且经过严格配置
@@ -41,7 +51,7 @@ except KeyError:
     UNPRIVILEGED_UID = pwd.getpwnam("nobody").pw_uid
     UNPRIVILEGED_GID = grp.getgrnam("nogroup").gr_gid
 
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Optional
 
 
 MAX_ARCHIVE_MEMBER_SIZE = 512 * 1024 * 1024  # 512MB，与沙箱文件限制保持一致
@@ -93,74 +103,109 @@ except Exception:
         print("警告：未找到可用的 seccomp 绑定（'seccomp' 或 'pyseccomp'）。系统调用过滤将不会启用。")
 
 
-def _setup_sandbox_and_demote_privileges(jail_path: str):
-    """
-    此函数将作为 subprocess.run 的 preexec_fn。
-    它在子进程中、执行目标命令前运行。
-    """
-    # 1. 资源限制
+# 评测进程的资源限制（spawn 与 fork-server 两种启动方式共用）
+SANDBOX_RLIMITS = {
     # 限制 CPU 时间为 300 秒 (软限制和硬限制)
-    resource.setrlimit(resource.RLIMIT_CPU, (300, 300))
+    "RLIMIT_CPU": (300, 300),
     # 限制虚拟内存为 2GB
-    resource.setrlimit(resource.RLIMIT_AS, (2 * 1024**3, 2 * 1024**3))
+    "RLIMIT_AS": (2 * 1024**3, 2 * 1024**3),
     # 限制可创建的“任务”（线程/进程）数量。部分科学计算库需要线程，给到一个小上限。
-    resource.setrlimit(resource.RLIMIT_NPROC, (64, 64))
+    "RLIMIT_NPROC": (64, 64),
     # 限制文件大小为 512MB
-    resource.setrlimit(resource.RLIMIT_FSIZE, (512 * 1024**2, 512 * 1024**2))
+    "RLIMIT_FSIZE": (512 * 1024**2, 512 * 1024**2),
+}
+
+# 约束并行线程数，避免科学计算库大量并发
+SANDBOX_THREAD_ENV = {
+    "OMP_NUM_THREADS": "1",
+    "OPENBLAS_NUM_THREADS": "1",
+    "MKL_NUM_THREADS": "1",
+    "NUMEXPR_NUM_THREADS": "1",
+    "VECLIB_MAXIMUM_THREADS": "1",
+    "MALLOC_ARENA_MAX": "2",
+}
+
+
+def _join_cgroup(procs_path: str) -> None:
+    """把当前进程（之后 fork 出的子进程随之）加入评测 cgroup。"""
+    fd = os.open(procs_path, os.O_WRONLY)
+    try:
+        os.write(fd, b"0")
+    finally:
+        os.close(fd)
+
+
+def _build_seccomp_filter():
+    """构造评测子进程的 seccomp 过滤器（未安装绑定或未启用时为 None）。在父进程中调用，子进程只需 load()。"""
+    if sc is None or not getattr(settings, "ENABLE_SECCOMP", False):
+        return None
+    # 默认策略：杀死任何不符合规则的进程
+    f = sc.SyscallFilter(defaction=sc.KILL)
+
+    # 白名单：允许基础的、安全的系统调用
+    # 允许执行新程序（python 可执行文件）
+    f.add_rule(sc.ALLOW, 'execve')
+    f.add_rule(sc.ALLOW, 'execveat')
+    # 文件操作
+    f.add_rule(sc.ALLOW, 'read')
+    f.add_rule(sc.ALLOW, 'write')
+    f.add_rule(sc.ALLOW, 'openat')
+    f.add_rule(sc.ALLOW, 'close')
+    f.add_rule(sc.ALLOW, 'fstat')
+    f.add_rule(sc.ALLOW, 'lseek')
+    f.add_rule(sc.ALLOW, 'access')
+    f.add_rule(sc.ALLOW, 'stat')
+
+    # 内存管理
+    f.add_rule(sc.ALLOW, 'mmap')
+    f.add_rule(sc.ALLOW, 'munmap')
+    f.add_rule(sc.ALLOW, 'brk')
+    f.add_rule(sc.ALLOW, 'mprotect')
+
+    # 进程生命周期
+    f.add_rule(sc.ALLOW, 'exit_group')
+    f.add_rule(sc.ALLOW, 'rt_sigaction')
+    f.add_rule(sc.ALLOW, 'rt_sigprocmask')
+
+    # 其他必要调用
+    f.add_rule(sc.ALLOW, 'getuid')
+    f.add_rule(sc.ALLOW, 'getgid')
+    f.add_rule(sc.ALLOW, 'geteuid')
+    f.add_rule(sc.ALLOW, 'getegid')
+    f.add_rule(sc.ALLOW, 'arch_prctl')
+    f.add_rule(sc.ALLOW, 'futex')
+    f.add_rule(sc.ALLOW, 'sched_getaffinity')
+    return f
+
+
+_SECCOMP_FILTER = _build_seccomp_filter()
+
+
+def _setup_sandbox_and_demote_privileges(jail_path: str, limits: "RunnerLimits | None" = None):
+    """
+    此函数将作为 subprocess.run 的 preexec_fn。
+    它在子进程中、执行目标命令前运行，只做系统调用（原因见 child_process.spawn）。
+    """
+    limits = limits or RunnerLimits()
+    # 0. 加入本次评测的 cgroup（必须在 chroot 之前，监狱中看不到 cgroupfs）
+    if limits.cgroup_procs:
+        _join_cgroup(limits.cgroup_procs)
+
+    # 1. 资源限制
+    for name, (soft, hard) in limits.rlimits.items():
+        resource.setrlimit(getattr(resource, name), (soft, hard))
 
-    # 2. 在进入 chroot 与降权前，约束并行线程数，避免科学计算库大量并发
-    os.environ.setdefault("OMP_NUM_THREADS", "1")
-    os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
-    os.environ.setdefault("MKL_NUM_THREADS", "1")
-    os.environ.setdefault("NUMEXPR_NUM_THREADS", "1")
-    os.environ.setdefault("VECLIB_MAXIMUM_THREADS", "1")
-    os.environ.setdefault("MALLOC_ARENA_MAX", "2")
+    # 2. 启用绑核时绑定到分配的核上（线程数环境变量由 _runner_env 在父进程中算好）
+    if limits.cpus is not None:
+        os.sched_setaffinity(0, limits.cpus.cpus)
 
     # 3. Chroot 到监狱目录
     os.chroot(jail_path)
     os.chdir("/") # chroot后，新的根目录是'/'
 
-    # 4. Seccomp 系统调用过滤 (如果可用且启用)
-    if sc is not None and getattr(settings, "ENABLE_SECCOMP", False):
-        # 默认策略：杀死任何不符合规则的进程
-        f = sc.SyscallFilter(defaction=sc.KILL)
-
-        # 白名单：允许基础的、安全的系统调用
-        # 允许执行新程序（python 可执行文件）
-        f.add_rule(sc.ALLOW, 'execve')
-        f.add_rule(sc.ALLOW, 'execveat')
-        # 文件操作
-        f.add_rule(sc.ALLOW, 'read')
-        f.add_rule(sc.ALLOW, 'write')
-        f.add_rule(sc.ALLOW, 'openat')
-        f.add_rule(sc.ALLOW, 'close')
-        f.add_rule(sc.ALLOW, 'fstat')
-        f.add_rule(sc.ALLOW, 'lseek')
-        f.add_rule(sc.ALLOW, 'access')
-        f.add_rule(sc.ALLOW, 'stat')
-
-        # 内存管理
-        f.add_rule(sc.ALLOW, 'mmap')
-        f.add_rule(sc.ALLOW, 'munmap')
-        f.add_rule(sc.ALLOW, 'brk')
-        f.add_rule(sc.ALLOW, 'mprotect')
-
-        # 进程生命周期
-        f.add_rule(sc.ALLOW, 'exit_group')
-        f.add_rule(sc.ALLOW, 'rt_sigaction')
-        f.add_rule(sc.ALLOW, 'rt_sigprocmask')
-
-        # 其他必要调用
-        f.add_rule(sc.ALLOW, 'getuid')
-        f.add_rule(sc.ALLOW, 'getgid')
-        f.add_rule(sc.ALLOW, 'geteuid')
-        f.add_rule(sc.ALLOW, 'getegid')
-        f.add_rule(sc.ALLOW, 'arch_prctl')
-        f.add_rule(sc.ALLOW, 'futex')
-        f.add_rule(sc.ALLOW, 'sched_getaffinity')
-
-        # 加载过滤器
-        f.load()
+    # 4. Seccomp 系统调用过滤 (如果可用且启用)；过滤器在父进程导入时构造，这里只加载
+    if _SECCOMP_FILTER is not None:
+        _SECCOMP_FILTER.load()
 
     # 5. 降权 (最关键的一步，最后执行)
     # 必须先设置组ID，再设置用户ID
@@ -169,204 +214,800 @@ def _setup_sandbox_and_demote_privileges(jail_path: str):
     os.umask(0o077) # 设置掩码，使得创建的文件/目录只有所有者有权访问
 
 
-def _execute_judge_code(
-    submission_dir: str,
-    judge_dir: str,
-) -> dict:
+# 评测子进程的墙钟超时，比内部CPU限制稍长
+RUNNER_TIMEOUT = 310
+# 评测子进程 stdout / stderr 各自保留的字节数；结果通道的上限按其中日志的最大长度留足余量
+RUNNER_OUTPUT_LIMIT = int(settings.RUNNER_OUTPUT_MAX_BYTES)
+RUNNER_RESULT_LIMIT = 8 * RUNNER_OUTPUT_LIMIT + 64 * 1024
+# 监狱内的解释器路径
+PYTHON_EXECUTABLE_IN_JAIL = "/usr/bin/python3"
+
+
+def _build_base_jail(jail_path: Path) -> None:
+    """在 jail_path 中搭建基础 chroot 环境（解释器与库、/dev 设备节点、临时目录）。"""
+    # 关键：临时目录默认 0700，需要放宽为 0755，否则降权后无法遍历 '/'
+    jail_path.chmod(0o755)
+
+    # 复制基础 chroot 环境 (python解释器, 库等)
+    # 这一步假设 /opt/sandbox_jail 已经准备好
+    if not os.path.exists(CHROOT_JAIL_PATH) or not os.listdir(CHROOT_JAIL_PATH):
+         raise EnvironmentError(f"Chroot 基础环境 '{CHROOT_JAIL_PATH}' 未准备好或为空。")
+
+    # 优先用硬链接快速复制（节省磁盘与页缓存）；失败则逐项复制且跳过 /dev
+    try:
+        subprocess.run(["cp", "-al", os.path.join(CHROOT_JAIL_PATH, "."), str(jail_path)], check=True)
+    except Exception:
+        for item in os.listdir(CHROOT_JAIL_PATH):
+            src = os.path.join(CHROOT_JAIL_PATH, item)
+            dst = jail_path / item
+            if os.path.basename(src) == "dev":
+                continue
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
+            else:
+                shutil.copy2(src, dst)
+
+    # 在监狱内重建必要的 /dev 设备节点
+    dev_dir = jail_path / "dev"
+    if dev_dir.exists():
+        # 尝试移除 cp -al 带入的 /dev 内容
+        for root, dirs, files in os.walk(dev_dir, topdown=False):
+            for name in files:
+                with contextlib.suppress(Exception):
+                    os.unlink(os.path.join(root, name))
+            for name in dirs:
+                with contextlib.suppress(Exception):
+                    os.rmdir(os.path.join(root, name))
+        with contextlib.suppress(Exception):
+            os.rmdir(dev_dir)
+    dev_dir.mkdir(exist_ok=True)
+    def _mknod_char(path: Path, major: int, minor: int, mode: int = 0o666):
+        try:
+            if path.exists() and not stat.S_ISCHR(os.stat(path).st_mode):
+                path.unlink()
+            if not path.exists():
+                os.mknod(str(path), stat.S_IFCHR | mode, os.makedev(major, minor))
+            os.chmod(path, mode)
+        except PermissionError:
+            # 在某些受限环境可能没有 CAP_MKNOD；忽略，让 Python 回退其他熵源
+            pass
+
+    _mknod_char(dev_dir / "null", 1, 3)
+    _mknod_char(dev_dir / "zero", 1, 5)
+    _mknod_char(dev_dir / "random", 1, 8)
+    _mknod_char(dev_dir / "urandom", 1, 9)
+    _mknod_char(dev_dir / "tty", 5, 0)
+
+    # 确保常见临时目录存在并可写
+    for tmpd in [jail_path / "tmp", jail_path / "var" / "tmp", jail_path / "usr" / "tmp"]:
+        tmpd.mkdir(parents=True, exist_ok=True)
+        os.chmod(tmpd, 0o1777)
+
+
+def _render_eval_runner(judge_dir: str, submission_dir: str, python_executable: str) -> str:
+    """用给定路径渲染 eval_script_template.py。"""
+    template_path = Path(__file__).parent / "eval_script_template.py"
+    with open(template_path, "r", encoding="utf-8") as f:
+        template_content = f.read()
+    return Template(template_content).substitute(
+        judge_dir_json=json.dumps(judge_dir),
+        submission_dir_json=json.dumps(submission_dir),
+        python_executable_json=json.dumps(python_executable),
+        output_limit=int(settings.RUNNER_OUTPUT_MAX_BYTES),
+    )
+
+
+def _link_or_copy(src: str, dst: str) -> str:
     """
-    在一个使用 chroot, seccomp 和无特权用户隔离的沙箱中执行评测。
+    评测包缓存中的文件优先硬链接进监狱，避免再写一遍磁盘。
+    对组/其他用户可写的文件仍复制一份，防止评测进程通过硬链接改写缓存内容。
+    """
+    if os.lstat(src).st_mode & 0o022 == 0:
+        try:
+            os.link(src, dst)
+            return dst
+        except OSError:
+            # 缓存与监狱不在同一文件系统等情况，退回复制
+            pass
+    return shutil.copy2(src, dst)
+
+
+def _stage_submission(submission: str | Path, target: Path) -> None:
+    """
+    把提交放入 target：ZIP 文件直接安全解压到目标目录（只解压这一次）；
+    已解压的目录（调试页面）则复制过去。
     """
+    if Path(submission).is_dir():
+        shutil.copytree(submission, target, dirs_exist_ok=True)
+        return
+    with zipfile.ZipFile(submission) as zf:
+        _safe_extractall(zf, target)
+
+
+def _populate_jail(jail_path: Path, submission: str | Path, judge_dir: str) -> None:
+    """在监狱中创建工作目录、放入评测包与提交，并写入评测入口脚本。"""
+    judge_workspace = jail_path / "judge_env"
+    submission_workspace = jail_path / "submission_env"
+    judge_workspace.mkdir(0o755)
+    submission_workspace.mkdir(0o755)
+
+    # 评测包来自缓存：硬链接进监狱
+    shutil.copytree(judge_dir, judge_workspace, dirs_exist_ok=True, copy_function=_link_or_copy)
+    # 用户提交直接解压到监狱中
+    _stage_submission(submission, submission_workspace)
+
+    # 注意：这里的路径都是相对于监狱内部的
+    filled_script = _render_eval_runner("judge_env", "submission_env", PYTHON_EXECUTABLE_IN_JAIL)
+    script_path_in_jail = jail_path / "eval_runner.py"
+    with open(script_path_in_jail, "w", encoding="utf-8") as f:
+        f.write(filled_script)
+    os.chmod(script_path_in_jail, 0o644)
+
+
+def _new_base_jail() -> Path:
+    """创建一个新的基础 chroot "监狱"（阻塞的文件系统操作，应在线程中调用）。"""
     # 确保运行时根路径存在且可遍历
     os.makedirs(RUNTIME_JAIL_ROOT, exist_ok=True)
     os.chmod(RUNTIME_JAIL_ROOT, 0o755)
 
-    # 使用一个临时目录作为本次评测的 chroot "监狱"
-    with tempfile.TemporaryDirectory(prefix="eval_jail_", dir=RUNTIME_JAIL_ROOT) as jail_path_str:
+    jail_path = Path(tempfile.mkdtemp(prefix="eval_jail_", dir=RUNTIME_JAIL_ROOT))
+    try:
+        _build_base_jail(jail_path)
+    except BaseException:
+        shutil.rmtree(jail_path, ignore_errors=True)
+        raise
+    return jail_path
+
+
+def _jail_processes(jail_path: Path) -> list[int]:
+    """
+    根目录位于该监狱中的进程：评测进程及其后代（包括 setsid 另起会话的后台进程）。
+    降权后的进程无法离开 chroot，因此按 /proc/<pid>/root 判断，不受同时运行的其他监狱影响。
+    """
+    jail = os.path.realpath(jail_path)
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
         try:
-            jail_path = Path(jail_path_str)
-            # 关键：临时目录默认 0700，需要放宽为 0755，否则降权后无法遍历 '/'
-            jail_path.chmod(0o755)
-            os.chmod(jail_path, 0o755)
-
-            # --- 1. 准备 Chroot 环境 ---
-            # 复制基础 chroot 环境 (python解释器, 库等)
-            # 这一步假设 /opt/sandbox_jail 已经准备好
-            if not os.path.exists(CHROOT_JAIL_PATH) or not os.listdir(CHROOT_JAIL_PATH):
-                 raise EnvironmentError(f"Chroot 基础环境 '{CHROOT_JAIL_PATH}' 未准备好或为空。")
-
-            # 优先用硬链接快速复制（节省磁盘与页缓存）；失败则逐项复制且跳过 /dev
-            try:
-                subprocess.run(["cp", "-al", os.path.join(CHROOT_JAIL_PATH, "."), str(jail_path)], check=True)
-            except Exception:
-                for item in os.listdir(CHROOT_JAIL_PATH):
-                    src = os.path.join(CHROOT_JAIL_PATH, item)
-                    dst = jail_path / item
-                    if os.path.basename(src) == "dev":
-                        continue
-                    if os.path.isdir(src):
-                        shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
-                    else:
-                        shutil.copy2(src, dst)
-
-            # 在监狱内重建必要的 /dev 设备节点
-            dev_dir = jail_path / "dev"
-            if dev_dir.exists():
-                # 尝试移除 cp -al 带入的 /dev 内容
-                for root, dirs, files in os.walk(dev_dir, topdown=False):
-                    for name in files:
-                        with contextlib.suppress(Exception):
-                            os.unlink(os.path.join(root, name))
-                    for name in dirs:
-                        with contextlib.suppress(Exception):
-                            os.rmdir(os.path.join(root, name))
-                with contextlib.suppress(Exception):
-                    os.rmdir(dev_dir)
-            dev_dir.mkdir(exist_ok=True)
-            def _mknod_char(path: Path, major: int, minor: int, mode: int = 0o666):
-                try:
-                    if path.exists() and not stat.S_ISCHR(os.stat(path).st_mode):
-                        path.unlink()
-                    if not path.exists():
-                        os.mknod(str(path), stat.S_IFCHR | mode, os.makedev(major, minor))
-                    os.chmod(path, mode)
-                except PermissionError:
-                    # 在某些受限环境可能没有 CAP_MKNOD；忽略，让 Python 回退其他熵源
-                    pass
-
-            _mknod_char(dev_dir / "null", 1, 3)
-            _mknod_char(dev_dir / "zero", 1, 5)
-            _mknod_char(dev_dir / "random", 1, 8)
-            _mknod_char(dev_dir / "urandom", 1, 9)
-            _mknod_char(dev_dir / "tty", 5, 0)
-
-            # 确保常见临时目录存在并可写
-            for tmpd in [jail_path / "tmp", jail_path / "var" / "tmp", jail_path / "usr" / "tmp"]:
-                tmpd.mkdir(parents=True, exist_ok=True)
-                os.chmod(tmpd, 0o1777)
-
-            # --- 2. 在监狱中创建工作目录并复制文件 ---
-            judge_workspace = jail_path / "judge_env"
-            submission_workspace = jail_path / "submission_env"
-            judge_workspace.mkdir(0o755)
-            submission_workspace.mkdir(0o755)
-
-            # 复制评测脚本和数据
-            shutil.copytree(judge_dir, judge_workspace, dirs_exist_ok=True)
-            # 复制用户提交
-            shutil.copytree(submission_dir, submission_workspace, dirs_exist_ok=True)
-
-            # --- 3. 准备评测入口脚本 ---
-            # 注意：这里的路径都是相对于监狱内部的
-            python_executable = "/usr/bin/python3" # 假设解释器在监狱中的这个位置
-            template_path = Path(__file__).parent / "eval_script_template.py"
-            with open(template_path, "r", encoding="utf-8") as f:
-                template_content = f.read()
-
-            filled_script = Template(template_content).substitute(
-                judge_dir_json=json.dumps("judge_env"), # 相对路径
-                submission_dir_json=json.dumps("submission_env"), # 相对路径
-                python_executable_json=json.dumps(python_executable),
-            )
+            root = os.readlink(f"/proc/{name}/root")
+        except FileNotFoundError:
+            # 进程已退出（或已成为僵尸进程）
+            continue
+        except OSError:
+            # 读不到根目录时按属主保守判断
+            with contextlib.suppress(OSError):
+                if os.stat(f"/proc/{name}").st_uid == UNPRIVILEGED_UID:
+                    pids.append(int(name))
+            continue
+        if root == jail or root.startswith(jail + os.sep):
+            pids.append(int(name))
+    return pids
+
+
+def _kill_jail_processes(jail_path: Path, rounds: int = 20) -> int:
+    """终止监狱中残留的全部进程（逐轮扫描，覆盖扫描期间新 fork 的进程），返回首轮发现的进程数。"""
+    found = 0
+    for attempt in range(rounds):
+        pids = _jail_processes(jail_path)
+        if attempt == 0:
+            found = len(pids)
+        if not pids:
+            return found
+        for pid in pids:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+        time.sleep(0.01)
+    print(f"[Sandbox] Processes still running in {jail_path} after {rounds} kill rounds")
+    return found
+
+
+def _runner_can_write(st: os.stat_result) -> bool:
+    """按属主 / 属组 / 其他用户的权限位判断降权后的评测进程能否写入（附加组沿用服务进程的）。"""
+    if st.st_uid == UNPRIVILEGED_UID:
+        return bool(st.st_mode & stat.S_IWUSR)
+    if st.st_gid == UNPRIVILEGED_GID or st.st_gid in os.getgroups():
+        return bool(st.st_mode & stat.S_IWGRP)
+    return bool(st.st_mode & stat.S_IWOTH)
+
+
+def _remove_entry(entry: os.DirEntry) -> None:
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path, ignore_errors=True)
+    else:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(entry.path)
+
+
+def _scrub_runner_writes(jail_path: Path) -> None:
+    """
+    遍历整个监狱，删除评测进程可写的每个目录中基础环境里没有的条目，以及其中属于评测用户的条目。
+    基础环境中原有的条目若已被评测进程替换则无法还原，抛出异常，由监狱池销毁该监狱。
+    """
+    pending = [PurePosixPath()]
+    while pending:
+        relative = pending.pop()
+        directory = jail_path / relative
+        writable = _runner_can_write(os.lstat(directory))
+        base_dir = os.path.join(CHROOT_JAIL_PATH, relative)
+        base_names = set(os.listdir(base_dir)) if writable and os.path.isdir(base_dir) else set()
+        with os.scandir(directory) as it:
+            entries = list(it)
+        for entry in entries:
+            # 只有在可写目录中评测进程才能新建、替换条目
+            if writable and (
+                entry.name not in base_names or entry.stat(follow_symlinks=False).st_uid == UNPRIVILEGED_UID
+            ):
+                if entry.name in base_names:
+                    raise RuntimeError(f"基础环境中的 /{relative / entry.name} 已被评测进程替换")
+                _remove_entry(entry)
+            elif entry.is_dir(follow_symlinks=False):
+                pending.append(relative / entry.name)
+
+
+def _scrub_jail(jail_path: Path) -> None:
+    """
+    清理一次评测在监狱中留下的内容，使其可以被下一次评测复用。
+    监狱中仍有残留进程时（例如 setsid 脱离进程组的后台进程）终止它们并抛出异常，由监狱池销毁该监狱；
+    否则删除工作目录与入口脚本，并清理评测进程可写的每一个目录。
+    """
+    leftover = _kill_jail_processes(jail_path)
+    if leftover:
+        raise RuntimeError(f"监狱中残留 {leftover} 个进程，不再复用")
+    for name in ("judge_env", "submission_env"):
+        shutil.rmtree(jail_path / name, ignore_errors=True)
+    with contextlib.suppress(FileNotFoundError):
+        (jail_path / "eval_runner.py").unlink()
+    _scrub_runner_writes(jail_path)
+    for tmpd in [jail_path / "tmp", jail_path / "var" / "tmp", jail_path / "usr" / "tmp"]:
+        if tmpd.is_symlink() or not tmpd.is_dir():
+            raise RuntimeError(f"临时目录状态异常: {tmpd}")
+        os.chmod(tmpd, 0o1777)
 
-            script_path_in_jail = jail_path / "eval_runner.py"
-            with open(script_path_in_jail, "w", encoding="utf-8") as f:
-                f.write(filled_script)
-            os.chmod(script_path_in_jail, 0o644)
-
-            # --- 4. 在沙箱中执行子进程 ---
-            # 命令中的路径是 chroot 后的相对路径
-            command = [python_executable, "eval_runner.py"]
-
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                timeout=310, # 比内部CPU限制稍长
-                preexec_fn=lambda: _setup_sandbox_and_demote_privileges(jail_path_str),
-            )
 
-            # --- 5. 解析结果 ---
-            if result.stdout:
-                try:
-                    return json.loads(result.stdout.strip())
-                except json.JSONDecodeError:
-                    return {"status": "ERROR", "score": 0.0, "logs": f"无法解析评测结果JSON: {result.stdout}\n[stderr]: {result.stderr}"}
-            else:
-                return {"status": "ERROR", "score": 0.0, "logs": f"评测脚本没有输出到stdout。\n[stderr]: {result.stderr}\n返回码: {result.returncode}"}
-
-        except Exception as e:
-            import traceback
-            error_info = f"执行评测的工作进程发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
-            return {"status": "ERROR", "score": 0.0, "logs": error_info}
-
-import hashlib, hmac, json
-
-async def post_results_to_webapp(submission_id: str, result: dict, callback_url: str):
-    """向 webapp 发送回调请求（签名）"""
-    payload = {"submissionId": submission_id, **result}
-    # canonical json
-    def canonical(obj):
-        if obj is None or not isinstance(obj, (dict, list)):
-            return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
-        if isinstance(obj, list):
-            return "[" + ",".join(canonical(x) for x in obj) + "]"
-        keys = sorted(obj.keys())
-        return "{" + ",".join(json.dumps(k, ensure_ascii=False) + ":" + canonical(obj[k]) for k in keys) + "}"
-    payload_str = canonical(payload)
-    content_hash = hashlib.sha256(payload_str.encode("utf-8")).hexdigest()
-    import time
-    ts = str(int(time.time()))
-    sign = hmac.new(settings.SHARED_SECRET.encode("utf-8"), f"{ts}\n{content_hash}".encode("utf-8"), hashlib.sha256).hexdigest()
-    headers = {
-        "Content-Type": "application/json",
-        "X-Timestamp": ts,
-        "X-Sign": sign,
-        "X-Content-Hash": content_hash,
-    }
-    print(f"[Callback] Sending results for submission {submission_id}: {json.dumps(payload)}")
-    async with httpx.AsyncClient() as client:
+def _remove_jail(jail_path: Path) -> None:
+    shutil.rmtree(jail_path, ignore_errors=True)
+
+
+def _destroy_pooled_jail(jail_path: Path) -> None:
+    """销毁预热池中的监狱：先终止其中残留的进程，再删除目录。"""
+    _kill_jail_processes(jail_path)
+    _remove_jail(jail_path)
+
+
+def _jail_mode() -> str:
+    return (settings.JAIL_MODE or "COPY").strip().upper()
+
+
+# 预热的监狱池：启动时由 main.py 的 lifespan 调用 start()/stop()。OVERLAY 模式无需预热。
+jail_pool = JailPool(
+    build=_new_base_jail,
+    scrub=_scrub_jail,
+    destroy=_destroy_pooled_jail,
+    size=settings.JAIL_POOL_SIZE if _jail_mode() == "COPY" else 0,
+    max_uses=settings.JAIL_POOL_MAX_USES,
+)
+
+
+def _new_overlay_workspace(submission: str | Path) -> Path:
+    """
+    OVERLAY 模式下每次评测在宿主上只需要一个很小的目录：
+    root/（overlay 挂载点）、scratch/（tmpfs 挂载点）、解压后的提交与评测入口脚本。
+    """
+    os.makedirs(RUNTIME_JAIL_ROOT, exist_ok=True)
+    os.chmod(RUNTIME_JAIL_ROOT, 0o755)
+    workspace = Path(tempfile.mkdtemp(prefix="eval_ovl_", dir=RUNTIME_JAIL_ROOT))
+    try:
+        workspace.chmod(0o755)
+        (workspace / "root").mkdir(0o755)
+        (workspace / "scratch").mkdir(0o700)
+        (workspace / "submission_env").mkdir(0o755)
+        _stage_submission(submission, workspace / "submission_env")
+    except BaseException:
+        shutil.rmtree(workspace, ignore_errors=True)
+        raise
+    runner_path = workspace / "eval_runner.py"
+    runner_path.write_text(_render_eval_runner("judge_env", "submission_env", PYTHON_EXECUTABLE_IN_JAIL), encoding="utf-8")
+    os.chmod(runner_path, 0o644)
+    return workspace
+
+
+# fork 出的中间进程关闭文件描述符时的上限（在父进程导入时读取）
+_MAX_FD = os.sysconf("SC_OPEN_MAX")
+
+
+def _close_fds_except(keep: int) -> None:
+    os.closerange(0, keep)
+    os.closerange(keep + 1, _MAX_FD)
+
+
+def _relay_exit(pid: int, status_r: int) -> None:
+    """
+    命名空间外的中间进程：不持有任何管道（Popen 才能在评测脚本 exec 后立即返回，输出在评测结束时才读到 EOF），
+    等待 1 号进程转交评测进程的退出状态并原样退出。不会返回。
+    """
+    status = 255 << 8
+    try:
+        _close_fds_except(status_r)
+        data = os.read(status_r, 32)
+        _, status = os.waitpid(pid, 0)
+        if data:
+            status = int(data)
+        if os.WIFSIGNALED(status):
+            sig = os.WTERMSIG(status)
+            with contextlib.suppress(OSError, ValueError):
+                signal.signal(sig, signal.SIG_DFL)
+            os.kill(os.getpid(), sig)
+    finally:
+        os._exit(os.WEXITSTATUS(status) if os.WIFEXITED(status) else 255)
+
+
+def _reap_as_init(runner: int, status_w: int) -> None:
+    """
+    新 PID 命名空间中的 1 号进程：回收孤儿进程，直到评测进程退出后把它的退出状态写给中间进程。
+    1 号进程退出时内核终止命名空间中残留的全部进程。不会返回。
+    """
+    try:
+        _close_fds_except(status_w)
+        while True:
+            pid, status = os.wait()
+            if pid == runner:
+                os.write(status_w, str(status).encode())
+                break
+    finally:
+        os._exit(0)
+
+
+def _enter_pid_namespace(flags: int = 0) -> None:
+    """
+    在 preexec_fn 中调用：创建 PID 命名空间（以及 flags 指定的其他命名空间）后 fork 两次，只在评测进程中返回。
+    评测进程及其全部后代（包括 setsid 脱离会话的后台进程）都在该命名空间中，评测结束即随 1 号进程一并终止。
+
+    评测进程不做 1 号进程：1 号进程会忽略未设置处理函数的信号（包括超出 RLIMIT_CPU 时的 SIGXCPU），
+    因此由一个只负责回收的 1 号进程 fork 出评测进程。wait4 得到的 rusage 覆盖全部三个进程。
+    """
+    status_r, status_w = os.pipe()
+    os.unshare(os.CLONE_NEWPID | flags)
+    pid = os.fork()
+    if pid != 0:
+        os.close(status_w)
+        _relay_exit(pid, status_r)
+    os.close(status_r)
+    try:
+        runner = os.fork()
+    except BaseException:
+        os._exit(255)
+    if runner != 0:
+        _reap_as_init(runner, status_w)
+    os.close(status_w)
+
+
+def _setup_overlay_jail(workspace: str, judge_dir: str, tmpfs_size: str = settings.JAIL_TMPFS_SIZE) -> str:
+    """
+    在子进程（preexec_fn）中调用：进入私有挂载命名空间，
+    以只读的 CHROOT_JAIL_PATH 为下层、每次评测独立的 tmpfs 为上层挂载 overlay，
+    并把评测包、提交目录与入口脚本只读绑定进去。返回监狱根目录。
+
+    子进程及其后代退出后命名空间随之销毁，所有挂载自动消失，无需逐文件清理。
+    """
+    os.unshare(os.CLONE_NEWNS)
+    mounts.make_mounts_private()
+
+    root = os.path.join(workspace, "root")
+    scratch = os.path.join(workspace, "scratch")
+    mounts.mount_tmpfs(scratch, tmpfs_size)
+    upper = os.path.join(scratch, "upper")
+    work = os.path.join(scratch, "work")
+    os.mkdir(upper, 0o755)
+    os.mkdir(work, 0o755)
+    mounts.mount_overlay(CHROOT_JAIL_PATH, upper, work, root)
+
+    for name, source in (("judge_env", judge_dir), ("submission_env", os.path.join(workspace, "submission_env"))):
+        target = os.path.join(root, name)
+        os.mkdir(target, 0o755)
+        mounts.bind_mount(source, target, readonly=True)
+
+    runner_target = os.path.join(root, "eval_runner.py")
+    os.close(os.open(runner_target, os.O_CREAT | os.O_WRONLY, 0o644))
+    mounts.bind_mount(os.path.join(workspace, "eval_runner.py"), runner_target, readonly=True)
+    return root
+
+
+def _enter_overlay_jail(workspace: str, judge_dir: str, tmpfs_size: str, limits: "RunnerLimits") -> None:
+    """
+    OVERLAY 模式评测子进程的 preexec_fn：先进入新的 PID 命名空间，再在评测进程中挂载监狱、chroot 并降权。
+    评测结束时 1 号进程退出，内核终止残留的后台进程，挂载命名空间随之销毁，cleanup 阶段不会被残留进程占住。
+    """
+    # cgroup 在 fork 之前加入，命名空间中的进程都随之计入
+    if limits.cgroup_procs:
+        _join_cgroup(limits.cgroup_procs)
+    _enter_pid_namespace()
+    _setup_sandbox_and_demote_privileges(
+        _setup_overlay_jail(workspace, judge_dir, tmpfs_size), replace(limits, cgroup_procs=None)
+    )
+
+
+def _parse_runner_output(stdout: str, stderr: str, returncode: int | None) -> dict:
+    if stdout:
+        try:
+            result = json.loads(stdout.strip())
+        except json.JSONDecodeError:
+            result = None
+        if isinstance(result, dict):
+            return result
+        return {"status": "ERROR", "score": 0.0, "logs": f"无法解析评测结果JSON: {stdout}\n[stderr]: {stderr}"}
+    return {"status": "ERROR", "score": 0.0, "logs": f"评测脚本没有输出评测结果。\n[stderr]: {stderr}\n返回码: {returncode}"}
+
+
+@dataclass
+class RunnerLimits:
+    """一次评测子进程实际生效的限制，由题目资源配置、cgroup 与绑核结果共同决定（spawn 与 fork-server 共用）。"""
+    rlimits: dict[str, tuple[int, int]] = field(default_factory=lambda: dict(SANDBOX_RLIMITS))
+    timeout: float = RUNNER_TIMEOUT
+    # 覆盖 SANDBOX_THREAD_ENV 默认值的线程数环境变量
+    env: dict[str, str] = field(default_factory=dict)
+    cpus: CpuAllocation | None = None
+    cgroup_procs: str | None = None
+
+
+def _runner_limits(
+    profile: ResourceProfile,
+    cgroup: EvaluationCgroup | None = None,
+    cpus: CpuAllocation | None = None,
+) -> RunnerLimits:
+    rlimits = dict(SANDBOX_RLIMITS)
+    timeout = RUNNER_TIMEOUT
+    if profile.cpu_time_seconds:
+        rlimits["RLIMIT_CPU"] = (profile.cpu_time_seconds, profile.cpu_time_seconds)
+        # 与默认的 300 / 310 一致：墙钟超时比 CPU 时间上限稍长
+        timeout = profile.cpu_time_seconds + 10
+    if profile.wall_time_seconds:
+        timeout = profile.wall_time_seconds
+    if profile.memory_bytes:
+        rlimits["RLIMIT_AS"] = (profile.memory_bytes, profile.memory_bytes)
+    if profile.disk_bytes:
+        rlimits["RLIMIT_FSIZE"] = (profile.disk_bytes, profile.disk_bytes)
+    if cgroup is not None and cgroup.memory_limited:
+        # 由 cgroup 的 memory.max 限制内存时去掉 RLIMIT_AS：它按虚拟地址空间计，会误伤预留大量地址空间的 BLAS 等库
+        rlimits.pop("RLIMIT_AS", None)
+    if cpus is not None:
+        env = cpus.thread_env()
+    elif profile.threads:
+        env = thread_env(profile.threads)
+    else:
+        env = {}
+    return RunnerLimits(
+        rlimits=rlimits,
+        timeout=timeout,
+        env=env,
+        cpus=cpus,
+        cgroup_procs=cgroup.procs_path if cgroup is not None else None,
+    )
+
+
+def _runner_result(outcome: RunnerOutcome, timeout: float = RUNNER_TIMEOUT) -> tuple[dict, bool]:
+    """把评测子进程的原始输出整理为 (结果, 子进程是否自行结束)，并附上资源用量。"""
+    stdout = outcome.stdout.decode("utf-8", errors="replace")
+    stderr = outcome.stderr.decode("utf-8", errors="replace")
+    if outcome.timed_out:
+        result = {
+            "status": "ERROR",
+            "score": 0.0,
+            "logs": f"评测超时（超过 {timeout:g} 秒），已终止。\n[stderr]: {stderr}",
+        }
+    elif outcome.result_overflow:
+        result = {
+            "status": "ERROR",
+            "score": 0.0,
+            "logs": f"评测结果超过 {RUNNER_RESULT_LIMIT} 字节上限。\n[stderr]: {stderr}",
+        }
+    elif outcome.result is not None:
+        # 结果来自专用通道，stdout 上的任何输出都不影响解析
+        result = _parse_runner_output(outcome.result.decode("utf-8", errors="replace"), stderr, outcome.returncode)
+    else:
+        result = _parse_runner_output(stdout, stderr, outcome.returncode)
+    truncated = outcome.truncated_bytes + int(result.pop("truncated_bytes", 0) or 0)
+    if outcome.usage is not None:
+        result["usage"] = {**outcome.usage, "output_truncated_bytes": truncated}
+    return result, not outcome.timed_out
+
+
+def _runner_env(limits: RunnerLimits) -> dict[str, str]:
+    """
+    评测子进程的环境变量：约束并行线程数，避免科学计算库大量并发；
+    题目配置了线程数或启用绑核时，线程数与之一致。
+    """
+    return {**SANDBOX_THREAD_ENV, **os.environ, **limits.env}
+
+
+async def _run_runner(preexec_fn: Callable[[], None], limits: RunnerLimits) -> tuple[dict, bool]:
+    """
+    直接在事件循环中启动监狱内的评测脚本，等待期间不占用任何工作线程/进程。
+    preexec_fn 负责在子进程中完成 chroot 与降权（只做系统调用，见 child_process.spawn）。
+    返回 (结果, 子进程是否自行结束)；超时被强制终止时第二项为 False。
+    """
+    # 命令中的路径是 chroot 后的相对路径
+    outcome = await child_process.spawn(
+        [PYTHON_EXECUTABLE_IN_JAIL, "eval_runner.py"],
+        preexec_fn,
+        limits.timeout,
+        output_limit=RUNNER_OUTPUT_LIMIT,
+        result_limit=RUNNER_RESULT_LIMIT,
+        env=_runner_env(limits),
+    )
+    return _runner_result(outcome, limits.timeout)
+
+
+def _cgroups_enabled() -> bool:
+    return settings.CGROUP_ENABLED
+
+
+# cgroup v2 资源控制：每次评测一个叶子 cgroup（memory.max / cpu.max / pids.max）
+cgroup_manager = CgroupManager(
+    root=settings.CGROUP_ROOT,
+    memory_max=settings.CGROUP_MEMORY_MAX,
+    cpu_max=settings.CGROUP_CPU_MAX,
+    pids_max=settings.CGROUP_PIDS_MAX,
+)
+
+
+def _new_cgroup(profile: ResourceProfile) -> EvaluationCgroup | None:
+    if not _cgroups_enabled():
+        return None
+    try:
+        # 题目配置的内存与线程数覆盖全局的 memory.max / cpu.max
+        return cgroup_manager.create(memory_max=profile.memory_bytes, cpu_max=profile.threads)
+    except (CgroupSetupError, OSError) as e:
+        # cgroup 不可用时仍按 rlimit 限制执行评测
+        print(f"[Cgroup] Failed to create evaluation cgroup, falling back to rlimits only: {e}")
+        return None
+
+
+async def _run_in_cgroup(
+    start: Callable[[RunnerLimits], Awaitable[tuple[dict, bool]]],
+    profile: ResourceProfile,
+    cpus: CpuAllocation | None = None,
+) -> tuple[dict, bool]:
+    """在独立 cgroup 中运行评测子进程；结束后读回用量并删除 cgroup（同时终止残留进程）。"""
+    cgroup = _new_cgroup(profile)
+    try:
+        result, finished = await start(_runner_limits(profile, cgroup, cpus))
+        if cpus is not None:
+            result.setdefault("usage", {})["cpus"] = list(cpus.cpus)
+        if cgroup is not None:
+            usage = cgroup.usage()
+            cgroup_manager.record(usage)
+            result["usage"] = {**result.get("usage", {}), **usage}
+            if usage.get("oom_killed") and result.get("status") != "COMPLETED":
+                result["logs"] = f"评测进程超出内存限制（{cgroup.memory_max}）被终止。\n{result.get('logs', '')}"
+        return result, finished
+    finally:
+        if cgroup is not None:
+            await blocking_pool.run("cgroup_cleanup", cgroup.destroy)
+
+
+async def _run_runner_in_jail(jail_path: Path, limits: RunnerLimits) -> tuple[dict, bool]:
+    return await _run_runner(lambda: _setup_sandbox_and_demote_privileges(str(jail_path), limits), limits)
+
+
+def _fork_server_enabled() -> bool:
+    # zygote 运行在监狱解释器中，无法加载宿主的 seccomp 绑定；OVERLAY 监狱只存在于子进程的挂载命名空间中
+    return settings.FORK_SERVER_ENABLED and _jail_mode() == "COPY" and not settings.ENABLE_SECCOMP
+
+
+# 预导入科学计算栈的 fork-server：启动时由 main.py 的 lifespan 调用 start()/stop()
+fork_server = ForkServer(
+    python_executable=PYTHON_EXECUTABLE_IN_JAIL,
+    base_jail=CHROOT_JAIL_PATH,
+    preload=[name.strip() for name in settings.FORK_SERVER_PRELOAD.split(",") if name.strip()],
+    env={**SANDBOX_THREAD_ENV, **os.environ},
+)
+
+
+async def _run_runner_in_fork_server(jail_path: Path, limits: RunnerLimits) -> tuple[dict, bool]:
+    outcome = await fork_server.run(
+        jail_path,
+        rlimits=limits.rlimits,
+        cgroup_procs=limits.cgroup_procs,
+        cpus=list(limits.cpus.cpus) if limits.cpus is not None else None,
+        env=limits.env,
+        uid=UNPRIVILEGED_UID,
+        gid=UNPRIVILEGED_GID,
+        timeout=limits.timeout,
+        output_limit=RUNNER_OUTPUT_LIMIT,
+        result_limit=RUNNER_RESULT_LIMIT,
+    )
+    return _runner_result(outcome, limits.timeout)
+
+
+async def _run_runner_for_jail(jail_path: Path, limits: RunnerLimits) -> tuple[dict, bool]:
+    """fork-server 可用时由其 fork 子进程执行，否则（或 fork-server 故障时）逐次启动解释器。"""
+    if _fork_server_enabled() and fork_server.usable_here():
+        try:
+            return await _run_runner_in_fork_server(jail_path, limits)
+        except ForkServerError as e:
+            print(f"[Sandbox] Fork server unavailable, falling back to spawning the runner: {e}")
+    return await _run_runner_in_jail(jail_path, limits)
+
+
+def _extraction_error(e: Exception) -> dict:
+    return {"status": "ERROR", "score": 0.0, "logs": f"提交文件解压失败: {e}"}
+
+
+async def _execute_in_overlay_jail(submission: str, judge_dir: str, timer: StageTimer) -> dict:
+    """OVERLAY 模式：监狱的创建与销毁都是常数次挂载操作。"""
+    profile = load_profile(judge_dir)
+    try:
+        workspace = await blocking_pool.run("extract", _new_overlay_workspace, submission, timer=timer)
+    except (zipfile.BadZipFile, ValueError) as e:
+        return _extraction_error(e)
+    except Exception as e:
+        import traceback
+        error_info = f"准备评测沙箱时发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return {"status": "ERROR", "score": 0.0, "logs": error_info}
+    # 题目配置了磁盘配额时，可写层（tmpfs）大小与之一致
+    tmpfs_size = str(profile.disk_bytes) if profile.disk_bytes else settings.JAIL_TMPFS_SIZE
+    try:
+        async with resource_slot(timer, profile) as cpus:
+            def start(limits: RunnerLimits):
+                return _run_runner(
+                    lambda: _enter_overlay_jail(str(workspace), judge_dir, tmpfs_size, limits),
+                    limits,
+                )
+
+            result, _ = await timer.measure("run", _run_in_cgroup(start, profile, cpus))
+        return result
+    except Exception as e:
+        import traceback
+        error_info = f"执行评测子进程时发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return {"status": "ERROR", "score": 0.0, "logs": error_info}
+    finally:
+        await blocking_pool.run("cleanup", _remove_jail, workspace, timer=timer)
+
+
+async def _execute_judge_code_async(
+    submission: str,
+    judge_dir: str,
+    pool: JailPool | None = None,
+    timer: StageTimer | None = None,
+) -> dict:
+    """
+    在一个使用 chroot, seccomp 和无特权用户隔离的沙箱中执行评测。
+    submission 为提交 ZIP（直接解压进监狱）或已解压的目录。
+    COPY 模式下基础监狱从预热池中取用；填充与清理等阻塞步骤放到线程中执行，评测子进程由事件循环直接管理。
+    资源限制取自评测包中的 resources.json（见 resource_profile.py），未配置的项使用默认值。
+    """
+    timer = timer or StageTimer()
+    if _jail_mode() == "OVERLAY":
+        return await _execute_in_overlay_jail(submission, judge_dir, timer)
+    profile = load_profile(judge_dir)
+    pool = pool or jail_pool
+    try:
+        jail = await timer.measure("jail_acquire", pool.acquire())
+    except Exception as e:
+        import traceback
+        error_info = f"准备评测沙箱时发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return {"status": "ERROR", "score": 0.0, "logs": error_info}
+    # 只有正常结束的评测才允许复用监狱，超时或异常时直接销毁；复用前的清理还会检查残留进程
+    reusable = False
+    try:
         try:
-            response = await client.post(callback_url, json=payload, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            print(f"[Callback] Successfully sent callback for submission {submission_id}")
-        except httpx.HTTPStatusError as e:
-            response_body = e.response.text if e.response.text else "(empty body)"
-            print(f"[Callback] Error sending callback for {submission_id}: Status {e.response.status_code}, Body: {response_body}")
-        except httpx.TimeoutException as e:
-            print(f"[Callback] Timeout sending callback for {submission_id}: {e}")
-        except Exception as e:
-            print(f"[Callback] An unexpected error occurred during callback for {submission_id}: {e}")
+            await blocking_pool.run("extract", _populate_jail, jail.path, submission, judge_dir, timer=timer)
+        except (zipfile.BadZipFile, ValueError) as e:
+            # 评测代码尚未运行，监狱清理后仍可复用
+            reusable = True
+            return _extraction_error(e)
+        # 只在评测子进程运行期间占用 CPU 核与准入预算，解压与清理不占用
+        async with resource_slot(timer, profile) as cpus:
+            result, reusable = await timer.measure(
+                "run", _run_in_cgroup(lambda limits: _run_runner_for_jail(jail.path, limits), profile, cpus)
+            )
+        return result
+    except Exception as e:
+        import traceback
+        error_info = f"执行评测子进程时发生异常: {type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return {"status": "ERROR", "score": 0.0, "logs": error_info}
+    finally:
+        await timer.measure("cleanup", pool.release(jail, reusable=reusable))
+
+
+def _execute_judge_code(
+    submission_dir: str,
+    judge_dir: str,
+) -> dict:
+    """同步入口：供调试页面等不在事件循环中的调用方使用（不使用预热池，每次新建监狱）。"""
+    one_shot_pool = JailPool(build=_new_base_jail, scrub=_scrub_jail, destroy=_destroy_pooled_jail, size=0, max_uses=1)
+    return asyncio.run(_execute_judge_code_async(str(submission_dir), str(judge_dir), one_shot_pool))
+
+async def _settle_delivery(submission_ids: list[str], callback_url: str, delivery: Awaitable[bool]) -> bool:
+    """等待一次投递（含重试）结束，并把结果记入发件箱；未投递的结果由发件箱稍后重放。"""
+    delivered = False
+    try:
+        delivered = await delivery
+    finally:
+        await result_outbox.settle(submission_ids, callback_url, delivered)
+    return delivered
+
+
+async def submit_results_to_webapp(submission_id: str, result: dict, callback_url: str) -> asyncio.Task:
+    """
+    结果写入发件箱后交给共享的回调发送器在后台投递（签名，失败时自动重试），不等待投递完成。
+    返回投递任务，其结果为是否投递成功。
+    """
+    print(f"[Callback] Sending results for submission {submission_id}: status={result.get('status')} score={result.get('score')}")
+    await result_outbox.record([(submission_id, result)], callback_url)
+    return callback_dispatcher.spawn(
+        _settle_delivery([submission_id], callback_url, callback_dispatcher.send(submission_id, result, callback_url))
+    )
+
+
+async def submit_batch_results_to_webapp(results: list[tuple[str, dict]], callback_url: str) -> asyncio.Task:
+    """
+    批量评测的聚合回调：一次签名 POST 携带全部提交的结果，写入发件箱后在后台投递。
+    投递失败时发件箱按单条结果逐个重放。
+    """
+    print(f"[Callback] Sending aggregated results for {len(results)} submissions")
+    await result_outbox.record(results, callback_url)
+    return callback_dispatcher.spawn(
+        _settle_delivery(
+            [submission_id for submission_id, _ in results], callback_url, callback_dispatcher.send_batch(results, callback_url)
+        )
+    )
+
+
+async def post_results_to_webapp(submission_id: str, result: dict, callback_url: str) -> bool:
+    """向 webapp 发送回调请求并等待投递结束（见 submit_results_to_webapp）。返回是否投递成功。"""
+    return await (await submit_results_to_webapp(submission_id, result, callback_url))
+
+
+async def post_batch_results_to_webapp(results: list[tuple[str, dict]], callback_url: str) -> bool:
+    """发送聚合回调并等待投递结束（见 submit_batch_results_to_webapp）。返回是否投递成功。"""
+    return await (await submit_batch_results_to_webapp(results, callback_url))
+
+
+def runtime_ready(judge_dir: Path) -> None:
+    """评测入队前需要等待的条件：CHROOT 后端的运行环境随服务就绪，无需等待（DOCKER 后端在此等待题目镜像）。"""
+    return None
+
+
+async def run_in_sandbox(
+    submission_id: str,
+    submission_path: Path,
+    judge_dir: Path,
+    timer: StageTimer | None = None,
+) -> dict:
+    """
+    准备环境并在沙箱子进程中执行评测，返回结果字典（不回调）。
+
+    submission_path 为 ingest 阶段落盘的 ZIP 文件，评测结束后由本函数删除；
+    judge_dir 为评测包缓存中已解压的目录（只读使用，不在此处删除）。
+    结果中附带 usage（子进程资源用量）与 stages（各阶段耗时，含调用方记录的排队等待）。
+    """
+    print(f"[Sandbox] Starting evaluation for submission {submission_id}")
+    timer = timer or StageTimer()
+    try:
+        # 提交 ZIP 直接解压进监狱的工作目录，不再经过中间临时目录
+        result_dict = await _execute_judge_code_async(str(submission_path), str(judge_dir), timer=timer)
+        result_dict["stages"] = timer.as_dict()
+        print(f"[Sandbox] Evaluation completed for submission {submission_id}: {result_dict.get('status', 'UNKNOWN')}")
+        return result_dict
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(submission_path)
+        print(f"[Sandbox] Stage timings for submission {submission_id}: {timer.summary()}")
+
 
 async def run_in_sandbox_and_callback(
     submission_id: str,
-    submission_data: bytes,
-    judge_data: bytes,
-    semaphore: asyncio.Semaphore,
-    executor: ProcessPoolExecutor,
+    submission_path: Path,
+    judge_dir: Path,
     callback_url: str,
+    timer: StageTimer | None = None,
 ):
     """
-    准备环境，在工作进程中执行评测，然后调用回调函数发送结果。
+    准备环境，在沙箱子进程中执行评测，然后调用回调函数发送结果。
     """
-    print(f"[Sandbox] Starting evaluation for submission {submission_id}")
-    async with semaphore:
-        print(f"[Sandbox] Semaphore acquired for submission {submission_id}")
-        loop = asyncio.get_running_loop()
-        with tempfile.TemporaryDirectory() as tmpdir:
-            workspace = Path(tmpdir)
-            submission_dir = workspace / "submission"
-            judge_dir = workspace / "judge"
-            submission_dir.mkdir()
-            judge_dir.mkdir()
-            with zipfile.ZipFile(io.BytesIO(submission_data)) as zf:
-                _safe_extractall(zf, submission_dir)
-            with zipfile.ZipFile(io.BytesIO(judge_data)) as zf:
-                _safe_extractall(zf, judge_dir)
-            result_dict = await loop.run_in_executor(
-                executor,
-                _execute_judge_code,
-                str(submission_dir),
-                str(judge_dir),
-            )
-            print(f"[Sandbox] Evaluation completed for submission {submission_id}: {result_dict.get('status', 'UNKNOWN')}")
-        await post_results_to_webapp(submission_id, result_dict, callback_url)
+    timer = timer or StageTimer()
+    result_dict = await run_in_sandbox(submission_id, submission_path, judge_dir, timer)
+    await timer.measure("callback", post_results_to_webapp(submission_id, result_dict, callback_url))
+    print(f"[Sandbox] Callback for submission {submission_id} took {timer.durations['callback']:.3f}s")
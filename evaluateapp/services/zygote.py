@@ -0,0 +1,139 @@
+"""
+Fork-server（zygote）进程：在基础 chroot 环境中以 root 身份常驻，
+启动时预先导入一组较重的模块（numpy、pandas 等），之后为每次评测 fork 一个子进程。
+
+本文件由 services/fork_server.py 读取源码后以 `python3 -c` 在监狱解释器中执行，
+因此只能依赖标准库，不能导入 evaluateapp 的任何模块。
+
+协议：
+- 请求：父进程通过 SOCK_SEQPACKET 控制套接字发送一条 JSON（id、jail、资源限制、cgroup、绑定的 CPU、环境变量、降权身份），
+  并用 SCM_RIGHTS 附带三个文件描述符（子进程的 stdout / stderr / 结果通道写端）；
+- 回报：本进程 stdout 上逐行输出 JSON：{"event": "ready"}、{"event": "started"}、{"event": "exited"}（含退出码与 wait4 得到的 rusage）。
+"""
+import json
+import os
+import resource
+import selectors
+import socket
+import sys
+import traceback
+
+
+def _report(**event) -> None:
+    # fork 前必须 flush，避免缓冲区内容被子进程继承后重复写出
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def _preload(modules: list[str]) -> tuple[list[str], dict[str, str]]:
+    loaded, failed = [], {}
+    for name in modules:
+        try:
+            __import__(name)
+            loaded.append(name)
+        except Exception as e:
+            failed[name] = f"{type(e).__name__}: {e}"
+    return loaded, failed
+
+
+def _run_child(request: dict, out_fd: int, err_fd: int, result_fd: int, host_root_fd: int) -> None:
+    """在 fork 出的子进程中执行：重定向输出、限制资源、切换到评测监狱并降权，然后运行 eval_runner.py。"""
+    try:
+        os.setsid()
+        os.dup2(out_fd, 1)
+        os.dup2(err_fd, 2)
+        # 评测结果写入专用通道（与 child_process.RESULT_FD_ENV 一致），不与 stdout 混在一起
+        os.environ["EVAL_RESULT_FD"] = str(result_fd)
+
+        for name, (soft, hard) in request["rlimits"].items():
+            resource.setrlimit(getattr(resource, name), (soft, hard))
+        # 绑核并按分配的核数设置线程数（只影响评测中新启动的进程与尚未初始化线程池的库，
+        # zygote 预导入的库已按启动时的线程数初始化）
+        if request.get("cpus"):
+            os.sched_setaffinity(0, request["cpus"])
+        os.environ.update(request.get("env", {}))
+
+        # 基础环境 chroot 之外的真实根目录只通过继承的目录描述符访问，进入评测监狱后立即关闭
+        os.fchdir(host_root_fd)
+        os.chroot(".")
+        # 加入本次评测的 cgroup（cgroupfs 只在宿主根目录下可见）
+        if request.get("cgroup_procs"):
+            with open(request["cgroup_procs"], "w") as f:
+                f.write("0")
+        os.chroot(request["jail"])
+        os.chdir("/")
+        os.closerange(3, result_fd)
+        os.closerange(result_fd + 1, os.sysconf("SC_OPEN_MAX"))
+
+        os.setgid(request["gid"])
+        os.setuid(request["uid"])
+        os.umask(0o077)
+    except BaseException:
+        os.write(2, f"fork-server 子进程初始化失败:\n{traceback.format_exc()}".encode("utf-8", "replace"))
+        os._exit(1)
+
+    code = 0
+    try:
+        import runpy
+        sys.argv = ["eval_runner.py"]
+        runpy.run_path("eval_runner.py", run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+    os._exit(code)
+
+
+def main() -> None:
+    config = json.loads(sys.argv[1])
+    control = socket.socket(fileno=config["control_fd"])
+    host_root_fd = config["host_root_fd"]
+
+    loaded, failed = _preload(config["preload"])
+    _report(event="ready", pid=os.getpid(), preloaded=loaded, failed=failed)
+
+    selector = selectors.DefaultSelector()
+    selector.register(control, selectors.EVENT_READ, None)
+    while True:
+        for key, _ in selector.select():
+            if key.data is None:
+                msg, fds, _, _ = socket.recv_fds(control, 65536, 3)
+                if not msg:
+                    # 父进程关闭了控制套接字：退出（已 fork 的子进程由父进程负责终止）
+                    return
+                request = json.loads(msg)
+                out_fd, err_fd, result_fd = fds
+                pid = os.fork()
+                if pid == 0:
+                    selector.close()
+                    control.close()
+                    _run_child(request, out_fd, err_fd, result_fd, host_root_fd)
+                for fd in fds:
+                    os.close(fd)
+                pidfd = os.pidfd_open(pid)
+                selector.register(pidfd, selectors.EVENT_READ, (request["id"], pid))
+                _report(event="started", id=request["id"], pid=pid)
+            else:
+                request_id, pid = key.data
+                selector.unregister(key.fileobj)
+                os.close(key.fileobj)
+                _, status, ru = os.wait4(pid, 0)
+                _report(
+                    event="exited",
+                    id=request_id,
+                    pid=pid,
+                    returncode=os.waitstatus_to_exitcode(status),
+                    # 与 child_process.usage_from_rusage 的参数顺序一致
+                    rusage=[ru.ru_utime, ru.ru_stime, ru.ru_maxrss, ru.ru_inblock, ru.ru_oublock],
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+
+from services import callbacks as callbacks_module
+from services.callbacks import CallbackDispatcher
+
+URL = "http://webapp/api/submissions/callback"
+
+
+def _dispatcher(handler, **kwargs) -> CallbackDispatcher:
+    """回调发送器，请求由 handler 应答而不走网络；重试间隔为 0。"""
+    options = {"max_concurrency": 2, "max_attempts": 3, "retry_base": 0.0, "retry_max": 0.0, "timeout": 5.0}
+    options.update(kwargs)
+    dispatcher = CallbackDispatcher(**options)
+    dispatcher._ensure_client = lambda: _mock_client(dispatcher, handler)
+    return dispatcher
+
+
+def _mock_client(dispatcher: CallbackDispatcher, handler) -> httpx.AsyncClient:
+    if dispatcher._client is None:
+        dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        dispatcher._semaphore = asyncio.Semaphore(dispatcher.max_concurrency)
+    return dispatcher._client
+
+
+def _replies(*statuses: int):
+    """依次以给定状态码应答，记录每次请求。"""
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(statuses[min(len(requests), len(statuses)) - 1])
+
+    return handler, requests
+
+
+def test_retries_retryable_status_until_delivered():
+    async def scenario():
+        handler, requests = _replies(503, 429, 200)
+        dispatcher = _dispatcher(handler)
+        try:
+            delivered = await dispatcher.send("s1", {"status": "COMPLETED"}, URL)
+        finally:
+            await dispatcher.close()
+        assert delivered is True
+        assert len(requests) == 3
+        assert all(request.headers["X-Sign"] for request in requests)
+        status = dispatcher.status()
+        assert (status["posts"], status["retries"], status["delivered"], status["failed"]) == (3, 2, 1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_gives_up_after_max_attempts():
+    async def scenario():
+        handler, requests = _replies(500)
+        dispatcher = _dispatcher(handler, max_attempts=2)
+        try:
+            assert await dispatcher.send("s1", {}, URL) is False
+        finally:
+            await dispatcher.close()
+        assert len(requests) == 2
+        assert dispatcher.status()["failed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_does_not_retry_rejected_callbacks():
+    async def scenario():
+        # 验签失败等 4xx 重试也不会成功，只发送一次
+        handler, requests = _replies(401)
+        dispatcher = _dispatcher(handler)
+        try:
+            assert await dispatcher.send("s1", {}, URL) is False
+        finally:
+            await dispatcher.close()
+        assert len(requests) == 1
+        assert dispatcher.status()["retries"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_retries_connection_errors():
+    async def scenario():
+        attempts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            attempts.append(request)
+            if len(attempts) < 3:
+                raise httpx.ConnectError("connection refused", request=request)
+            return httpx.Response(200)
+
+        dispatcher = _dispatcher(handler)
+        try:
+            assert await dispatcher.send("s1", {}, URL) is True
+        finally:
+            await dispatcher.close()
+        assert len(attempts) == 3
+
+    asyncio.run(scenario())
+
+
+def test_backoff_is_full_jitter_capped_by_retry_max(monkeypatch):
+    monkeypatch.setattr(callbacks_module.random, "uniform", lambda low, high: (low, high))
+    dispatcher = CallbackDispatcher(max_concurrency=1, max_attempts=5, retry_base=0.5, retry_max=3.0, timeout=1.0)
+    assert dispatcher._backoff(1) == (0, 1.0)
+    assert dispatcher._backoff(2) == (0, 2.0)
+    assert dispatcher._backoff(6) == (0, 3.0)
+
+
+def test_spawned_deliveries_are_held_and_cancelled_on_close():
+    async def scenario():
+        handler, _ = _replies(200)
+        dispatcher = _dispatcher(handler)
+        release = asyncio.Event()
+
+        async def delivery() -> bool:
+            await release.wait()
+            return True
+
+        finished = dispatcher.spawn(delivery())
+        stuck = dispatcher.spawn(asyncio.Event().wait())
+        assert dispatcher.status()["background"] == 2
+        release.set()
+        assert await finished is True
+        assert dispatcher.status()["background"] == 1
+        dispatcher.timeout = 0.01
+        await dispatcher.close()
+        assert stuck.cancelled()
+        assert dispatcher.status()["background"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+
+from services.child_process import RESULT_FD_ENV, HeadTailBuffer, spawn
+
+
+def _marker(truncated: int) -> bytes:
+    return f"\n...[输出过长，已省略 {truncated} 字节]...\n".encode("utf-8")
+
+
+def test_output_within_limit_is_kept_verbatim():
+    buffer = HeadTailBuffer(8)
+    buffer.feed(b"abc")
+    buffer.feed(b"defgh")
+    assert buffer.truncated == 0
+    assert buffer.getvalue() == b"abcdefgh"
+
+
+def test_one_byte_over_limit_drops_the_first_tail_byte():
+    buffer = HeadTailBuffer(8)
+    buffer.feed(b"abcdefghi")
+    assert buffer.truncated == 1
+    assert buffer.getvalue() == b"abcd" + _marker(1) + b"fghi"
+
+
+def test_odd_limit_gives_the_extra_byte_to_the_tail():
+    buffer = HeadTailBuffer(7)
+    assert (buffer.head_limit, buffer.tail_limit) == (3, 4)
+    buffer.feed(bytes(range(20)))
+    assert buffer.truncated == 13
+    assert buffer.getvalue() == bytes(range(3)) + _marker(13) + bytes(range(16, 20))
+
+
+def test_chunk_boundaries_do_not_change_the_result():
+    data = bytes(range(256)) * 4
+    whole = HeadTailBuffer(100)
+    whole.feed(data)
+    chunked = HeadTailBuffer(100)
+    for start in range(0, len(data), 7):
+        chunked.feed(data[start:start + 7])
+    assert chunked.truncated == whole.truncated == len(data) - 100
+    assert chunked.getvalue() == whole.getvalue()
+
+
+def test_memory_stays_bounded_by_the_limit():
+    buffer = HeadTailBuffer(64)
+    for _ in range(1000):
+        buffer.feed(b"x" * 1000)
+    assert len(buffer._head) + len(buffer._tail) == 64
+    assert buffer.truncated == 1000 * 1000 - 64
+
+
+def test_head_only_buffer_counts_everything_after_the_limit():
+    buffer = HeadTailBuffer(4, keep_tail=False)
+    buffer.feed(b"abcdef")
+    buffer.feed(b"gh")
+    assert buffer.truncated == 4
+    assert buffer.getvalue() == b"abcd" + _marker(4)
+
+
+def test_zero_limit_keeps_nothing():
+    buffer = HeadTailBuffer(0)
+    buffer.feed(b"abc")
+    assert buffer.truncated == 3
+    assert buffer.getvalue() == _marker(3)
+
+
+def test_spawn_passes_env_and_result_fd_without_touching_the_parent():
+    script = (
+        "import os\n"
+        "print(os.environ['EVAL_TEST_VALUE'])\n"
+        f"os.write(int(os.environ['{RESULT_FD_ENV}']), b'{{\"ok\": true}}')\n"
+    )
+    outcome = asyncio.run(
+        spawn(
+            [sys.executable, "-c", script],
+            lambda: None,
+            timeout=30,
+            output_limit=1024,
+            result_limit=1024,
+            env={"EVAL_TEST_VALUE": "from-parent"},
+        )
+    )
+    assert outcome.returncode == 0
+    assert outcome.stdout == b"from-parent\n"
+    assert outcome.result == b'{"ok": true}'
+    assert RESULT_FD_ENV not in os.environ
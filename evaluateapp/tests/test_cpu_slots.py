@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+from services.cpu_slots import CpuSlotScheduler, ResourceBudget, ResourceGrant
+
+
+def _in_threads(count: int, scenario) -> None:
+    """在 count 个线程中各自用 asyncio.run 运行 scenario(index)，模拟调试页面与主事件循环并发评测。"""
+    errors: list[BaseException] = []
+
+    def run(index: int) -> None:
+        try:
+            asyncio.run(scenario(index))
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not errors
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_release_wakes_a_waiter_on_another_event_loop():
+    scheduler = CpuSlotScheduler([0, 1], slot_size=2)
+    held = asyncio.run(scheduler.acquire())
+    got: list[tuple[int, ...]] = []
+    waiting = threading.Event()
+
+    async def wait_for_cpus():
+        task = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiting.set()
+        allocation = await task
+        got.append(allocation.cpus)
+        scheduler.release(allocation)
+
+    thread = threading.Thread(target=lambda: asyncio.run(wait_for_cpus()))
+    thread.start()
+    assert waiting.wait(timeout=10)
+    assert scheduler.status()["waiting"] == 1
+    scheduler.release(held)
+    thread.join(timeout=30)
+    assert got == [(0, 1)]
+    assert scheduler.status()["free"] == [0, 1]
+
+
+def test_concurrent_event_loops_keep_the_accounting_consistent():
+    scheduler = CpuSlotScheduler([0, 1, 2], slot_size=1)
+    budget = ResourceBudget(cpus=2, memory_bytes=4, default_cpus=1, default_memory_bytes=1)
+    rounds = 200
+
+    async def churn(_):
+        for _ in range(rounds):
+            grant = await budget.acquire(ResourceGrant(cpus=1, memory_bytes=1))
+            allocation = await scheduler.acquire()
+            await asyncio.sleep(0)
+            scheduler.release(allocation)
+            budget.release(grant)
+
+    _in_threads(4, churn)
+    slots = scheduler.status()
+    assert (slots["free"], slots["waiting"], slots["allocations"]) == ([0, 1, 2], 0, 4 * rounds)
+    status = budget.status()
+    assert (status["used_cpus"], status["used_memory_bytes"], status["running"], status["waiting"]) == (0, 0, 0, 0)
+    assert status["admitted"] == 4 * rounds
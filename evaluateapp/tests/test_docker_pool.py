@@ -0,0 +1,123 @@
+import inspect
+import io
+import json
+import tarfile
+
+import pytest
+
+docker = pytest.importorskip("docker")
+
+from services import docker_sandbox
+from services.cpu_slots import CpuAllocation
+from services.resource_profile import ResourceProfile
+
+_UPDATE_SIGNATURE = inspect.signature(docker.APIClient.update_container)
+
+
+def _tar(name: str, data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class _FakeApi:
+    def __init__(self, container):
+        self.container = container
+        self.exec_kwargs = None
+
+    def exec_create(self, container_id, cmd, **kwargs):
+        self.exec_kwargs = kwargs
+        return {"Id": "exec-1"}
+
+    def exec_start(self, exec_id, stream, demux):
+        return iter([(b"hello\n", None), (None, b"warn\n")])
+
+    def exec_inspect(self, exec_id):
+        return {"ExitCode": 0}
+
+
+class _FakeClient:
+    def __init__(self, container):
+        self.api = _FakeApi(container)
+
+
+class _FakeContainer:
+    """docker.models.containers.Container 中被预热池用到的部分；update 按真实 SDK 的签名校验参数。"""
+
+    id = "f" * 64
+    short_id = "f" * 12
+
+    def __init__(self, result: dict):
+        self.client = _FakeClient(self)
+        self.updates: list[dict] = []
+        self.archives: list[tuple[str, list[str]]] = []
+        self.killed = False
+        self._result = json.dumps(result).encode("utf-8")
+
+    def update(self, **kwargs):
+        _UPDATE_SIGNATURE.bind(None, self.id, **kwargs)
+        self.updates.append(kwargs)
+
+    def put_archive(self, path, data):
+        with tarfile.open(fileobj=data) as tar:
+            self.archives.append((path, tar.getnames()))
+        return True
+
+    def stats(self, stream, one_shot):
+        return {"cpu_stats": {"cpu_usage": {"total_usage": 1, "usage_in_usermode": 10, "usage_in_kernelmode": 5}}}
+
+    def get_archive(self, path):
+        return iter([_tar("result.json", self._result)]), {"size": len(self._result)}
+
+    def kill(self):
+        self.killed = True
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    submission = tmp_path / "submission"
+    submission.mkdir()
+    (submission / "main.py").write_text("print(1)\n")
+    judge = tmp_path / "judge"
+    judge.mkdir()
+    (judge / "evaluate.py").write_text("def evaluate(): pass\n")
+    return submission, judge
+
+
+def test_warm_container_applies_profile_limits_with_docker_update(workspace):
+    submission, judge = workspace
+    container = _FakeContainer({"status": "COMPLETED", "score": 0.5, "logs": "ok"})
+    profile = ResourceProfile(memory_bytes=256 * 1024 * 1024, threads=2)
+
+    result, reusable = docker_sandbox._run_in_warm_container(container, submission, judge, None, profile)
+
+    assert result["status"] == "COMPLETED" and result["score"] == 0.5
+    assert reusable is True
+    assert container.updates == [{
+        "mem_limit": 256 * 1024 * 1024,
+        "memswap_limit": 512 * 1024 * 1024,
+        "cpu_period": 100_000,
+        "cpu_quota": 200_000,
+    }]
+
+
+def test_warm_container_pins_cores_and_copies_only_this_judge(workspace):
+    submission, judge = workspace
+    container = _FakeContainer({"status": "COMPLETED", "score": 1.0, "logs": ""})
+    cpus = CpuAllocation((2, 3, 4))
+
+    result, reusable = docker_sandbox._run_in_warm_container(container, submission, judge, cpus, ResourceProfile())
+
+    assert reusable is True
+    update = container.updates[0]
+    assert update["cpuset_cpus"] == "2,3,4"
+    assert (update["cpu_period"], update["cpu_quota"]) == (100_000, 300_000)
+    assert "nano_cpus" not in update
+    [(path, names)] = container.archives
+    assert path == "/workspace"
+    assert {"judge/evaluate.py", "submission/main.py", "eval_runner.py", "result"} <= set(names)
+    assert container.client.api.exec_kwargs["environment"]["OMP_NUM_THREADS"] == "3"
+    assert result["usage"]["cpus"] == [2, 3, 4]
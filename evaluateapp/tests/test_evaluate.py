@@ -0,0 +1,99 @@
+import asyncio
+from pathlib import Path
+
+from api import evaluate as evaluate_module
+from api.evaluate import _evaluation_job, _flight_key, _flights, _Flight
+from services import sandbox as sandbox_module
+
+URL = "http://webapp/api/submissions/callback"
+
+
+class _Lease:
+    judge_hash = "0" * 64
+    path = Path("/nonexistent/judge")
+
+    def __init__(self):
+        self.released = False
+
+    def release(self) -> None:
+        self.released = True
+
+
+class _Upload:
+    path = Path("/nonexistent/submission.zip")
+
+
+def test_flight_notifies_listeners_attached_during_delivery():
+    async def scenario():
+        flight = _Flight("key")
+        received: list[tuple[str, dict]] = []
+
+        async def late(result: dict) -> None:
+            received.append(("late", result))
+
+        async def first(result: dict) -> None:
+            # 通知过程中追加的监听者（例如重复请求）同样会收到结果
+            await asyncio.sleep(0)
+            flight.listeners.append(late)
+            received.append(("first", result))
+
+        flight.listeners.append(first)
+        await flight.deliver({"score": 1.0})
+        assert received == [("first", {"score": 1.0}), ("late", {"score": 1.0})]
+
+    asyncio.run(scenario())
+
+
+def test_flight_calls_back_each_url_once(monkeypatch):
+    async def scenario():
+        submitted: list[tuple[str, str]] = []
+
+        async def submit(submission_id: str, result: dict, callback_url: str) -> None:
+            submitted.append((submission_id, callback_url))
+
+        monkeypatch.setattr(evaluate_module.sandbox, "submit_results_to_webapp", submit)
+        flight = _Flight("key")
+        flight.add_callback("s1", URL)
+        flight.add_callback("s1", URL)
+        flight.add_callback("s1", URL + "?retry=1")
+        await flight.deliver({"score": 1.0})
+        assert submitted == [("s1", URL), ("s1", URL + "?retry=1")]
+
+    asyncio.run(scenario())
+
+
+def test_evaluation_job_returns_before_the_callback_is_delivered(monkeypatch):
+    async def scenario():
+        result = {"status": "ERROR", "score": 0.0, "logs": ""}
+        delivered = asyncio.Event()
+        sent: list[str] = []
+
+        async def run_in_sandbox(submission_id, submission_path, judge_dir, timer):
+            return dict(result)
+
+        async def send(submission_id: str, payload: dict, callback_url: str) -> bool:
+            await delivered.wait()
+            sent.append(submission_id)
+            return True
+
+        monkeypatch.setattr(evaluate_module.sandbox, "run_in_sandbox", run_in_sandbox)
+        monkeypatch.setattr(sandbox_module.callback_dispatcher, "send", send)
+        lease = _Lease()
+        key = _flight_key("s1", "cache-key")
+        flight = _Flight(key)
+        flight.add_callback("s1", URL)
+        _flights[key] = flight
+        job = _evaluation_job(lease, "s1", _Upload(), "cache-key", flight)
+
+        # 回调仍在投递时评测任务已经结束，队列工作者得以释放
+        await asyncio.wait_for(job.run(), timeout=5)
+        assert lease.released
+        assert key not in _flights
+        assert sent == []
+        assert sandbox_module.callback_dispatcher.status()["background"] == 1
+
+        delivered.set()
+        await asyncio.wait_for(asyncio.gather(*sandbox_module.callback_dispatcher._deliveries), timeout=5)
+        assert sent == ["s1"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from services.evaluation_queue import EvaluationJob, EvaluationQueue, QueueFullError
+
+
+def _job(name: str, started: list[str], release: asyncio.Event | None = None) -> EvaluationJob:
+    async def run():
+        started.append(name)
+        if release is not None:
+            await release.wait()
+
+    return EvaluationJob(submission_id=name, run=run)
+
+
+def test_submit_many_rejects_the_whole_batch_when_it_does_not_fit():
+    async def scenario():
+        queue = EvaluationQueue(concurrency=1, max_depth=3)
+        started: list[str] = []
+        queue.submit(_job("first", started))
+        with pytest.raises(QueueFullError):
+            queue.submit_many([_job(f"batch-{i}", started) for i in range(3)])
+        status = queue.status()
+        assert status["queued"] == 1
+        assert status["rejected"] == 3
+        # 剩余容量恰好够用时整批接受
+        queue.submit_many([_job(f"batch-{i}", started) for i in range(2)])
+        assert queue.status()["queued"] == 3
+        assert queue.status()["available_slots"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_raises_with_retry_after_from_backlog():
+    async def scenario():
+        queue = EvaluationQueue(concurrency=2, max_depth=2)
+        queue._avg_duration = 10.0
+        started: list[str] = []
+        queue.submit_many([_job("a", started), _job("b", started)])
+        with pytest.raises(QueueFullError) as excinfo:
+            queue.submit(_job("c", started))
+        # 积压 2 个任务、并发 2、平均耗时 10 秒
+        assert excinfo.value.retry_after == 10
+        assert queue.status()["retry_after_seconds"] == 10
+
+    asyncio.run(scenario())
+
+
+def test_running_jobs_free_queue_slots_but_not_concurrency():
+    async def scenario():
+        queue = EvaluationQueue(concurrency=1, max_depth=1)
+        release = asyncio.Event()
+        started: list[str] = []
+        await queue.start()
+        try:
+            queue.submit(_job("a", started, release))
+            await asyncio.sleep(0)
+            assert started == ["a"]
+            # a 已被 worker 取出，不再计入排队数
+            queue.submit(_job("b", started, release))
+            with pytest.raises(QueueFullError):
+                queue.submit(_job("c", started, release))
+            status = queue.status()
+            assert (status["active"], status["queued"], status["rejected"]) == (1, 1, 1)
+            release.set()
+            for _ in range(10):
+                await asyncio.sleep(0)
+            assert started == ["a", "b"]
+            assert queue.status()["completed"] == 2
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_discards_jobs_that_never_ran():
+    async def scenario():
+        queue = EvaluationQueue(concurrency=1, max_depth=5)
+        discarded: list[str] = []
+        started: list[str] = []
+        jobs = [_job(name, started) for name in ("a", "b")]
+        for job in jobs:
+            job.discard = lambda name=job.submission_id: discarded.append(name)
+        queue.submit_many(jobs)
+        await queue.stop()
+        assert started == []
+        assert sorted(discarded) == ["a", "b"]
+
+    asyncio.run(scenario())
+
+
+def test_queue_full_maps_to_429_with_retry_after():
+    from api.evaluate import _queue_full_exception
+
+    exc = _queue_full_exception(QueueFullError(7))
+    assert exc.status_code == 429
+    assert exc.headers == {"Retry-After": "7"}
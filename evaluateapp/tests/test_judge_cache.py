@@ -0,0 +1,64 @@
+import hashlib
+import json
+import zipfile
+
+import pytest
+
+from services.judge_cache import JudgeCache, UnknownJudgeHashError
+from services.resource_profile import ResourceProfileError
+
+
+def _judge_zip(tmp_path, name: str, files: dict[str, str]) -> tuple[str, str]:
+    """写出一个评测包 ZIP，返回 (路径, 内容的 SHA-256)。"""
+    path = tmp_path / f"{name}.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        for member, content in files.items():
+            zf.writestr(member, content)
+    return str(path), hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_packages_are_keyed_by_content_hash(tmp_path):
+    cache = JudgeCache(tmp_path / "cache", max_bytes=1 << 20)
+    zip_path, judge_hash = _judge_zip(tmp_path, "judge", {"evaluate.py": "def evaluate(): pass\n"})
+    with cache.put_archive(judge_hash, zip_path) as lease:
+        assert lease.path == tmp_path / "cache" / judge_hash
+        assert (lease.path / "evaluate.py").read_text() == "def evaluate(): pass\n"
+    # 已缓存的哈希不再解压：上传文件是否还在无关紧要
+    with cache.put_archive(judge_hash, tmp_path / "missing.zip") as lease:
+        assert lease.path == tmp_path / "cache" / judge_hash
+    assert cache.contains(judge_hash)
+    with pytest.raises(UnknownJudgeHashError):
+        cache.lease("0" * 64)
+    with pytest.raises(ValueError):
+        cache.put_archive("not-a-hash", zip_path)
+    # 重启后按目录名恢复索引
+    assert JudgeCache(tmp_path / "cache", max_bytes=1 << 20).contains(judge_hash)
+
+
+def test_leased_packages_are_evicted_only_after_release(tmp_path):
+    first_zip, first = _judge_zip(tmp_path, "first", {"data.bin": "x" * 4000})
+    second_zip, second = _judge_zip(tmp_path, "second", {"data.bin": "y" * 4000})
+    cache = JudgeCache(tmp_path / "cache", max_bytes=6000)
+    first_lease = cache.put_archive(first, first_zip)
+    second_lease = cache.put_archive(second, second_zip)
+    # 超出上限，但两个条目都被引用：都不淘汰
+    assert cache.total_bytes == 8000
+    assert first_lease.path.is_dir() and second_lease.path.is_dir()
+    first_lease.release()
+    # 释放后最久未使用的条目被淘汰，仍被引用的条目保留
+    assert not cache.contains(first)
+    assert not first_lease.path.exists()
+    assert cache.contains(second) and second_lease.path.is_dir()
+    first_lease.release()
+    assert cache.total_bytes == 4000
+    second_lease.release()
+    assert cache.contains(second)
+
+
+def test_invalid_resources_json_is_not_cached(tmp_path):
+    cache = JudgeCache(tmp_path / "cache", max_bytes=1 << 20)
+    zip_path, judge_hash = _judge_zip(tmp_path, "judge", {"resources.json": json.dumps({"threads": 0})})
+    with pytest.raises(ResourceProfileError):
+        cache.put_archive(judge_hash, zip_path)
+    assert not cache.contains(judge_hash)
+    assert list((tmp_path / "cache").iterdir()) == []
@@ -0,0 +1,139 @@
+import asyncio
+import contextlib
+import time
+
+from services import outbox as outbox_module
+from services.outbox import ResultOutbox
+
+URL = "http://webapp/api/submissions/callback"
+
+
+def _outbox(tmp_path, **kwargs) -> ResultOutbox:
+    options = {"replay_interval": 3600, "retention": 3600, "max_attempts": 3}
+    options.update(kwargs)
+    return ResultOutbox(str(tmp_path / "outbox.sqlite3"), **options)
+
+
+async def _start(outbox: ResultOutbox) -> ResultOutbox:
+    """打开 outbox 并停掉后台重放循环，由测试自己调用 replay_once()。"""
+    await outbox.start()
+    outbox._replay_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await outbox._replay_task
+    outbox._replay_task = None
+    return outbox
+
+
+def _result(score: float = 1.0) -> dict:
+    return {"status": "COMPLETED", "score": score, "logs": ""}
+
+
+def _counts(outbox: ResultOutbox) -> tuple[int, int]:
+    """直接查询数据库，用于核对内存中的计数。"""
+    total, delivered = outbox._execute("SELECT COUNT(*), COUNT(delivered_at) FROM results")[0]
+    return total, total - delivered
+
+
+class _Dispatcher:
+    def __init__(self, outcomes: dict[str, bool]):
+        self.outcomes = outcomes
+        self.sent: list[tuple[str, dict, str]] = []
+
+    async def send(self, submission_id: str, result: dict, callback_url: str) -> bool:
+        self.sent.append((submission_id, result, callback_url))
+        return self.outcomes.get(submission_id, True)
+
+
+def test_record_settle_and_get(tmp_path):
+    async def scenario():
+        outbox = await _start(_outbox(tmp_path))
+        try:
+            await outbox.record([("a", _result(0.5)), ("b", _result())], URL)
+            await outbox.settle(["a"], URL, delivered=True)
+            await outbox.settle(["b"], URL, delivered=False)
+            entry = await outbox.get("a")
+            assert entry["delivered"] is True
+            assert entry["result"] == _result(0.5)
+            assert entry["callbacks"][0]["attempts"] == 1
+            assert (await outbox.get("b"))["delivered"] is False
+            assert await outbox.get("missing") is None
+            status = outbox.status()
+            assert (status["entries"], status["undelivered"]) == (2, 1) == _counts(outbox)
+        finally:
+            await outbox.stop()
+
+    asyncio.run(scenario())
+
+
+def test_status_counters_follow_rerecord_prune_and_restart(tmp_path):
+    async def scenario():
+        outbox = await _start(_outbox(tmp_path))
+        await outbox.record([("a", _result()), ("b", _result())], URL)
+        await outbox.settle(["a", "b"], URL, delivered=True)
+        # 重新评测后覆盖已投递的结果：重新变为未投递
+        await outbox.record([("a", _result(0.0))], URL)
+        # 重复确认投递成功不会重复扣减
+        await outbox.settle(["b"], URL, delivered=True)
+        assert (outbox.entries, outbox.undelivered) == (2, 1) == _counts(outbox)
+        removed = await outbox_module.blocking_pool.run("outbox", outbox._prune, time.time() + 1)
+        assert removed == 2
+        assert (outbox.entries, outbox.undelivered) == (0, 0) == _counts(outbox)
+        await outbox.record([("c", _result())], URL)
+        await outbox.stop()
+
+        reopened = await _start(_outbox(tmp_path))
+        try:
+            assert (reopened.entries, reopened.undelivered) == (1, 1)
+        finally:
+            await reopened.stop()
+
+    asyncio.run(scenario())
+
+
+def test_replay_delivers_undelivered_results_until_max_attempts(tmp_path, monkeypatch):
+    async def scenario():
+        dispatcher = _Dispatcher({"rejected": False})
+        monkeypatch.setattr(outbox_module, "callback_dispatcher", dispatcher)
+        outbox = await _start(_outbox(tmp_path, max_attempts=2))
+        try:
+            await outbox.record([("ok", _result()), ("rejected", _result(0.0)), ("done", _result())], URL)
+            await outbox.settle(["ok", "rejected"], URL, delivered=False)
+            await outbox.settle(["done"], URL, delivered=True)
+
+            delivered = await outbox.replay_once()
+            assert delivered == 1
+            assert sorted(submission_id for submission_id, _, _ in dispatcher.sent) == ["ok", "rejected"]
+            assert ("ok", _result(), URL) in dispatcher.sent
+            assert (await outbox.get("ok"))["delivered"] is True
+
+            # rejected 已尝试 max_attempts 次，不再重放，但仍可拉取
+            dispatcher.sent.clear()
+            delivered = await outbox.replay_once()
+            assert delivered == 0
+            assert dispatcher.sent == []
+            assert (await outbox.get("rejected"))["callbacks"][0]["attempts"] == 2
+            assert outbox.status()["undelivered"] == 1 == _counts(outbox)[1]
+        finally:
+            await outbox.stop()
+
+    asyncio.run(scenario())
+
+
+def test_replay_skips_results_whose_first_delivery_is_in_flight(tmp_path, monkeypatch):
+    async def scenario():
+        dispatcher = _Dispatcher({})
+        monkeypatch.setattr(outbox_module, "callback_dispatcher", dispatcher)
+        outbox = await _start(_outbox(tmp_path))
+        try:
+            # record 之后、settle 之前即首次回调进行中
+            await outbox.record([("a", _result())], URL)
+            delivered = await outbox.replay_once()
+            assert delivered == 0
+            assert dispatcher.sent == []
+            await outbox.settle(["a"], URL, delivered=False)
+            delivered = await outbox.replay_once()
+            assert delivered == 1
+        finally:
+            await outbox.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import pytest
+
+from services.resource_profile import PROFILE_FILENAME, ResourceProfile, ResourceProfileError, read_profile
+
+
+def test_from_dict_converts_units():
+    profile = ResourceProfile.from_dict({"cpuTimeSeconds": 60, "wallTimeSeconds": 90.5, "memoryMB": 512, "threads": 2})
+    assert profile == ResourceProfile(cpu_time_seconds=60, wall_time_seconds=90.5, memory_bytes=512 * 1024 * 1024, threads=2)
+    assert ResourceProfile.from_dict({"diskMB": None}) == ResourceProfile()
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"threads": 0},
+        {"memoryMB": -1},
+        {"cpuTimeSeconds": "abc"},
+        {"image": ""},
+        {"gpus": 1},
+    ],
+)
+def test_from_dict_rejects_invalid_values(data):
+    with pytest.raises(ResourceProfileError):
+        ResourceProfile.from_dict(data)
+
+
+@pytest.mark.parametrize("key", ["cpuTimeSeconds", "wallTimeSeconds", "memoryMB", "threads", "diskMB"])
+@pytest.mark.parametrize("literal", ["Infinity", "-Infinity", "NaN", "1e400"])
+def test_non_finite_numbers_are_rejected(tmp_path, key, literal):
+    # json.loads 接受 Infinity / NaN 与超出范围的指数，它们应作为 400 而不是 500 报告
+    (tmp_path / PROFILE_FILENAME).write_text(f'{{"{key}": {literal}}}', encoding="utf-8")
+    with pytest.raises(ResourceProfileError):
+        read_profile(tmp_path)
+
+
+def test_huge_memory_overflowing_bytes_is_rejected():
+    with pytest.raises(ResourceProfileError):
+        ResourceProfile.from_dict({"memoryMB": 1e308})
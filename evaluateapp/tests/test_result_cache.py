@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from services import result_cache as result_cache_module
+from services.result_cache import ResultCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(result_cache_module.time, "monotonic", clock)
+    return clock
+
+
+def _result(logs: str = "") -> dict:
+    return {"status": "COMPLETED", "score": 1.0, "logs": logs}
+
+
+def _size(result: dict) -> int:
+    return len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = ResultCache(max_bytes=1024, ttl=60)
+    cache.put("a", _result())
+    clock.now += 59.9
+    assert cache.get("a") == _result()
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.total_bytes == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_reading_an_entry_does_not_extend_its_ttl(clock):
+    cache = ResultCache(max_bytes=1024, ttl=60)
+    cache.put("a", _result())
+    clock.now += 50
+    assert cache.get("a") is not None
+    clock.now += 10
+    assert cache.get("a") is None
+
+
+def test_eviction_drops_least_recently_used_until_under_max_bytes(clock):
+    entry = _size(_result("x"))
+    cache = ResultCache(max_bytes=3 * entry, ttl=60)
+    for key in ("a", "b", "c"):
+        cache.put(key, _result("x"))
+    # a 最近被读取，b 成为最久未使用的条目
+    assert cache.get("a") is not None
+    cache.put("d", _result("x"))
+    assert cache.get("b") is None
+    assert [key for key in ("a", "c", "d") if cache.get(key) is not None] == ["a", "c", "d"]
+    assert cache.total_bytes == 3 * entry
+    assert cache.evictions == 1
+
+
+def test_large_entry_evicts_as_many_entries_as_needed(clock):
+    small = _size(_result("x"))
+    cache = ResultCache(max_bytes=4 * small, ttl=60)
+    for key in ("a", "b", "c", "d"):
+        cache.put(key, _result("x"))
+    big = _result("x" * (2 * small))
+    cache.put("big", big)
+    assert cache.total_bytes <= cache.max_bytes
+    assert cache.get("a") is None and cache.get("b") is None and cache.get("c") is None
+    assert cache.get("d") is not None and cache.get("big") == big
+    assert cache.evictions == 3
+
+
+def test_entry_larger_than_max_bytes_is_not_cached(clock):
+    cache = ResultCache(max_bytes=64, ttl=60)
+    cache.put("a", _result())
+    cache.put("huge", _result("x" * 100))
+    assert cache.get("huge") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 0
+
+
+def test_replacing_a_key_accounts_bytes_once(clock):
+    cache = ResultCache(max_bytes=1024, ttl=60)
+    cache.put("a", _result("short"))
+    cache.put("a", _result("a longer log"))
+    assert len(cache) == 1
+    assert cache.total_bytes == _size(_result("a longer log"))
+
+
+def test_only_completed_results_are_cached_without_stages(clock):
+    cache = ResultCache(max_bytes=1024, ttl=60)
+    cache.put("error", {"status": "ERROR", "score": 0.0, "logs": "timeout"})
+    cache.put("ok", {**_result(), "stages": {"run": 1.0}, "cached": True})
+    assert cache.get("error") is None
+    assert cache.get("ok") == _result()
+
+
+def test_get_returns_an_independent_copy(clock):
+    cache = ResultCache(max_bytes=1024, ttl=60)
+    cache.put("a", _result())
+    cache.get("a")["score"] = 0.0
+    assert cache.get("a")["score"] == 1.0
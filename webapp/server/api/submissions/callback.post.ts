@@ -25,6 +25,65 @@ const callbackSchema = z.object({
   logs: z.string().optional(),
 })
 
+// 批量回调（评测端 aggregate_callback 或 CALLBACK_BATCH_SIZE > 1 时）：{ results: [...] }，每一项与单条回调格式相同
+const batchCallbackSchema = z.object({
+  results: z.array(callbackSchema).min(1, "字段 'results' 不能为空。"),
+})
+
+type CallbackResult = z.infer<typeof callbackSchema>
+
+function invalidBody(error: z.ZodError) {
+  return createError({
+    statusCode: 400,
+    statusMessage: '无效的请求体',
+    data: error.issues.map(issue => ({
+      field: issue.path.join('.'),
+      message: issue.message,
+    })),
+  })
+}
+
+function canonicalize(obj: any): string {
+  if (obj === null || typeof obj !== 'object') return JSON.stringify(obj)
+  if (Array.isArray(obj)) return '[' + obj.map(canonicalize).join(',') + ']'
+  const keys = Object.keys(obj).sort()
+  return '{' + keys.map(k => JSON.stringify(k) + ':' + canonicalize(obj[k])).join(',') + '}'
+}
+
+// 每个提交的候选密钥：优先提交关联节点，其次所有激活节点，最后环境变量回退
+async function candidateSecretsBySubmission(submissionIds: string[], fallbackSecret?: string): Promise<Map<string, string[]>> {
+  const submissions = await prisma.submission.findMany({
+    where: { id: { in: submissionIds } },
+    select: { id: true, evaluateNodeId: true },
+  })
+  const nodeIdBySubmission = new Map(submissions.map(s => [s.id, s.evaluateNodeId]))
+  const nodeIds = [...new Set(submissions.map(s => s.evaluateNodeId).filter((id): id is string => !!id))]
+  const nodes = nodeIds.length
+    ? await prisma.evaluateNode.findMany({ where: { id: { in: nodeIds } }, select: { id: true, sharedSecret: true } })
+    : []
+  const secretByNode = new Map(nodes.map(n => [n.id, n.sharedSecret]))
+
+  let activeSecrets: string[] | null = null
+  const result = new Map<string, string[]>()
+  for (const submissionId of submissionIds) {
+    const candidates: string[] = []
+    const nodeId = nodeIdBySubmission.get(submissionId)
+    if (nodeId) {
+      const secret = secretByNode.get(nodeId)
+      if (secret) candidates.push(secret)
+    } else {
+      if (activeSecrets === null) {
+        const activeNodes = await prisma.evaluateNode.findMany({ where: { active: true }, select: { sharedSecret: true } })
+        activeSecrets = activeNodes.map(n => n.sharedSecret).filter((secret): secret is string => !!secret)
+      }
+      candidates.push(...activeSecrets)
+    }
+    if (fallbackSecret) candidates.push(fallbackSecret)
+    result.set(submissionId, candidates)
+  }
+  return result
+}
+
 // ...排行榜更新函数（保持不变）...
 async function updateLeaderboardScore(competitionId: string, teamId: string, problemId: string, score: number, submissionId: string): Promise<void> {
   let leaderboard = await prisma.leaderboard.findUnique({ where: { competitionId } });
@@ -87,72 +146,8 @@ async function recalculateRanks(leaderboardId: string): Promise<void> {
 }
 
 
-export default defineEventHandler(async (event) => {
-  const config = useRuntimeConfig(event)
-
-  // 1. 验证签名头
-  const tsHeader = getHeader(event, 'x-timestamp')
-  const signHeader = getHeader(event, 'x-sign')
-  const providedContentHash = getHeader(event, 'x-content-hash')
-  if (!tsHeader || !signHeader) {
-    throw createError({ statusCode: 401, statusMessage: 'Unauthorized: Missing signature headers' })
-  }
-  const tsNum = parseInt(tsHeader)
-  if (!tsNum || Math.abs(Date.now() / 1000 - tsNum) > 600) {
-    throw createError({ statusCode: 401, statusMessage: 'Unauthorized: Signature expired' })
-  }
-
-  // 2. 解析和验证请求体
-  const body = await readBody(event)
-  const validation = callbackSchema.safeParse(body)
-
-  if (!validation.success) {
-    throw createError({
-      statusCode: 400,
-      statusMessage: '无效的请求体',
-      data: validation.error.issues.map(issue => ({
-        field: issue.path.join('.'),
-        message: issue.message,
-      })),
-    })
-  }
-
-  const { submissionId, status, score, logs } = validation.data
-
-  // 2.1 获取内容哈希：优先使用客户端提供的 X-Content-Hash，兼容不同语言的浮点格式差异
-  let contentHash = providedContentHash || ''
-  if (!contentHash) {
-    function canonicalize(obj: any): string {
-      if (obj === null || typeof obj !== 'object') return JSON.stringify(obj)
-      if (Array.isArray(obj)) return '[' + obj.map(canonicalize).join(',') + ']'
-      const keys = Object.keys(obj).sort()
-      return '{' + keys.map(k => JSON.stringify(k) + ':' + canonicalize(obj[k])).join(',') + '}'
-    }
-    const payloadStr = canonicalize({ submissionId, status, score, logs })
-    contentHash = crypto.createHash('sha256').update(payloadStr).digest('hex')
-  }
-
-  // 2.2 获取候选密钥：优先提交关联节点，其次所有激活节点，最后环境变量回退
-  const candidateSecrets: string[] = []
-  const submissionRecord = await prisma.submission.findUnique({ where: { id: submissionId }, select: { evaluateNodeId: true } })
-  if (submissionRecord?.evaluateNodeId) {
-    const node = await prisma.evaluateNode.findUnique({ where: { id: submissionRecord.evaluateNodeId }, select: { sharedSecret: true } })
-    if (node?.sharedSecret) candidateSecrets.push(node.sharedSecret)
-  } else {
-    const nodes = await prisma.evaluateNode.findMany({ where: { active: true }, select: { sharedSecret: true } })
-    for (const n of nodes) if (n.sharedSecret) candidateSecrets.push(n.sharedSecret)
-  }
-  if ((config as any).evaluateAppSecret) candidateSecrets.push((config as any).evaluateAppSecret as string)
-
-  const valid = candidateSecrets.some(secret => {
-    const expected = crypto.createHmac('sha256', secret).update(`${tsHeader}\n${contentHash}`).digest('hex')
-    return expected === signHeader
-  })
-  if (!valid) {
-    throw createError({ statusCode: 401, statusMessage: 'Unauthorized: Invalid signature' })
-  }
-
-  // 3. 更新数据库
+// 写入一条评测结果并更新排行榜
+async function applyResult({ submissionId, status, score, logs }: CallbackResult) {
   try {
     // 签名通过，无需回填节点（如需，也可通过 submission.evaluateNodeId 已有记录）
 
@@ -201,4 +196,67 @@ export default defineEventHandler(async (event) => {
       statusMessage: '处理回调时发生内部数据库错误',
     })
   }
+}
+
+export default defineEventHandler(async (event) => {
+  const config = useRuntimeConfig(event)
+
+  // 1. 验证签名头
+  const tsHeader = getHeader(event, 'x-timestamp')
+  const signHeader = getHeader(event, 'x-sign')
+  const providedContentHash = getHeader(event, 'x-content-hash')
+  if (!tsHeader || !signHeader) {
+    throw createError({ statusCode: 401, statusMessage: 'Unauthorized: Missing signature headers' })
+  }
+  const tsNum = parseInt(tsHeader)
+  if (!tsNum || Math.abs(Date.now() / 1000 - tsNum) > 600) {
+    throw createError({ statusCode: 401, statusMessage: 'Unauthorized: Signature expired' })
+  }
+
+  // 2. 解析和验证请求体（单条结果或 { results: [...] } 批量结果）
+  const body = await readBody(event)
+  const isBatch = !!body && typeof body === 'object' && 'results' in body
+  let results: CallbackResult[]
+  if (isBatch) {
+    const validation = batchCallbackSchema.safeParse(body)
+    if (!validation.success) throw invalidBody(validation.error)
+    results = validation.data.results
+  } else {
+    const validation = callbackSchema.safeParse(body)
+    if (!validation.success) throw invalidBody(validation.error)
+    results = [validation.data]
+  }
+
+  // 2.1 获取内容哈希：优先使用客户端提供的 X-Content-Hash，兼容不同语言的浮点格式差异
+  let contentHash = providedContentHash || ''
+  if (!contentHash) {
+    const fields = ({ submissionId, status, score, logs }: CallbackResult) => ({ submissionId, status, score, logs })
+    const payloadStr = canonicalize(isBatch ? { results: results.map(fields) } : fields(results[0]))
+    contentHash = crypto.createHash('sha256').update(payloadStr).digest('hex')
+  }
+
+  // 2.2 验签：批量回调中的每个提交都必须能用它自己的候选密钥验证通过
+  const secretsBySubmission = await candidateSecretsBySubmission(
+    [...new Set(results.map(r => r.submissionId))],
+    (config as any).evaluateAppSecret as string | undefined,
+  )
+  for (const { submissionId } of results) {
+    const valid = (secretsBySubmission.get(submissionId) || []).some(secret => {
+      const expected = crypto.createHmac('sha256', secret).update(`${tsHeader}\n${contentHash}`).digest('hex')
+      return expected === signHeader
+    })
+    if (!valid) {
+      throw createError({ statusCode: 401, statusMessage: 'Unauthorized: Invalid signature' })
+    }
+  }
+
+  // 3. 更新数据库
+  if (!isBatch) {
+    return await applyResult(results[0])
+  }
+  const outcomes = []
+  for (const result of results) {
+    outcomes.push(await applyResult(result))
+  }
+  return { success: true, results: outcomes }
 })